@@ -0,0 +1,189 @@
+# backend/benchmarks/fake_discogs.py
+"""
+Local stand-in for the Discogs API and image CDN, for benchmarks.
+
+Two threaded HTTP servers on 127.0.0.1:
+- API:  GET /releases/<id>  -> release JSON (images, tracklist) with
+        X-Discogs-Ratelimit headers; ETag/If-None-Match -> 304
+- CDN:  GET /img/<id>-front.jpg, /img/<id>-back.jpg -> a small JPEG that is
+        unique per release (so content-addressed storage cannot dedupe it)
+
+They use separate ports because the Discogs client only rate limits the
+API host, exactly like api.discogs.com vs i.discogs.com.
+
+Knobs:
+- latency_ms:     added to every response
+- throttle_every: every Nth API request answers 429 with Retry-After
+- ratelimit:      advertised X-Discogs-Ratelimit (requests/minute)
+
+Point the backend at it with DISCOGS_API_BASE=<server.api_base> before the
+backend modules are imported.
+
+Usage (standalone):
+  python3 benchmarks/fake_discogs.py --latency-ms 80 --throttle-every 50
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - depends on environment
+    Image = None
+
+_RELEASE_RE = re.compile(r"^/releases/(\d+)$")
+_IMAGE_RE = re.compile(r"^/img/(\d+)-(front|back)\.jpg$")
+
+
+def _base_jpeg() -> bytes:
+    if Image is None:
+        # Minimal JFIF header; enough for content-type sniffing, not decoding
+        return b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00\xff\xd9"
+    buf = io.BytesIO()
+    Image.new("RGB", (600, 600), (90, 120, 150)).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+class FakeDiscogs:
+    def __init__(self, latency_ms: float = 0.0, throttle_every: int = 0, ratelimit: int = 6000,
+                 host: str = "127.0.0.1", api_port: int = 0, cdn_port: int = 0):
+        self.latency = latency_ms / 1000.0
+        self.throttle_every = throttle_every
+        self.ratelimit = ratelimit
+        self.jpeg = _base_jpeg()
+        self.counts = {"api": 0, "cdn": 0, "throttled": 0, "not_modified": 0}
+        self._lock = threading.Lock()
+        self.api = ThreadingHTTPServer((host, api_port), self._handler(self._api))
+        self.cdn = ThreadingHTTPServer((host, cdn_port), self._handler(self._cdn))
+        for server in (self.api, self.cdn):
+            server.daemon_threads = True
+        self._threads = []
+
+    @property
+    def api_base(self) -> str:
+        return "http://%s:%d" % self.api.server_address[:2]
+
+    @property
+    def cdn_base(self) -> str:
+        return "http://%s:%d" % self.cdn.server_address[:2]
+
+    def start(self) -> "FakeDiscogs":
+        for server in (self.api, self.cdn):
+            t = threading.Thread(target=server.serve_forever, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self) -> None:
+        for server in (self.api, self.cdn):
+            server.shutdown()
+            server.server_close()
+
+    def __enter__(self) -> "FakeDiscogs":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # ------------------------------ Handlers ------------------------------
+
+    def _handler(self, route):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+            def do_GET(self):
+                route(self)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _send(self, h: BaseHTTPRequestHandler, status: int, body: bytes = b"",
+              ctype: str = "application/json", headers: Optional[dict] = None) -> None:
+        h.send_response(status)
+        h.send_header("Content-Type", ctype)
+        h.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            h.send_header(k, v)
+        h.end_headers()
+        h.wfile.write(body)
+
+    def _api(self, h: BaseHTTPRequestHandler) -> None:
+        time.sleep(self.latency)
+        with self._lock:
+            self.counts["api"] += 1
+            n = self.counts["api"]
+        rate_headers = {"X-Discogs-Ratelimit": str(self.ratelimit),
+                        "X-Discogs-Ratelimit-Remaining": str(self.ratelimit - 1)}
+        if self.throttle_every and n % self.throttle_every == 0:
+            with self._lock:
+                self.counts["throttled"] += 1
+            self._send(h, 429, b'{"message": "You are making requests too quickly."}',
+                       headers={"Retry-After": "1", **rate_headers})
+            return
+
+        m = _RELEASE_RE.match(h.path.split("?", 1)[0])
+        if not m:
+            self._send(h, 404, b'{"message": "The requested resource was not found."}')
+            return
+        rid = int(m.group(1))
+        etag = f'"r{rid}"'
+        if h.headers.get("If-None-Match") == etag:
+            with self._lock:
+                self.counts["not_modified"] += 1
+            self._send(h, 304, headers={"ETag": etag, **rate_headers})
+            return
+        payload = {
+            "id": rid,
+            "title": f"Release {rid}",
+            "images": [
+                {"type": "primary", "uri": f"{self.cdn_base}/img/{rid}-front.jpg"},
+                {"type": "secondary", "uri": f"{self.cdn_base}/img/{rid}-back.jpg"},
+            ],
+            "tracklist": [{"position": f"A{i}", "title": f"Track {i}"} for i in range(1, 9)],
+        }
+        self._send(h, 200, json.dumps(payload).encode("utf-8"), headers={"ETag": etag, **rate_headers})
+
+    def _cdn(self, h: BaseHTTPRequestHandler) -> None:
+        time.sleep(self.latency)
+        with self._lock:
+            self.counts["cdn"] += 1
+        m = _IMAGE_RE.match(h.path)
+        if not m:
+            self._send(h, 404, b"")
+            return
+        # Bytes after EOI are ignored by decoders but make each image unique
+        body = self.jpeg + f"{m.group(1)}-{m.group(2)}".encode("ascii")
+        self._send(h, 200, body, ctype="image/jpeg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Discogs API + image CDN")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every Nth API request with 429")
+    parser.add_argument("--ratelimit", type=int, default=6000, help="Advertised requests per minute")
+    parser.add_argument("--api-port", type=int, default=8901)
+    parser.add_argument("--cdn-port", type=int, default=8902)
+    args = parser.parse_args()
+
+    server = FakeDiscogs(args.latency_ms, args.throttle_every, args.ratelimit,
+                         api_port=args.api_port, cdn_port=args.cdn_port).start()
+    print(f"[INFO] Fake Discogs API at {server.api_base}, CDN at {server.cdn_base}")
+    print(f"[INFO] export DISCOGS_API_BASE={server.api_base}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# backend/benchmarks/gen_collection.py
+"""
+Synthetic collection.json generator for benchmarks.
+
+Albums look like the importer's output before images are cached: a Discogs
+release id, artist/title, genre/label/year and date_added, no image fields.
+Output is deterministic for a given size and seed, so runs are comparable.
+
+Usage:
+  python3 benchmarks/gen_collection.py 10000 -o /tmp/collection.json
+  python3 benchmarks/gen_collection.py 100000 --shape records -o /tmp/big.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+from datetime import date, timedelta
+from typing import Dict, List
+
+GENRES = ["Rock", "Jazz", "Electronic", "Hip Hop", "Funk / Soul", "Classical", "Pop", "Reggae", "Blues", "Folk"]
+LABELS = [f"Label {i}" for i in range(200)]
+WORDS = ["blue", "night", "city", "river", "echo", "gold", "silent", "fire", "dream", "north",
+         "glass", "velvet", "storm", "garden", "signal", "paper", "neon", "stone", "wild", "static"]
+
+FIRST_RELEASE_ID = 1_000_000
+
+
+def _phrase(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS).capitalize() for _ in range(words))
+
+
+def generate(n: int, seed: int = 1) -> List[Dict]:
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    albums = []
+    for i in range(n):
+        year = rng.randint(1955, 2024)
+        albums.append({
+            "id": FIRST_RELEASE_ID + i,
+            "artist": _phrase(rng, rng.randint(1, 3)),
+            "title": _phrase(rng, rng.randint(1, 4)),
+            "genre": rng.sample(GENRES, rng.randint(1, 2)),
+            "label": rng.choice(LABELS),
+            "year": year,
+            "date_added": (start + timedelta(days=rng.randint(0, 3650))).isoformat(),
+        })
+    return albums
+
+
+def write(path: str, n: int, seed: int = 1, shape: str = "list") -> None:
+    albums = generate(n, seed)
+    doc = albums if shape == "list" else {shape: albums}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic collection.json")
+    parser.add_argument("size", type=int, help="Number of albums (e.g. 1000, 10000, 100000)")
+    parser.add_argument("-o", "--out", default="collection.json", help="Output path (default ./collection.json)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--shape", choices=["list", "records", "collection", "items"], default="list",
+                        help="Bare list, or a dict with this key holding the albums")
+    args = parser.parse_args()
+    write(args.out, args.size, args.seed, args.shape)
+    print(f"[OK] Wrote {args.size} album(s) -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+# backend/benchmarks/run_benchmarks.py
+"""
+Benchmarks for the API, the image cache and the importer, against a local
+fake Discogs (fake_discogs.py) and synthetic collections (gen_collection.py).
+
+Measures:
+- api_collection: /api/collection cold (parse + snapshot) and warm latency,
+  gzip, 304 revalidation, the streamed NDJSON export, and peak Python heap
+  (tracemalloc) for the cold load and the stream, per collection size
+- covers: cold and warm /cover/<id> latency and throughput with N concurrent
+  clients against a real threaded HTTP server
+- importer: wall time of collection_importer.py, cold (everything fetched)
+  and warm (everything cached)
+
+Everything runs in a temp directory; the real collection.json, images/ and
+releases/ are never touched. Results are written as JSON (with git revision
+and settings) so two runs can be diffed with --compare.
+
+Usage:
+  python3 benchmarks/run_benchmarks.py
+  python3 benchmarks/run_benchmarks.py --sizes 1000,10000,100000 --latency-ms 80 -o after.json
+  python3 benchmarks/run_benchmarks.py --compare before.json after.json
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(HERE)
+# Backend modules use flat imports (e.g. `from image_cache import ...`)
+sys.path.insert(0, BACKEND)
+
+import gen_collection  # noqa: E402
+from fake_discogs import FakeDiscogs  # noqa: E402
+
+WARM_REQUESTS = 50
+
+
+# ------------------------------- Helpers -------------------------------
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000.0, 3)
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds."""
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return _ms(ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))])
+
+    return {"n": len(ordered), "mean_ms": _ms(statistics.fmean(ordered)),
+            "p50_ms": pct(50), "p95_ms": pct(95), "max_ms": _ms(ordered[-1])}
+
+
+def _timed(fn: Callable[[], object]) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def _peak_heap(fn: Callable[[], object]) -> int:
+    """Peak traced Python heap (bytes) while running fn."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _git_revision() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Backend:
+    """
+    The backend modules, imported after DISCOGS_API_BASE points at the fake
+    server, with every on-disk location redirected into a sandbox directory
+    (the same attributes the tests monkeypatch).
+    """
+
+    def __init__(self):
+        import collection_changes
+        import collection_db
+        import collection_importer
+        import collection_snapshot
+        import image_cache
+        import main
+        import prefetch
+        import release_cache
+        from image_budget import DiskBudget
+        from image_index import ImageIndex
+        from negative_cache import NegativeCache
+
+        self.changes = collection_changes
+        self.db = collection_db
+        self.importer = collection_importer
+        self.snapshot = collection_snapshot
+        self.image_cache = image_cache
+        self.main = main
+        self.prefetch = prefetch
+        self.release_cache = release_cache
+        self._DiskBudget = DiskBudget
+        self._ImageIndex = ImageIndex
+        self._NegativeCache = NegativeCache
+
+    def sandbox(self, root: str) -> str:
+        """Fresh collection/images/releases under `root`; returns the collection path."""
+        images = os.path.join(root, "images")
+        os.makedirs(images, exist_ok=True)
+        collection = os.path.join(root, "collection.json")
+        for mod in (self.snapshot, self.main, self.importer, self.changes):
+            mod.COLLECTION_PATH = collection
+        self.changes.CHANGES_PATH = os.path.join(root, "collection_changes.json")
+        self.changes.HASHES_PATH = os.path.join(root, "collection_hashes.json")
+        self.importer.IMAGES_DIR = images
+        self.importer.IMPORT_METRICS_PATH = os.path.join(root, "import_metrics.ndjson")
+        self.main.IMAGES_DIR = images
+        self.image_cache.CACHE_DIR = images
+        self.image_cache.image_index = self._ImageIndex(images)
+        # Built at import time over the real images/: with IMAGE_CACHE_MAX_BYTES
+        # set it would evict real covers (only the sandbox ids are pinned)
+        self.image_cache.disk_budget = self._DiskBudget(
+            images, self.image_cache.image_index, pinned=self.main._pinned_release_ids)
+        self.image_cache.negative_cache = self._NegativeCache(os.path.join(images, "negative_cache.json"))
+        self.release_cache.RELEASES_DIR = os.path.join(root, "releases")
+        self.snapshot.SHARED_PATH = os.path.join(root, "collection.snapshot")
+        # The synthetic collections are JSON files, whatever COLLECTION_BACKEND says
+        self.db.USE_SQLITE = False
+        self.db.DB_PATH = os.path.join(root, "collection.db")
+        self.snapshot._current = None
+        return collection
+
+
+# ----------------------------- Benchmarks -----------------------------
+
+def bench_api_collection(backend: Backend, root: str, size: int) -> Dict:
+    collection = backend.sandbox(root)
+    gen_collection.write(collection, size)
+    client = backend.main.app.test_client()
+    # Keep background prefetching out of the API numbers
+    prefetch_enabled, backend.prefetch.ENABLED = backend.prefetch.ENABLED, False
+    try:
+        def cold():
+            # A rebuild, not a map of the file the previous call published
+            backend.snapshot._current = None
+            if os.path.exists(backend.snapshot.SHARED_PATH):
+                os.unlink(backend.snapshot.SHARED_PATH)
+            assert client.get("/api/collection").status_code == 200
+
+        cold_s = _timed(cold)
+        cold_peak = _peak_heap(cold)
+
+        warm = [_timed(lambda: client.get("/api/collection")) for _ in range(WARM_REQUESTS)]
+        gz_headers = {"Accept-Encoding": "gzip"}
+        gz_resp = client.get("/api/collection", headers=gz_headers)
+        warm_gzip = [_timed(lambda: client.get("/api/collection", headers=gz_headers)) for _ in range(WARM_REQUESTS)]
+        etag = client.get("/api/collection").headers["ETag"]
+        revalidate = [_timed(lambda: client.get("/api/collection", headers={"If-None-Match": etag}))
+                      for _ in range(WARM_REQUESTS)]
+
+        def stream():
+            t0 = time.perf_counter()
+            resp = client.get("/api/collection.ndjson", buffered=False)
+            first = None
+            nbytes = 0
+            for chunk in resp.response:
+                if first is None:
+                    first = time.perf_counter() - t0
+                nbytes += len(chunk)
+            resp.close()
+            return first or 0.0, time.perf_counter() - t0, nbytes
+
+        ttfb, stream_total, stream_bytes = stream()
+        stream_peak = _peak_heap(stream)
+
+        return {
+            "albums": size,
+            "file_bytes": os.path.getsize(collection),
+            "body_bytes": len(client.get("/api/collection").data),
+            "gzip_bytes": len(gz_resp.data),
+            "cold_ms": _ms(cold_s),
+            "cold_peak_heap_bytes": cold_peak,
+            "warm": _summary(warm),
+            "warm_gzip": _summary(warm_gzip),
+            "revalidate_304": _summary(revalidate),
+            "ndjson": {"ttfb_ms": _ms(ttfb), "total_ms": _ms(stream_total),
+                       "bytes": stream_bytes, "peak_heap_bytes": stream_peak},
+        }
+    finally:
+        backend.prefetch.ENABLED = prefetch_enabled
+
+
+def bench_covers(backend: Backend, root: str, count: int, concurrency: int) -> Dict:
+    import requests
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    collection = backend.sandbox(root)
+    gen_collection.write(collection, count)
+    ids = [gen_collection.FIRST_RELEASE_ID + i for i in range(count)]
+
+    server = make_server("127.0.0.1", 0, backend.main.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = "http://127.0.0.1:%d" % server.server_port
+    local = threading.local()
+
+    def fetch(rid: int):
+        session = getattr(local, "session", None) or requests.Session()
+        local.session = session
+        t0 = time.perf_counter()
+        resp = session.get(f"{base}/cover/{rid}", timeout=120)
+        elapsed = time.perf_counter() - t0
+        pending = "no-cache" in resp.headers.get("Cache-Control", "")
+        return elapsed, resp.status_code, pending
+
+    def phase() -> Dict:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fetch, ids))
+        wall = time.perf_counter() - t0
+        statuses: Dict[str, int] = {}
+        for _, status, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            "requests": len(results),
+            "wall_ms": _ms(wall),
+            "throughput_rps": round(len(results) / wall, 2) if wall else None,
+            "latency": _summary([r[0] for r in results]),
+            "status": statuses,
+            "fallback_pending": sum(1 for r in results if r[2]),
+        }
+
+    try:
+        cold = phase()
+        if backend.prefetch.ENABLED:
+            # Let the background queue finish before measuring the warm path
+            for rid in ids:
+                done = backend.prefetch.prefetcher.enqueue(rid, backend.prefetch.HIGH)
+                if done is not None:
+                    done.wait(120)
+        warm = phase()
+    finally:
+        server.shutdown()
+    return {"covers": count, "concurrency": concurrency, "prefetch": backend.prefetch.ENABLED,
+            "cold": cold, "warm": warm}
+
+
+def bench_importer(backend: Backend, root: str, count: int, workers: int) -> Dict:
+    collection = backend.sandbox(root)
+    gen_collection.write(collection, count)
+
+    def run(*argv: str) -> float:
+        old_argv = sys.argv
+        sys.argv = ["collection_importer.py", *argv]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                return _timed(backend.importer.main)
+        finally:
+            sys.argv = old_argv
+
+    cold = run("--workers", str(workers))
+    warm = run("--workers", str(workers))
+    warm_stream = run("--workers", str(workers), "--stream")
+    return {"albums": count, "workers": workers, "cold_ms": _ms(cold), "warm_ms": _ms(warm),
+            "warm_stream_ms": _ms(warm_stream)}
+
+
+# ------------------------------- Compare -------------------------------
+
+def _flatten(obj, prefix: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            out.update(_flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        out[prefix] = float(obj)
+    return out
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"[INFO] {old['meta'].get('git')} -> {new['meta'].get('git')}")
+    a, b = _flatten(old["results"]), _flatten(new["results"])
+    for key in sorted(set(a) | set(b)):
+        before, after = a.get(key), b.get(key)
+        if before is None or after is None:
+            print(f"{key:60} {before!s:>14} {after!s:>14}")
+            continue
+        delta = f"{(after - before) / before * 100.0:+.1f}%" if before else "n/a"
+        print(f"{key:60} {before:14.3f} {after:14.3f} {delta:>9}")
+
+
+# --------------------------------- Main ---------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API, image cache and importer against a fake Discogs")
+    parser.add_argument("--sizes", default="1000,10000", help="Collection sizes for /api/collection (default 1000,10000)")
+    parser.add_argument("--covers", type=int, default=200, help="Distinct releases for the /cover benchmark")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent /cover clients")
+    parser.add_argument("--importer-albums", type=int, default=200, help="Albums for the importer benchmark")
+    parser.add_argument("--workers", type=int, default=4, help="Importer --workers")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake Discogs latency per response")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Fake Discogs answers every Nth API call with 429")
+    parser.add_argument("--only", choices=["api", "covers", "importer"], action="append", help="Run only these (repeatable)")
+    parser.add_argument("-o", "--out", default="benchmark_results.json", help="Results JSON path")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Diff two results files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    fake = FakeDiscogs(latency_ms=args.latency_ms, throttle_every=args.throttle_every).start()
+    # Must be set before the backend (discogs_client) is imported
+    os.environ["DISCOGS_API_BASE"] = fake.api_base
+    backend = Backend()
+    only = set(args.only or ["api", "covers", "importer"])
+    results: Dict[str, Dict] = {}
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="record-bench-") as tmp:
+            if "api" in only:
+                results["api_collection"] = {}
+                for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+                    print(f"[INFO] /api/collection with {size} albums...")
+                    results["api_collection"][str(size)] = bench_api_collection(
+                        backend, os.path.join(tmp, f"api-{size}"), size)
+            if "covers" in only:
+                print(f"[INFO] /cover x{args.covers} with {args.concurrency} concurrent clients...")
+                results["covers"] = bench_covers(backend, os.path.join(tmp, "covers"), args.covers, args.concurrency)
+            if "importer" in only:
+                print(f"[INFO] Importer over {args.importer_albums} albums with {args.workers} worker(s)...")
+                results["importer"] = bench_importer(backend, os.path.join(tmp, "importer"),
+                                                     args.importer_albums, args.workers)
+    finally:
+        fake.stop()
+
+    output = {
+        "meta": {
+            "git": _git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+            "fake_discogs": dict(fake.counts),
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"[OK] Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# backend/collection_changes.py
+"""
+Version counter and change log for the collection, so clients can sync
+incrementally instead of re-downloading everything.
+
+Writers (collection_importer.py, fetch_tracklists.py, collection_sync.py)
+call record_store() after they write. It hashes every album in the current
+store (collection.json or SQLite), diffs against the hashes from the last
+call, and if anything changed bumps the version and appends one entry:
+
+  {"version": 7, "at": "2024-05-01T03:00:12", "added": [..ids..],
+   "removed": [..ids..], "modified": [..ids..]}
+
+The log keeps the last COLLECTION_CHANGES_MAX entries; older ones are
+compacted away and `oldest` moves forward. Clients holding a version older
+than that get a reset (re-download the collection) from changes_since().
+
+Files (next to collection.json):
+  collection_changes.json   version, oldest, entries (read by the web server)
+  collection_hashes.json    album id -> content hash (writers only)
+
+The first call records a baseline (version 1) without an entry.
+"""
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from collection_stream import open_album_stream
+
+HERE = os.path.dirname(__file__)
+COLLECTION_PATH = os.path.join(HERE, "collection.json")
+CHANGES_PATH = os.environ.get("COLLECTION_CHANGES", os.path.join(HERE, "collection_changes.json"))
+HASHES_PATH = os.environ.get("COLLECTION_HASHES", os.path.join(HERE, "collection_hashes.json"))
+MAX_ENTRIES = int(os.environ.get("COLLECTION_CHANGES_MAX", "500"))
+
+EMPTY_LOG = {"version": 0, "oldest": 0, "entries": []}
+
+
+def album_key(album: Dict) -> Optional[str]:
+    rid = album.get("id")
+    return str(rid) if rid not in (None, "") else None
+
+
+def album_hash(album: Dict) -> str:
+    blob = json.dumps(album, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def _read_json(path: str, default: Any) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def _write_json_atomic(path: str, data: Any) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _writer_lock():
+    # The importer, tracklist fetcher and sync may run at the same time (cron + manual)
+    with open(f"{CHANGES_PATH}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# ------------------------------ Writing ------------------------------
+
+def diff_hashes(old: Dict[str, str], new: Dict[str, str]) -> Tuple[List[str], List[str], List[str]]:
+    """(added, removed, modified) album ids between two id -> hash maps."""
+    added = [k for k in new if k not in old]
+    removed = [k for k in old if k not in new]
+    modified = [k for k, h in new.items() if k in old and old[k] != h]
+    return added, removed, modified
+
+
+def record(albums: Iterable[Dict]) -> Optional[Dict]:
+    """
+    Diff `albums` (the whole collection) against the last recorded state.
+    Returns the appended entry, or None if nothing changed.
+    """
+    hashes: Dict[str, str] = {}
+    for album in albums:
+        key = album_key(album)
+        if key is not None:
+            hashes[key] = album_hash(album)
+
+    with _writer_lock():
+        log = _read_json(CHANGES_PATH, None)
+        old = _read_json(HASHES_PATH, None)
+        if log is None or old is None:
+            _write_json_atomic(HASHES_PATH, hashes)
+            _write_json_atomic(CHANGES_PATH, {"version": 1, "oldest": 1, "entries": []})
+            print(f"[INFO] Change log baseline recorded ({len(hashes)} album(s), version 1)")
+            return None
+
+        added, removed, modified = diff_hashes(old, hashes)
+        if not (added or removed or modified):
+            return None
+
+        entry = {
+            "version": log["version"] + 1,
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "added": added,
+            "removed": removed,
+            "modified": modified,
+        }
+        entries = log["entries"] + [entry]
+        if len(entries) > MAX_ENTRIES:
+            entries = entries[-MAX_ENTRIES:]
+        # Diffs are available from the version just before the oldest kept entry
+        log = {"version": entry["version"], "oldest": entries[0]["version"] - 1, "entries": entries}
+
+        # Hashes first: if we die in between, the next call re-detects these changes
+        _write_json_atomic(HASHES_PATH, hashes)
+        _write_json_atomic(CHANGES_PATH, log)
+    print(f"[INFO] Collection version {entry['version']}: "
+          f"added={len(added)} removed={len(removed)} modified={len(modified)}")
+    return entry
+
+
+def record_store(path: str = COLLECTION_PATH) -> Optional[Dict]:
+    """record() the current collection.json (or SQLite store), read album by album."""
+    return record(open_album_stream(path))
+
+
+# ------------------------------ Reading ------------------------------
+
+_cache_lock = threading.Lock()
+_cached: Tuple[Optional[Tuple[int, int, int]], Dict] = (None, EMPTY_LOG)
+
+
+def load_log() -> Dict:
+    """The change log, re-read only when the file changes (cheap per request)."""
+    global _cached
+    try:
+        st = os.stat(CHANGES_PATH)
+    except FileNotFoundError:
+        return EMPTY_LOG
+    version = (st.st_mtime_ns, st.st_size, st.st_ino)
+    if _cached[0] == version:
+        return _cached[1]
+    with _cache_lock:
+        if _cached[0] != version:
+            _cached = (version, _read_json(CHANGES_PATH, EMPTY_LOG))
+        return _cached[1]
+
+
+def current_version() -> int:
+    return load_log()["version"]
+
+
+def changes_since(since: int, log: Optional[Dict] = None) -> Dict:
+    """
+    Album ids changed after version `since`, folded over the log:
+    {"version", "since", "added", "removed", "modified"}, or
+    {"version", "since", "reset": True} if `since` predates the log (or is
+    from a log that no longer exists).
+
+    An id is reported once, by its net effect: added then modified is
+    "added"; added then removed is dropped; removed then re-added is "modified".
+    """
+    log = log or load_log()
+    version = log["version"]
+    if since == version:
+        return {"version": version, "since": since, "added": [], "removed": [], "modified": []}
+    if since < log["oldest"] or since > version:
+        return {"version": version, "since": since, "reset": True}
+
+    # id -> present at `since` / present now
+    before: Dict[str, bool] = {}
+    after: Dict[str, bool] = {}
+    for entry in log["entries"]:
+        if entry["version"] <= since:
+            continue
+        for key in entry["added"]:
+            before.setdefault(key, False)
+            after[key] = True
+        for key in entry["removed"]:
+            before.setdefault(key, True)
+            after[key] = False
+        for key in entry["modified"]:
+            before.setdefault(key, True)
+            after[key] = True
+
+    added = [k for k in after if after[k] and not before[k]]
+    removed = [k for k in after if before[k] and not after[k]]
+    modified = [k for k in after if before[k] and after[k]]
+    return {"version": version, "since": since, "added": added, "removed": removed, "modified": modified}
@@ -0,0 +1,361 @@
+# backend/collection_db.py
+"""
+Optional SQLite storage backend for the collection (WAL mode).
+
+Enable with COLLECTION_BACKEND=sqlite (database: COLLECTION_DB, default
+backend/collection.db). Writers then update single rows instead of
+rewriting collection.json, and readers check the version counter with one
+primary-key lookup before re-reading. Search is not served from SQL: the
+web server answers it from the per-version index in collection_index.py,
+so albums is only indexed for id lookups and document order.
+
+Tables:
+  albums(pk, id, artist, title, genre, label, year, date_added, position, data)
+  images(release_id, field, url)        -- cover_image/back_image/thumb/back_thumb
+  tracklists(release_id, tracks)
+  meta(key, value)                      -- document shape, version counter
+
+Usage:
+  python3 collection_db.py migrate            # collection.json -> collection.db
+  python3 collection_db.py export             # collection.db -> collection.json
+  python3 collection_db.py export --to out.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+HERE = os.path.dirname(__file__)
+DB_PATH = os.environ.get("COLLECTION_DB", os.path.join(HERE, "collection.db"))
+USE_SQLITE = os.environ.get("COLLECTION_BACKEND", "json").lower() == "sqlite"
+
+IMAGE_FIELDS = ("cover_image", "back_image", "thumb", "back_thumb")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS albums (
+    pk INTEGER PRIMARY KEY,
+    id INTEGER,
+    artist TEXT,
+    title TEXT,
+    genre TEXT,
+    label TEXT,
+    year INTEGER,
+    date_added TEXT,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS albums_id ON albums(id);
+CREATE INDEX IF NOT EXISTS albums_position ON albums(position);
+-- Created by earlier versions, never used by a query; dropped so writes stop maintaining them
+DROP INDEX IF EXISTS albums_artist;
+DROP INDEX IF EXISTS albums_genre;
+DROP INDEX IF EXISTS albums_label;
+DROP INDEX IF EXISTS albums_year;
+
+CREATE TABLE IF NOT EXISTS images (
+    release_id INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (release_id, field)
+);
+
+CREATE TABLE IF NOT EXISTS tracklists (
+    release_id INTEGER PRIMARY KEY,
+    tracks TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+# ------------------------------ Connections ------------------------------
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(path or DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+_local = threading.local()
+
+
+def thread_connection() -> sqlite3.Connection:
+    """One connection per thread (sqlite3 connections are not shareable)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != DB_PATH:
+        conn = _local.conn = connect()
+        _local.path = DB_PATH
+    return conn
+
+
+# --------------------------------- Meta ----------------------------------
+
+def _get_meta(conn: sqlite3.Connection, key: str, default: Any = None) -> Any:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return json.loads(row["value"]) if row else default
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value: Any) -> None:
+    conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+
+def _bump_version(conn: sqlite3.Connection) -> None:
+    """Readers poll current_version() and rebuild when it changes."""
+    _set_meta(conn, "version", _get_meta(conn, "version", 0) + 1)
+    _set_meta(conn, "updated_at_ns", time.time_ns())
+
+
+class batch:
+    """
+    Group a writer's row updates into one version bump:
+
+      with collection_db.batch(conn) as b:
+          for album in changed:
+              collection_db.update_album_fields(conn, ...)   # committed, not yet a new version
+          b.flush()                                          # optional: publish what is done so far
+
+    Rows still commit one by one (they are the importer's resume checkpoint),
+    but the web server rebuilds its snapshot on version changes, so bumping
+    per row would reload the whole collection on nearly every request.
+    The version is bumped on flush() and on exit if anything was written.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.dirty = False
+        self._outer: Optional["batch"] = None
+
+    def __enter__(self) -> "batch":
+        self._outer = _batches.get(id(self.conn))
+        _batches[id(self.conn)] = self
+        return self
+
+    def flush(self) -> None:
+        if not self.dirty:
+            return
+        with self.conn:
+            _bump_version(self.conn)
+        self.dirty = False
+
+    def __exit__(self, *exc) -> None:
+        try:
+            self.flush()
+        finally:
+            if self._outer is not None:
+                _batches[id(self.conn)] = self._outer
+            else:
+                del _batches[id(self.conn)]
+
+
+# id(connection) -> its open batch (connections are per thread, see thread_connection)
+_batches: Dict[int, batch] = {}
+
+
+def _record_write(conn: sqlite3.Connection) -> None:
+    """Called inside every write transaction: bump now, or when the open batch flushes."""
+    open_batch = _batches.get(id(conn))
+    if open_batch is not None:
+        open_batch.dirty = True
+    else:
+        _bump_version(conn)
+
+
+def current_version(conn: sqlite3.Connection) -> Tuple[int, int, int]:
+    """(updated_at_ns, version, 0): same shape as the file-based snapshot version."""
+    rows = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('version', 'updated_at_ns')").fetchall())
+    return int(json.loads(rows.get("updated_at_ns", "0"))), int(json.loads(rows.get("version", "0"))), 0
+
+
+# ------------------------------ Row mapping ------------------------------
+
+def _first(v: Any) -> Optional[str]:
+    if isinstance(v, (list, tuple)):
+        v = v[0] if v else None
+    return str(v) if v not in (None, "") else None
+
+
+def _int_or_none(v: Any) -> Optional[int]:
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _album_row(album: Dict, position: int) -> Tuple:
+    rid = _int_or_none(album.get("id"))
+    if rid is None:
+        # images/tracklists are keyed by release id: without one, keep everything in data
+        data = dict(album)
+    else:
+        data = {k: v for k, v in album.items() if k not in IMAGE_FIELDS and k != "tracklist"}
+    return (
+        rid,
+        album.get("artist"),
+        album.get("title"),
+        _first(album.get("genre")),
+        _first(album.get("label")),
+        _int_or_none(album.get("year")),
+        album.get("date_added"),
+        position,
+        json.dumps(data, ensure_ascii=False),
+    )
+
+
+def _insert_album(conn: sqlite3.Connection, album: Dict, position: int) -> None:
+    conn.execute(
+        "INSERT INTO albums(id, artist, title, genre, label, year, date_added, position, data) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        _album_row(album, position),
+    )
+    rid = _int_or_none(album.get("id"))
+    if rid is None:
+        return
+    for field in IMAGE_FIELDS:
+        if album.get(field):
+            conn.execute("INSERT OR REPLACE INTO images(release_id, field, url) VALUES (?, ?, ?)",
+                         (rid, field, album[field]))
+    if album.get("tracklist"):
+        conn.execute("INSERT OR REPLACE INTO tracklists(release_id, tracks) VALUES (?, ?)",
+                     (rid, json.dumps(album["tracklist"], ensure_ascii=False)))
+
+
+# --------------------------------- Reads ---------------------------------
+
+def iter_albums(conn: sqlite3.Connection) -> Iterator[Dict]:
+    """Albums in collection order with images and tracklists merged back in."""
+    images: Dict[int, Dict[str, str]] = {}
+    for row in conn.execute("SELECT release_id, field, url FROM images"):
+        images.setdefault(row["release_id"], {})[row["field"]] = row["url"]
+    tracks = {row["release_id"]: row["tracks"] for row in conn.execute("SELECT release_id, tracks FROM tracklists")}
+
+    for row in conn.execute("SELECT id, data FROM albums ORDER BY position"):
+        album = json.loads(row["data"])
+        if row["id"] is not None:
+            album.update(images.get(row["id"], {}))
+            if row["id"] in tracks:
+                album["tracklist"] = json.loads(tracks[row["id"]])
+        yield album
+
+
+def load_shape(conn: sqlite3.Connection) -> Tuple[Tuple[str, Optional[str]], Dict[str, Any]]:
+    """(shape, other top-level keys) of the migrated document."""
+    return tuple(_get_meta(conn, "shape", ["list", None])), _get_meta(conn, "document", {})
+
+
+def load_document(conn: sqlite3.Connection) -> Any:
+    """The collection in its original shape (bare list or dict with an albums key)."""
+    from collection_importer import set_albums_back
+
+    shape, rest = load_shape(conn)
+    return set_albums_back(rest, list(iter_albums(conn)), shape)
+
+
+# -------------------------------- Writes ---------------------------------
+
+def update_album_fields(conn: sqlite3.Connection, release_id: int, fields: Dict[str, Any]) -> None:
+    """
+    Row-level update for every album row of a release: image fields and the
+    tracklist go to their tables, anything else into the album's data.
+    """
+    with conn:
+        for field, value in fields.items():
+            if field in IMAGE_FIELDS:
+                if value:
+                    conn.execute("INSERT OR REPLACE INTO images(release_id, field, url) VALUES (?, ?, ?)",
+                                 (release_id, field, value))
+                else:
+                    conn.execute("DELETE FROM images WHERE release_id = ? AND field = ?", (release_id, field))
+            elif field == "tracklist":
+                conn.execute("INSERT OR REPLACE INTO tracklists(release_id, tracks) VALUES (?, ?)",
+                             (release_id, json.dumps(value or [], ensure_ascii=False)))
+            else:
+                rows = conn.execute("SELECT pk, data FROM albums WHERE id = ?", (release_id,)).fetchall()
+                for row in rows:
+                    data = json.loads(row["data"])
+                    if value is None:
+                        data.pop(field, None)  # like a key deleted from collection.json
+                    else:
+                        data[field] = value
+                    album_row = _album_row(data, 0)
+                    conn.execute(
+                        "UPDATE albums SET artist = ?, title = ?, genre = ?, label = ?, year = ?, "
+                        "date_added = ?, data = ? WHERE pk = ?",
+                        album_row[1:7] + (album_row[8], row["pk"]),
+                    )
+        _record_write(conn)
+
+
+def insert_albums(conn: sqlite3.Connection, albums: List[Dict], at_front: bool = False) -> None:
+    """Add albums before (at_front) or after the existing ones, keeping their order."""
+    with conn:
+        lo, hi = conn.execute("SELECT MIN(position), MAX(position) FROM albums").fetchone()
+        start = (lo or 0) - len(albums) if at_front else (hi + 1 if hi is not None else 0)
+        for offset, album in enumerate(albums):
+            _insert_album(conn, album, start + offset)
+        _record_write(conn)
+
+
+def replace_document(conn: sqlite3.Connection, raw: Any) -> int:
+    """Replace the whole stored collection with `raw` (migration). Returns album count."""
+    from collection_importer import extract_albums_shape
+
+    albums, shape = extract_albums_shape(raw)
+    rest = {k: v for k, v in raw.items() if k != shape[1]} if isinstance(raw, dict) else {}
+    with conn:
+        conn.execute("DELETE FROM albums")
+        conn.execute("DELETE FROM images")
+        conn.execute("DELETE FROM tracklists")
+        for position, album in enumerate(albums):
+            _insert_album(conn, album, position)
+        _set_meta(conn, "shape", list(shape))
+        _set_meta(conn, "document", rest)
+        _record_write(conn)
+    return len(albums)
+
+
+# ---------------------------------- CLI ----------------------------------
+
+def main():
+    import collection_importer
+
+    parser = argparse.ArgumentParser(description="Migrate collection.json to SQLite and back")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_migrate = sub.add_parser("migrate", help="Load collection.json into the database (replaces its contents)")
+    p_migrate.add_argument("--from", dest="src", default=collection_importer.COLLECTION_PATH)
+    p_export = sub.add_parser("export", help="Write the database back out as collection.json")
+    p_export.add_argument("--to", dest="dst", default=collection_importer.COLLECTION_PATH)
+    parser.add_argument("--db", default=DB_PATH, help=f"Database path (default {DB_PATH})")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == "migrate":
+        with open(args.src, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        count = replace_document(conn, raw)
+        print(f"[OK] Migrated {count} album(s) from {args.src} -> {args.db}")
+    else:
+        data = load_document(conn)
+        if os.path.abspath(args.dst) == os.path.abspath(collection_importer.COLLECTION_PATH):
+            collection_importer.write_collection_atomic(data)
+        else:
+            tmp_path = f"{args.dst}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, args.dst)
+        print(f"[OK] Exported {args.db} -> {args.dst}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
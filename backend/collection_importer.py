@@ -9,6 +9,29 @@ Importer/Refresher for record images and metadata fields.
   keeps legacy thumb fields consistent.
 - Skips already-cached images unless --force is passed.
 - Supports --dry-run, --limit, and --ids filters.
+- --workers N refreshes albums concurrently; all workers share the Discogs
+  client's rate budget, and collection.json is still written once at the end.
+- Every finished album is checkpointed to an NDJSON journal next to
+  collection.json; --resume skips releases completed by an interrupted run
+  and merges their recorded results.
+- With COLLECTION_BACKEND=sqlite (see collection_db.py) albums are read from
+  the database and each changed album is written as it finishes (row-level
+  updates); no whole-file rewrite, backup or journal is needed.
+- --sync first pulls albums added to the Discogs collection since the last
+  sync (newest-first, stopping at the first known one; see collection_sync.py)
+  and then refreshes only those.
+- Each run appends a metrics summary line (counts, wall time, Discogs
+  status/latency and rate budget, cache hit/miss) to import_metrics.ndjson.
+- --stream reads collection.json incrementally and writes the updated copy
+  batch by batch (see collection_stream.py), for collections too large to
+  hold in memory several times over.
+- After each batch is refreshed, a metadata stage decodes new or changed
+  cached images in a process pool and records width/height, dominant color
+  and a tiny inline placeholder into the album (see image_metadata.py);
+  --no-metadata skips it.
+- With IMAGE_CACHE_MAX_BYTES set, images/ is trimmed back to that budget at
+  the end of each run; covers of the collection are never evicted
+  (see image_budget.py).
 
 Usage examples:
   python3 collection_importer.py
@@ -16,29 +39,52 @@ Usage examples:
   python3 collection_importer.py --force
   python3 collection_importer.py --ids 1626692 1859153
   python3 collection_importer.py --dry-run
+  python3 collection_importer.py --workers 8
+  python3 collection_importer.py --resume
+  python3 collection_importer.py --stream --workers 4
+  python3 collection_importer.py --sync
 """
 from __future__ import annotations
 
 import argparse
 import json
+import multiprocessing
 import os
+import shutil
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 # Reuse your backend caching logic
-from image_cache import ensure_release_images, FALLBACK_IMAGE
+import image_cache
+import image_metadata
+from image_cache import ensure_release_images, cached_image_url, FALLBACK_IMAGE
+import collection_changes
+import collection_db
+import metrics
+from collection_stream import AlbumStream, CollectionWriter, open_album_stream
 
 HERE = os.path.dirname(__file__)
 COLLECTION_PATH = os.path.join(HERE, "collection.json")
 IMAGES_DIR = os.path.join(HERE, "images")
 
-# Small politeness delay to avoid hammering Discogs unnecessarily
-DEFAULT_DELAY_SEC = float(os.environ.get("DISCOGS_DELAY_SEC", "0.25"))  # 250ms between calls
+# Optional extra pause after each download; the shared Discogs client already
+# paces API calls to the rate limit reported by Discogs (see discogs_client.py)
+DEFAULT_DELAY_SEC = float(os.environ.get("DISCOGS_DELAY_SEC", "0"))
+DEFAULT_WORKERS = int(os.environ.get("IMPORT_WORKERS", "1"))
+# --stream keeps at most workers x this many albums in memory
+STREAM_BATCH_PER_WORKER = 16
+
+# One JSON line per run: counters, wall time, Discogs/cache metrics
+IMPORT_METRICS_PATH = os.environ.get("IMPORT_METRICS_PATH", os.path.join(HERE, "import_metrics.ndjson"))
 
 
 def load_collection() -> Any:
+    if collection_db.USE_SQLITE:
+        return collection_db.load_document(collection_db.thread_connection())
     if not os.path.exists(COLLECTION_PATH):
         print(f"[ERROR] collection.json not found at: {COLLECTION_PATH}", file=sys.stderr)
         sys.exit(1)
@@ -50,22 +96,29 @@ def save_collection(data: Any, dry_run: bool) -> None:
     if dry_run:
         print("[DRY-RUN] Not writing changes to collection.json")
         return
-    # Backup first
+    _backup_collection()
+    write_collection_atomic(data)
+    print("[OK] Wrote updated collection.json")
+
+
+def _backup_collection() -> None:
     ts = datetime.now().strftime("%Y%m%d-%H%M%S")
     backup_path = f"{COLLECTION_PATH}.bak.{ts}"
     try:
         if os.path.exists(COLLECTION_PATH):
-            with open(COLLECTION_PATH, "rb") as src, open(backup_path, "wb") as dst:
-                dst.write(src.read())
+            # Copied in chunks, not read whole into memory
+            shutil.copyfile(COLLECTION_PATH, backup_path)
             print(f"[INFO] Backed up old collection.json -> {backup_path}")
     except Exception as e:
         print(f"[WARN] Failed to create backup: {e}", file=sys.stderr)
 
+
+def write_collection_atomic(data: Any) -> None:
+    """Replace collection.json in one rename; readers never see a partial file."""
     tmp_path = f"{COLLECTION_PATH}.tmp"
     with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
     os.replace(tmp_path, COLLECTION_PATH)
-    print(f"[OK] Wrote updated collection.json")
 
 
 def extract_albums_shape(raw: Any) -> Tuple[List[Dict], Tuple[str, str | None]]:
@@ -94,11 +147,11 @@ def set_albums_back(raw: Any, albums: List[Dict], shape: Tuple[str, str | None])
 
 
 def first_existing_variant(base_no_ext: str) -> str | None:
-    for ext in ("jpg", "jpeg", "png", "webp"):
-        candidate = os.path.join(IMAGES_DIR, f"{base_no_ext}.{ext}")
-        if os.path.exists(candidate):
-            return f"/images/{os.path.basename(candidate)}"
-    return None
+    """'/images/<base>.<ext>' if cached (via the shared image index, no stat probing)."""
+    kind, _, rid = base_no_ext.partition("_")
+    if not rid.isdigit():
+        return None
+    return cached_image_url(kind, int(rid))
 
 
 def absolutize(path: str | None) -> str | None:
@@ -166,13 +219,290 @@ def refresh_album_images(album: Dict, force: bool = False) -> Tuple[bool, str]:
     return changed, "downloaded" if (not cover_cached or (not back_cached and back_final)) else "updated refs"
 
 
+# Album fields the refresh stage may change (recorded in the journal)
+JOURNAL_FIELDS = ("cover_image", "back_image", "thumb", "back_thumb")
+
+
+def journal_path() -> str:
+    return f"{COLLECTION_PATH}.journal.ndjson"
+
+
+class ImportJournal:
+    """
+    Append-only NDJSON checkpoint of per-release outcomes, one line per
+    finished album, so an interrupted run can be resumed without redoing
+    network work. Removed once collection.json has been written.
+    """
+
+    def __init__(self, path: str, resume: bool):
+        self.path = path
+        self.completed: Dict[int, Dict] = {}
+        if resume:
+            self.completed = self._read(path)
+        self._f = open(path, "a" if resume else "w", encoding="utf-8")
+
+    @staticmethod
+    def _read(path: str) -> Dict[int, Dict]:
+        completed: Dict[int, Dict] = {}
+        if not os.path.exists(path):
+            return completed
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a killed run
+                if entry.get("id") is not None:
+                    completed[int(entry["id"])] = entry
+        return completed
+
+    def record(self, album: Dict, status: str, changed: bool) -> None:
+        entry = {
+            "id": album.get("id"),
+            "status": status,
+            "changed": changed,
+            "fields": {k: album[k] for k in JOURNAL_FIELDS if k in album},
+        }
+        self._f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def close(self, remove: bool = False) -> None:
+        self._f.close()
+        if remove:
+            os.remove(self.path)
+
+
+def apply_journal_entry(album: Dict, entry: Dict) -> bool:
+    """Merge a journaled outcome into the album; returns True if it changed."""
+    changed = False
+    for k, v in (entry.get("fields") or {}).items():
+        if album.get(k) != v:
+            album[k] = v
+            changed = True
+    return changed
+
+
+def _refresh_worker(album: Dict, force: bool, delay: float) -> Tuple[bool, str]:
+    changed, status = refresh_album_images(album, force=force)
+    # politeness delay only when we might have called Discogs
+    if delay and status == "downloaded":
+        time.sleep(delay)
+    return changed, status
+
+
+class _Run:
+    """Per-run counters and sinks; only touched from the main thread."""
+
+    def __init__(self, total: int, journal: Optional["ImportJournal"], store: Callable[[Dict], None]):
+        self.total = total
+        self.journal = journal
+        self.store = store
+        self.processed = 0
+        self.changed = 0
+        self.downloaded = 0
+        self.skipped = 0
+        self.resumed = 0
+        self.errors = 0
+        self.annotated = 0
+        # Process pool for the image metadata stage (None: stage off)
+        self.meta_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _refresh_batch(pool: ThreadPoolExecutor, batch: List[Tuple[int, Dict]], args, run: _Run) -> None:
+    """Refresh (idx, album) pairs concurrently, merging journaled results first."""
+    pending: List[Tuple[int, Dict]] = []
+    for idx, album in batch:
+        entry = run.journal.completed.get(int(album["id"])) if run.journal and album.get("id") else None
+        if entry is None:
+            pending.append((idx, album))
+            continue
+        # Merge results journaled by an interrupted run instead of refetching
+        run.resumed += 1
+        if apply_journal_entry(album, entry):
+            run.changed += 1
+
+    # Workers only mutate their own album dict; counters, output and the
+    # journal stay on this thread, so they need no locking.
+    futures = {
+        pool.submit(_refresh_worker, album, args.force, args.delay): (idx, album)
+        for idx, album in pending
+    }
+    for fut in as_completed(futures):
+        idx, album = futures[fut]
+        rid = album.get("id")
+        label = f"{album.get('artist', '')} – {album.get('title', '')}"
+        # --stream does not know the total up front
+        prefix = (f"[{idx}/{run.total}]" if run.total else f"[{idx}]") + f" id={rid} {label}".rstrip()
+
+        try:
+            changed, status = fut.result()
+        except Exception as e:
+            run.errors += 1
+            print(f"{prefix}: ERROR: {e}", file=sys.stderr)
+            continue
+
+        run.processed += 1
+        if status == "downloaded":
+            run.downloaded += 1
+        elif status == "already cached":
+            run.skipped += 1
+        else:
+            # "updated refs" etc.
+            pass
+        if changed:
+            run.changed += 1
+            run.store(album)
+        if run.journal:
+            run.journal.record(album, status, changed)
+
+        print(f"{prefix}: {status}")
+
+    # One negative_cache.json write per batch instead of one per missing image
+    image_cache.negative_cache.flush()
+    _annotate_batch([album for _, album in batch], run)
+
+
+def _metadata_pool(args):
+    """Process pool for the image metadata stage, or a null context when the stage is off."""
+    if args.no_metadata or args.dry_run:
+        return nullcontext()
+    if not image_metadata.available():
+        print("[INFO] Pillow is not installed; skipping the image metadata stage")
+        return nullcontext()
+    # forkserver: the download threads are already running, and forking a
+    # threaded process can copy a held lock into the child
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+    return ProcessPoolExecutor(max_workers=max(1, args.metadata_workers), mp_context=ctx)
+
+
+def _annotate_batch(albums: List[Dict], run: _Run) -> None:
+    """Image metadata stage (see image_metadata.py): decode new/changed images across cores."""
+    if run.meta_pool is None:
+        return
+    for album in image_metadata.annotate(albums, run.meta_pool):
+        run.annotated += 1
+        run.store(album)
+
+
+def _selected(album: Dict, idset: Optional[set]) -> bool:
+    return not idset or bool(album.get("id") and int(album["id"]) in idset)
+
+
+def _run_streaming(pool: ThreadPoolExecutor, args, idset: Optional[set], run: _Run) -> None:
+    """
+    --stream: read collection.json album by album, refresh in batches of
+    STREAM_BATCH_PER_WORKER x workers, and write each batch straight to the
+    replacement file, so memory stays flat however large the collection is.
+    """
+    stream = AlbumStream(COLLECTION_PATH)
+    writer: Optional[CollectionWriter] = None
+    batch_size = max(1, args.workers) * STREAM_BATCH_PER_WORKER
+    batch: List[Dict] = []
+    selected = 0
+    total_albums = 0
+
+    def flush() -> None:
+        nonlocal selected
+        work = []
+        for album in batch:
+            if _selected(album, idset) and (not args.limit or selected < args.limit):
+                selected += 1
+                work.append((selected, album))
+        _refresh_batch(pool, work, args, run)
+        if writer:
+            for album in batch:
+                writer.write(album)
+        batch.clear()
+
+    try:
+        for album in stream:
+            if writer is None and not args.dry_run:
+                # The shape is known once the first album has been reached
+                writer = CollectionWriter(COLLECTION_PATH, stream.shape, head=stream.rest)
+            total_albums += 1
+            batch.append(album)
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
+
+    if not total_albums:
+        if writer:
+            writer.abort()
+        print("[ERROR] No albums found in collection.json (expected list or records/collection/items array).", file=sys.stderr)
+        sys.exit(1)
+    if writer and (run.changed or run.annotated):
+        _backup_collection()
+        writer.commit(stream.rest)
+        print("[OK] Wrote updated collection.json")
+    elif writer:
+        writer.abort()
+    if not (run.changed or run.annotated):
+        print("[INFO] No changes to write.")
+    elif args.dry_run:
+        print("[DRY-RUN] Changes not written.")
+
+
+def enforce_image_budget() -> None:
+    """Evict down to IMAGE_CACHE_MAX_BYTES, keeping every collection cover (see image_budget.py)."""
+    budget = image_cache.disk_budget
+    if not budget.max_bytes:
+        return
+    pinned = [int(a["id"]) for a in open_album_stream(COLLECTION_PATH) if str(a.get("id", "")).isdigit()]
+    removed, freed = budget.enforce(pinned)
+    if removed:
+        print(f"[INFO] Image cache over budget: evicted {removed} file(s), {freed} bytes")
+
+
+def publish_snapshot() -> None:
+    """Pre-build the web server's shared snapshot so its workers only map it."""
+    import collection_snapshot  # imports this module
+
+    try:
+        collection_snapshot.publish_current(COLLECTION_PATH)
+    except (OSError, ValueError) as e:
+        print(f"[WARN] Could not publish the shared snapshot: {e}", file=sys.stderr)
+
+
+def write_run_metrics(run: _Run, args, wall_sec: float) -> None:
+    entry = {
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "wall_sec": round(wall_sec, 3),
+        "args": {k: v for k, v in vars(args).items()},
+        "counts": {
+            "processed": run.processed, "downloaded": run.downloaded, "changed": run.changed,
+            "skipped": run.skipped, "resumed": run.resumed, "errors": run.errors,
+            "annotated": run.annotated,
+        },
+        "albums_per_sec": round(run.processed / wall_sec, 3) if wall_sec > 0 else None,
+        "metrics": metrics.as_dict(),
+    }
+    try:
+        with open(IMPORT_METRICS_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"[INFO] Run metrics appended to {IMPORT_METRICS_PATH}")
+    except OSError as e:
+        print(f"[WARN] Failed to write run metrics: {e}", file=sys.stderr)
+
+
 def main():
+    started = time.monotonic()
     parser = argparse.ArgumentParser(description="Refresh/download Discogs images and update collection.json")
     parser.add_argument("--limit", type=int, default=0, help="Max number of albums to process (0 = all)")
     parser.add_argument("--force", action="store_true", help="Redownload/repoint even if images exist")
     parser.add_argument("--dry-run", action="store_true", help="Do not write collection.json; just log actions")
     parser.add_argument("--ids", nargs="*", help="Only process these release IDs")
-    parser.add_argument("--delay", type=float, default=DEFAULT_DELAY_SEC, help=f"Delay between Discogs calls (default {DEFAULT_DELAY_SEC}s)")
+    parser.add_argument("--delay", type=float, default=DEFAULT_DELAY_SEC, help=f"Extra delay after each download, on top of rate limiting (default {DEFAULT_DELAY_SEC}s)")
+    parser.add_argument("--resume", action="store_true", help="Skip releases completed by the last (interrupted) run")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Albums refreshed concurrently (default {DEFAULT_WORKERS})")
+    parser.add_argument("--stream", action="store_true", help="Read and rewrite collection.json incrementally (flat memory for large collections)")
+    parser.add_argument("--sync", action="store_true", help="First add albums newly added to the Discogs collection, then refresh only those")
+    parser.add_argument("--no-metadata", action="store_true", help="Skip the image metadata stage (dimensions, dominant color, placeholder)")
+    parser.add_argument("--metadata-workers", type=int, default=os.cpu_count() or 1, help="Processes decoding images for the metadata stage (default: one per core)")
     args = parser.parse_args()
 
     token = os.environ.get("DISCOGS_TOKEN")
@@ -184,68 +514,92 @@ def main():
 
     os.makedirs(IMAGES_DIR, exist_ok=True)
 
-    raw = load_collection()
-    albums, shape = extract_albums_shape(raw)
-    if not albums:
-        print("[ERROR] No albums found in collection.json (expected list or records/collection/items array).", file=sys.stderr)
-        sys.exit(1)
-
-    # Optional filter by IDs
-    if args.ids:
-        idset = {int(x) for x in args.ids if str(x).isdigit()}
-        albums = [a for a in albums if a.get("id") and int(a["id"]) in idset]
-        print(f"[INFO] Filtering by ids: kept {len(albums)} items")
-
-    total = len(albums)
-    print(f"[INFO] Processing {total} album(s){' (dry-run)' if args.dry_run else ''}...")
-
-    processed = 0
-    changed_count = 0
-    downloaded_count = 0
-    skipped_count = 0
-    errors = 0
-
-    for idx, album in enumerate(albums, start=1):
-        if args.limit and processed >= args.limit:
-            break
-
-        rid = album.get("id")
-        label = f"{album.get('artist', '')} – {album.get('title', '')}"
-        prefix = f"[{idx}/{total}] id={rid} {label}".strip()
-
-        try:
-            changed, status = refresh_album_images(album, force=args.force)
-            processed += 1
-            if status == "downloaded":
-                downloaded_count += 1
-            elif status == "already cached":
-                skipped_count += 1
-            else:
-                # "updated refs" etc.
-                pass
-            if changed:
-                changed_count += 1
-
-            print(f"{prefix}: {status}")
-            # politeness delay only when we might call Discogs
-            if args.delay and status in ("downloaded",):
-                time.sleep(args.delay)
-
-        except Exception as e:
-            errors += 1
-            print(f"{prefix}: ERROR: {e}", file=sys.stderr)
-
-    # Write back
-    if changed_count and not args.dry_run:
-        updated = set_albums_back(raw, albums, shape)
-        save_collection(updated, dry_run=False)
+    if args.sync:
+        import collection_sync  # imports this module
+
+        new_ids = collection_sync.sync_collection(dry_run=args.dry_run)
+        if not new_ids:
+            print("[SUMMARY] No new albums; nothing to refresh.")
+            write_run_metrics(_Run(0, None, lambda album: None), args, time.monotonic() - started)
+            return
+        args.ids = [str(rid) for rid in new_ids]
+
+    # SQLite commits every changed album as it finishes, so the rows are the
+    # checkpoint; the journal only protects the single end-of-run file write
+    db = collection_db.thread_connection() if collection_db.USE_SQLITE and not args.dry_run else None
+    if args.stream and collection_db.USE_SQLITE:
+        print("[INFO] --stream has no effect with the SQLite backend (updates are already row-level)")
+        args.stream = False
+
+    def store(album: Dict) -> None:
+        if db is not None:
+            fields = JOURNAL_FIELDS + tuple(image_metadata.META_FIELDS)
+            collection_db.update_album_fields(db, int(album["id"]), {k: album.get(k) for k in fields})
+
+    journal: Optional[ImportJournal] = None
+    if not args.dry_run and db is None:
+        journal = ImportJournal(journal_path(), resume=args.resume)
+
+    idset = {int(x) for x in args.ids if str(x).isdigit()} if args.ids else None
+    workers = max(1, args.workers)
+
+    if args.stream:
+        run = _Run(args.limit or 0, journal, store)
+        print(f"[INFO] Streaming collection.json with {workers} worker(s){' (dry-run)' if args.dry_run else ''}...")
+        with ThreadPoolExecutor(max_workers=workers) as pool, _metadata_pool(args) as meta_pool:
+            run.meta_pool = meta_pool
+            _run_streaming(pool, args, idset, run)
     else:
-        print("[INFO] No changes to write." if not changed_count else "[DRY-RUN] Changes not written.")
+        raw = load_collection()
+        albums, shape = extract_albums_shape(raw)
+        if not albums:
+            print("[ERROR] No albums found in collection.json (expected list or records/collection/items array).", file=sys.stderr)
+            sys.exit(1)
+
+        # Optional filter by IDs. `work` is the subset to process; `albums` stays
+        # the full list so the write-back never drops unprocessed albums.
+        work = albums
+        if idset is not None:
+            work = [a for a in albums if _selected(a, idset)]
+            print(f"[INFO] Filtering by ids: kept {len(work)} items")
+
+        if args.limit:
+            work = work[:args.limit]
+        run = _Run(len(work), journal, store)
+        print(f"[INFO] Processing {run.total} album(s) with {workers} worker(s){' (dry-run)' if args.dry_run else ''}...")
+
+        # SQLite: one new collection version for the run, not one per album
+        with ThreadPoolExecutor(max_workers=workers) as pool, _metadata_pool(args) as meta_pool, \
+                (collection_db.batch(db) if db is not None else nullcontext()):
+            run.meta_pool = meta_pool
+            _refresh_batch(pool, list(enumerate(work, start=1)), args, run)
+
+        # Write back
+        if db is not None:
+            updated_count = run.changed + run.annotated
+            print(f"[OK] Updated {updated_count} album(s) in {collection_db.DB_PATH}" if updated_count else "[INFO] No changes to write.")
+        elif (run.changed or run.annotated) and not args.dry_run:
+            updated = set_albums_back(raw, albums, shape)
+            save_collection(updated, dry_run=False)
+        else:
+            print("[INFO] No changes to write." if not (run.changed or run.annotated) else "[DRY-RUN] Changes not written.")
+
+    if run.resumed:
+        print(f"[INFO] Resumed {run.resumed} album(s) from {journal.path}")
+    # Results are now in collection.json (or there were none): checkpoint done
+    if journal:
+        journal.close(remove=True)
+    if not args.dry_run:
+        collection_changes.record_store(COLLECTION_PATH)
+        enforce_image_budget()
+        publish_snapshot()
 
     print(
-        f"[SUMMARY] processed={processed} downloaded={downloaded_count} "
-        f"changed={changed_count} skipped={skipped_count} errors={errors}"
+        f"[SUMMARY] processed={run.processed} downloaded={run.downloaded} "
+        f"changed={run.changed} skipped={run.skipped} resumed={run.resumed} errors={run.errors} "
+        f"annotated={run.annotated}"
     )
+    write_run_metrics(run, args, time.monotonic() - started)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+# backend/collection_index.py
+"""
+Search index over a collection snapshot, backing /api/collection/search.
+
+Built once per collection version (the snapshot memoizes it):
+- inverted token and trigram indexes over artist + title for `q`
+- hash indexes on genre, label and year for exact filters
+- precomputed sort orders so a page is a slice, not a full sort
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+SORTS = ("recent", "alpha", "year")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _values(v: Any) -> List[str]:
+    """Album fields may be a string or a list of strings (e.g. genre)."""
+    if v is None or v == "":
+        return []
+    if isinstance(v, (list, tuple)):
+        return [str(x).strip().lower() for x in v if x not in (None, "")]
+    return [str(v).strip().lower()]
+
+
+def album_artist(album: Dict) -> str:
+    artist = album.get("artist")
+    if artist:
+        return str(artist)
+    artists = album.get("artists")
+    if isinstance(artists, list) and artists and isinstance(artists[0], dict):
+        return str(artists[0].get("name") or "")
+    return ""
+
+
+def album_year(album: Dict) -> Optional[int]:
+    try:
+        year = int(album.get("year") or 0)
+    except (TypeError, ValueError):
+        return None
+    return year or None
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CollectionIndex:
+    def __init__(self, albums: List[Dict]):
+        self.albums = albums
+        self._haystacks: List[str] = []
+        self._tokens: Dict[str, Set[int]] = {}
+        self._trigram_postings: Dict[str, Set[int]] = {}
+        self._by_genre: Dict[str, Set[int]] = {}
+        self._by_label: Dict[str, Set[int]] = {}
+        self._by_year: Dict[int, Set[int]] = {}
+
+        for pos, album in enumerate(albums):
+            text = f"{album.get('title') or ''} {album_artist(album)}".lower()
+            self._haystacks.append(text)
+            for tok in _TOKEN_RE.findall(text):
+                self._tokens.setdefault(tok, set()).add(pos)
+            for tri in _trigrams(text):
+                self._trigram_postings.setdefault(tri, set()).add(pos)
+            for g in _values(album.get("genre")):
+                self._by_genre.setdefault(g, set()).add(pos)
+            for lbl in _values(album.get("label")):
+                self._by_label.setdefault(lbl, set()).add(pos)
+            year = album_year(album)
+            if year:
+                self._by_year.setdefault(year, set()).add(pos)
+
+        positions = range(len(albums))
+        self._orders: Dict[str, List[int]] = {
+            # recent: date_added desc (same as the UI's default sort)
+            "recent": sorted(positions, key=lambda p: str(albums[p].get("date_added") or ""), reverse=True),
+            "alpha": sorted(positions, key=lambda p: (
+                album_artist(albums[p]).lower(), str(albums[p].get("title") or "").lower())),
+            "year": sorted(positions, key=lambda p: (album_year(albums[p]) or 0, self._haystacks[p])),
+        }
+        self._ranks: Dict[str, List[int]] = {}
+        for name, order in self._orders.items():
+            rank = [0] * len(order)
+            for r, p in enumerate(order):
+                rank[p] = r
+            self._ranks[name] = rank
+
+    # ------------------------------ Matching ------------------------------
+
+    def _match_term(self, term: str) -> Set[int]:
+        """Positions whose artist/title text contains `term` as a substring."""
+        if len(term) >= 3:
+            grams = sorted(_trigrams(term), key=lambda g: len(self._trigram_postings.get(g, ())))
+            candidates: Optional[Set[int]] = None
+            for g in grams:
+                posting = self._trigram_postings.get(g)
+                if not posting:
+                    return set()
+                candidates = set(posting) if candidates is None else candidates & posting
+                if not candidates:
+                    return set()
+        else:
+            # Too short for trigrams: scan the (much smaller) token vocabulary
+            candidates = set()
+            for tok, posting in self._tokens.items():
+                if term in tok:
+                    candidates |= posting
+        # Trigrams/tokens only narrow; confirm the real substring match
+        return {p for p in candidates or () if term in self._haystacks[p]}
+
+    def _match(self, q: str = "", genre: str = "", label: str = "", year: Optional[int] = None) -> Optional[Set[int]]:
+        """Intersect all criteria; None means 'no criteria' (everything matches)."""
+        sets: List[Set[int]] = []
+        for term in _TOKEN_RE.findall((q or "").lower()):
+            sets.append(self._match_term(term))
+        if genre:
+            sets.append(self._by_genre.get(genre.strip().lower(), set()))
+        if label:
+            sets.append(self._by_label.get(label.strip().lower(), set()))
+        if year:
+            sets.append(self._by_year.get(year, set()))
+        if not sets:
+            return None
+        sets.sort(key=len)
+        matched = set(sets[0])
+        for s in sets[1:]:
+            matched &= s
+        return matched
+
+    def select(self, genre: str = "", label: str = "") -> List[Dict]:
+        """Albums matching the exact genre/label filters, in collection order."""
+        matched = self._match(genre=genre, label=label)
+        if matched is None:
+            return self.albums
+        return [self.albums[p] for p in sorted(matched)]
+
+    def search(
+        self,
+        q: str = "",
+        genre: str = "",
+        label: str = "",
+        year: Optional[int] = None,
+        sort: str = "recent",
+        offset: int = 0,
+        limit: int = 50,
+    ) -> Tuple[int, List[Dict]]:
+        """
+        Return (total_matches, page_of_albums). All criteria are ANDed; `q`
+        terms match substrings of title/artist, the rest are exact
+        (case-insensitive) matches.
+        """
+        matched = self._match(q, genre, label, year)
+        order = self._orders[sort]
+        if matched is None:
+            page = order[offset:offset + limit]
+            return len(order), [self.albums[p] for p in page]
+
+        rank = self._ranks[sort]
+        ordered = sorted(matched, key=rank.__getitem__)
+        return len(ordered), [self.albums[p] for p in ordered[offset:offset + limit]]
@@ -0,0 +1,370 @@
+# backend/collection_snapshot.py
+"""
+Process-level snapshot of collection.json for the web server.
+
+Parsing and normalizing the whole collection on every /api/collection hit is
+O(collection). Instead we keep one immutable snapshot per file version:
+
+- the raw parsed document and its album list (normalized for the UI)
+- the pre-serialized JSON body, ready to hand to a Response as-is
+- gzip/brotli encodings of that body, compressed lazily once per version
+- derived structures (search index, ...) memoized per version via derived()
+
+The snapshot is rebuilt only when collection.json's (mtime, size, inode)
+changes, e.g. after collection_importer.py finishes its atomic os.replace.
+With COLLECTION_BACKEND=sqlite the version is the database's change counter
+(see collection_db.py), read with a single primary-key lookup per request.
+
+Across processes (gunicorn workers, see wsgi.py) the encoded bodies are
+shared through one memory-mapped file, collection.snapshot: only the first
+process to see a version builds it (COLLECTION_SHARED_SNAPSHOT=0 disables).
+"""
+from __future__ import annotations
+
+import copy
+import fcntl
+import gzip
+import json
+import mmap
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+try:
+    import brotli  # optional: br is only offered when installed
+except ImportError:  # pragma: no cover - depends on environment
+    brotli = None
+
+import collection_db
+import metrics
+from collection_importer import extract_albums_shape, set_albums_back
+from image_cache import normalize_album_paths, FALLBACK_IMAGE
+
+HERE = os.path.dirname(__file__)
+COLLECTION_PATH = os.path.join(HERE, "collection.json")
+
+SNAPSHOT_RELOADS = metrics.counter("collection_snapshot_reloads_total", "Collection snapshot rebuilds (file or database changed)")
+SNAPSHOT_RELOAD_SECONDS = metrics.histogram("collection_snapshot_reload_seconds", "Time to parse, normalize and serialize a snapshot")
+COLLECTION_ALBUMS = metrics.gauge("collection_albums", "Albums in the current snapshot")
+
+# Compression levels for the cached encodings. gzip 9 costs little more than
+# the default 6 at this size. Brotli's default (11) takes seconds on a large
+# collection and runs on the request that first sees a new version; 5 is
+# ~20x faster and still smaller than gzip 9.
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 5
+
+
+def normalize_for_ui(album: Dict) -> Dict:
+    """Rewrite an album's image fields in place for the UI (also used when streaming)."""
+    album = normalize_album_paths(album)
+    if not album.get("cover_image"):
+        album["cover_image"] = FALLBACK_IMAGE
+    return album
+
+
+class CollectionSnapshot:
+    """
+    One parsed + normalized + serialized version of collection.json.
+    Treat instances as read-only; a new file version produces a new snapshot.
+    """
+
+    shared = False  # True when mapped from the file another process published
+
+    def __init__(self, raw: Any, version: Tuple[int, int, int]):
+        albums, shape = extract_albums_shape(raw)
+
+        # Normalize copies so the raw document stays exactly as on disk
+        normalized: List[Dict] = [normalize_for_ui(copy.deepcopy(a)) for a in albums]
+
+        self.raw = raw
+        self.shape = shape
+        self.albums = normalized
+        self.album_count = len(normalized)
+        self.version = version
+        self.payload = set_albums_back(raw, normalized, shape)
+        self.body = json.dumps(self.payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = f"{version[0]:x}-{version[1]:x}"
+
+        self._encoded: Dict[str, bytes] = {"identity": self.body}
+        self._encode_lock = threading.Lock()
+        self._derived: Dict[Any, Any] = {}
+        self._derived_lock = threading.Lock()
+
+    @property
+    def mtime(self) -> float:
+        return self.version[0] / 1e9
+
+    def encoded_body(self, encoding: str) -> bytes:
+        """
+        Return the body in the given content-coding ('identity', 'gzip', 'br').
+        Each encoding is computed at most once per snapshot.
+        """
+        cached = self._encoded.get(encoding)
+        if cached is not None:
+            return cached
+        with self._encode_lock:
+            cached = self._encoded.get(encoding)
+            if cached is None:
+                if encoding == "gzip":
+                    cached = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+                elif encoding == "br" and brotli is not None:
+                    cached = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                else:
+                    raise ValueError(f"Unsupported encoding: {encoding}")
+                self._encoded[encoding] = cached
+            return cached
+
+    def derived(self, key: Any, build: Callable[["CollectionSnapshot"], Any]) -> Any:
+        """
+        Memoize build(self) under `key` for the lifetime of this snapshot, so
+        anything computed from the collection is rebuilt only on file changes.
+        """
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+        with self._derived_lock:
+            if key not in self._derived:
+                self._derived[key] = build(self)
+            return self._derived[key]
+
+
+def available_encodings() -> List[str]:
+    """Content-codings we can serve, in server preference order."""
+    return (["br"] if brotli is not None else []) + ["gzip"]
+
+
+def _version_of(st: os.stat_result) -> Tuple[int, int, int]:
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+# --------------------------- Shared snapshot file ---------------------------
+#
+# With several server processes (gunicorn workers) each would parse, normalize,
+# serialize and compress the same collection. Instead the first process to see
+# a new version (or collection_importer.py at the end of a run) publishes the
+# encoded bodies to one file, and every process maps it read-only: the bytes
+# live once in the page cache and a worker only parses them if it needs the
+# album list (search, stats, changes).
+#
+# Layout: MAGIC, one JSON header line {"version": [...], "sections":
+# {encoding: [offset, length]}}, then the sections back to back.
+
+SHARED_ENABLED = os.environ.get("COLLECTION_SHARED_SNAPSHOT", "1") not in ("0", "false", "no")
+SHARED_PATH = os.environ.get("COLLECTION_SNAPSHOT_PATH", os.path.join(HERE, "collection.snapshot"))
+MAGIC = b"RCSNAP1\n"
+
+
+class MappedSnapshot(CollectionSnapshot):
+    """
+    A published snapshot served from a shared read-only mapping. The album
+    list and payload are parsed from the identity body on first use; `raw`
+    (the document as stored) is not available.
+    """
+
+    shared = True
+
+    def __init__(self, mm: mmap.mmap, version: Tuple[int, int, int], sections: Dict[str, Tuple[int, int]],
+                 album_count: int):
+        self.version = version
+        self.album_count = album_count
+        self.etag = f"{version[0]:x}-{version[1]:x}"
+        self.raw = None
+        self._mm = mm
+        self._sections = sections
+        self._encoded: Dict[str, bytes] = {}
+        self._encode_lock = threading.Lock()
+        self._derived: Dict[Any, Any] = {}
+        self._derived_lock = threading.Lock()
+        self._parsed: Optional[Tuple[Any, List[Dict], Tuple[str, Optional[str]]]] = None
+
+    @property
+    def body(self) -> bytes:
+        # A copy: only for parsing and compressing, each done once per snapshot
+        return bytes(self.encoded_body("identity"))
+
+    def encoded_body(self, encoding: str) -> Union[bytes, memoryview]:
+        """
+        The section as a view of the mapping, so a response is written from
+        the shared pages without copying (bytes for an encoding compressed here).
+        """
+        section = self._sections.get(encoding)
+        if section is None:
+            # Published without it (e.g. brotli missing there): compress once here
+            return super().encoded_body(encoding)
+        offset, length = section
+        return memoryview(self._mm)[offset:offset + length]
+
+    def _parse(self) -> Tuple[Any, List[Dict], Tuple[str, Optional[str]]]:
+        if self._parsed is None:
+            with self._derived_lock:
+                if self._parsed is None:
+                    payload = json.loads(self.body)
+                    albums, shape = extract_albums_shape(payload)
+                    self._parsed = (payload, albums, shape)
+        return self._parsed
+
+    @property
+    def payload(self) -> Any:
+        return self._parse()[0]
+
+    @property
+    def albums(self) -> List[Dict]:
+        return self._parse()[1]
+
+    @property
+    def shape(self) -> Tuple[str, Optional[str]]:
+        return self._parse()[2]
+
+
+# Encodings a server process publishes while it (and every worker waiting on
+# the lock) blocks on the rebuild; br is then compressed per process on first
+# use. publish_current() runs off the request path and publishes them all.
+REQUEST_PATH_ENCODINGS = ("identity", "gzip")
+
+
+def publish(snap: CollectionSnapshot, path: Optional[str] = None,
+            encodings: Optional[List[str]] = None) -> None:
+    """Write `snap`'s encoded bodies to the shared snapshot file (atomic replace)."""
+    path = path or SHARED_PATH
+    encodings = encodings or ["identity"] + available_encodings()
+    bodies = [(enc, snap.encoded_body(enc)) for enc in encodings]
+    sections: Dict[str, List[int]] = {}
+    offset = 0
+    for enc, data in bodies:
+        sections[enc] = [offset, len(data)]
+        offset += len(data)
+    header = MAGIC + json.dumps({"version": list(snap.version), "albums": snap.album_count, "sections": sections}).encode("utf-8") + b"\n"
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            for _, data in bodies:
+                f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _map_shared(version: Tuple[int, int, int]) -> Optional[MappedSnapshot]:
+    """The published snapshot if it exists and describes `version`, else None."""
+    try:
+        with open(SHARED_PATH, "rb") as f:
+            if f.readline() != MAGIC:
+                return None
+            header = json.loads(f.readline())
+            if tuple(header["version"]) != tuple(version):
+                return None
+            start = f.tell()
+            # The mapping outlives the file object (and a later os.replace of the path)
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, KeyError):
+        return None
+    sections = {enc: (start + off, length) for enc, (off, length) in header["sections"].items()}
+    return MappedSnapshot(mm, tuple(version), sections, header.get("albums", 0))
+
+
+@contextmanager
+def _publish_lock():
+    # One process builds a new version; the others wait and map its result
+    with open(f"{SHARED_PATH}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# ------------------------------ Current snapshot ------------------------------
+
+_lock = threading.Lock()
+_current: Optional[CollectionSnapshot] = None
+
+
+def _store_version() -> Tuple[int, int, int]:
+    if collection_db.USE_SQLITE:
+        return collection_db.current_version(collection_db.thread_connection())
+    return _version_of(os.stat(COLLECTION_PATH))
+
+
+def build_snapshot(path: Optional[str] = None) -> CollectionSnapshot:
+    """Parse the current collection.json (or SQLite store) into a new snapshot."""
+    with SNAPSHOT_RELOAD_SECONDS.time():
+        if collection_db.USE_SQLITE:
+            conn = collection_db.thread_connection()
+            # Read version and rows in one transaction so they describe the same state
+            with conn:
+                conn.execute("BEGIN")
+                version = collection_db.current_version(conn)
+                raw = collection_db.load_document(conn)
+        else:
+            with open(path or COLLECTION_PATH, "r", encoding="utf-8") as f:
+                # fstat the open file: the version must describe the bytes we read,
+                # even if the importer replaces the path while we parse
+                version = _version_of(os.fstat(f.fileno()))
+                raw = json.load(f)
+        return CollectionSnapshot(raw, version)
+
+
+def publish_current(path: Optional[str] = None) -> None:
+    """Build and publish the shared snapshot now (writers call this after a run)."""
+    if not SHARED_ENABLED:
+        return
+    with _publish_lock():
+        publish(build_snapshot(path))
+
+
+def _shared_or_build(version: Tuple[int, int, int]) -> CollectionSnapshot:
+    if not SHARED_ENABLED:
+        return build_snapshot()
+    snap = _map_shared(version)
+    if snap is not None:
+        return snap
+    with _publish_lock():
+        snap = _map_shared(version)
+        if snap is not None:
+            return snap
+        snap = build_snapshot()
+        try:
+            publish(snap, encodings=list(REQUEST_PATH_ENCODINGS))
+        except OSError as e:
+            print(f"[WARN] Could not publish shared snapshot {SHARED_PATH}: {e}", file=sys.stderr)
+        return snap
+
+
+def get_snapshot() -> CollectionSnapshot:
+    """
+    Return the snapshot for the current collection.json (or SQLite store),
+    replacing it only if the store changed since the last call. Raises if
+    the file is missing or unparseable (callers turn that into a 500).
+    """
+    global _current
+    version = _store_version()
+    snap = _current
+    if snap is not None and snap.version == version:
+        return snap
+
+    with _lock:
+        # Another thread may have rebuilt while we waited
+        snap = _current
+        if snap is not None and snap.version == version:
+            return snap
+        snap = _shared_or_build(version)
+        _current = _installed(snap)
+        return snap
+
+
+def _installed(snap: CollectionSnapshot) -> CollectionSnapshot:
+    SNAPSHOT_RELOADS.inc()
+    COLLECTION_ALBUMS.set(snap.album_count)
+    return snap
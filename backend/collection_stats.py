@@ -0,0 +1,71 @@
+# backend/collection_stats.py
+"""
+Aggregates for the Report view, backing /api/stats.
+
+Computes the histograms ReportView used to reduce client-side (genre,
+decade, label, year, date added and the genre x decade cross-tab), so the
+report payload no longer grows with the collection. Results are memoized
+per collection version and filter tuple on the snapshot.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from typing import Any, Dict, List
+
+from collection_index import album_year
+
+UNKNOWN = "Unknown"
+
+
+def _names(v: Any) -> List[str]:
+    """Display names for a string-or-list field ('Unknown' when empty)."""
+    if isinstance(v, (list, tuple)):
+        names = [str(x).strip() for x in v if x not in (None, "")]
+    elif v not in (None, ""):
+        names = [str(v).strip()]
+    else:
+        names = []
+    return names or [UNKNOWN]
+
+
+def decade_of(album: Dict) -> str:
+    year = album_year(album)
+    return f"{year // 10 * 10}s" if year else UNKNOWN
+
+
+def compute_stats(albums: List[Dict]) -> Dict[str, Any]:
+    """
+    Histograms over `albums` (already filtered by the caller):
+      total, genre, decade, label, year, date_added (per day) and
+      genre_decade ({genre: {decade: count}}).
+    """
+    genre: Counter = Counter()
+    decade: Counter = Counter()
+    label: Counter = Counter()
+    year: Counter = Counter()
+    added: Counter = Counter()
+    cross: Dict[str, Counter] = {}
+
+    for a in albums:
+        d = decade_of(a)
+        decade[d] += 1
+        y = album_year(a)
+        year[str(y) if y else UNKNOWN] += 1
+        for lbl in _names(a.get("label")):
+            label[lbl] += 1
+        for g in _names(a.get("genre")):
+            genre[g] += 1
+            cross.setdefault(g, Counter())[d] += 1
+        day = str(a.get("date_added") or "")[:10]
+        if day:
+            added[day] += 1
+
+    return {
+        "total": len(albums),
+        "genre": dict(genre.most_common()),
+        "decade": dict(sorted(decade.items())),
+        "label": dict(label.most_common()),
+        "year": dict(sorted(year.items())),
+        "date_added": dict(sorted(added.items())),
+        "genre_decade": {g: dict(sorted(c.items())) for g, c in sorted(cross.items())},
+    }
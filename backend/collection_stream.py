@@ -0,0 +1,219 @@
+# backend/collection_stream.py
+"""
+Incremental reading and writing of collection.json.
+
+json.load() holds the whole document (and the importer/API then build
+several copies of it). AlbumStream instead reads the file in fixed-size
+chunks and yields one album dict at a time, so memory stays proportional to
+the largest album, not the collection:
+
+  stream = AlbumStream(COLLECTION_PATH)
+  for album in stream:
+      ...
+  stream.shape, stream.rest   # ('dict', 'records'), {"owner": ...}
+
+Supported shapes match extract_albums_shape(): a bare list, or a dict whose
+first records/collection/items key holds the album array. Other top-level
+keys are decoded whole and kept in `rest` (available after iteration).
+
+open_album_stream() returns the same interface over the SQLite backend when
+COLLECTION_BACKEND=sqlite.
+
+CollectionWriter is the matching writer: albums are appended one by one to
+a temp file that replaces collection.json on commit(), in the same indented
+format write_collection_atomic() produces.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import collection_db
+
+ALBUM_KEYS = ("records", "collection", "items")
+CHUNK_SIZE = 64 * 1024
+
+_WS = " \t\r\n"
+
+
+class AlbumStream:
+    def __init__(self, path: str, chunk_size: int = CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.shape: Tuple[str, Optional[str]] = ("list", None)
+        self.rest: Dict[str, Any] = {}
+        # Refreshed from the opened file when iteration starts
+        st = os.stat(path)
+        self.version: Tuple[int, int, int] = (st.st_mtime_ns, st.st_size, st.st_ino)
+        self._decoder = json.JSONDecoder()
+        self._f = None
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    # ------------------------------ Buffer ------------------------------
+
+    def _fill(self) -> bool:
+        """Append the next chunk, dropping what was consumed. False at EOF."""
+        if self._eof:
+            return False
+        chunk = self._f.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Next non-whitespace character ('' at EOF), without consuming it."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WS:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, ch: str) -> None:
+        got = self._peek()
+        if got != ch:
+            raise ValueError(f"{self.path}: expected {ch!r}, got {got!r}")
+        self._pos += 1
+
+    def _value(self) -> Any:
+        """Decode the next JSON value, reading more input until it is complete."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number (or literal) ending exactly at the buffer edge may continue
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    # ------------------------------ Parsing ------------------------------
+
+    def _array(self) -> Iterator[Any]:
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("]")
+            return
+
+    def __iter__(self) -> Iterator[Dict]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            self._f = f
+            st = os.fstat(f.fileno())
+            self.version = (st.st_mtime_ns, st.st_size, st.st_ino)
+            first = self._peek()
+            if first == "[":
+                self.shape = ("list", None)
+                yield from self._array()
+            elif first == "{":
+                yield from self._object()
+            else:
+                raise ValueError(f"{self.path}: not a JSON array or object")
+
+    def _object(self) -> Iterator[Dict]:
+        self._expect("{")
+        streamed = False
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if not streamed and key in ALBUM_KEYS and self._peek() == "[":
+                self.shape = ("dict", key)
+                streamed = True
+                yield from self._array()
+            else:
+                self.rest[key] = self._value()
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("}")
+            return
+
+
+class DbAlbumStream:
+    """AlbumStream interface over the SQLite store (rows are read lazily)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.shape, self.rest = collection_db.load_shape(conn)
+        self.version = collection_db.current_version(conn)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return collection_db.iter_albums(self.conn)
+
+
+def open_album_stream(path: str):
+    if collection_db.USE_SQLITE:
+        return DbAlbumStream(collection_db.thread_connection())
+    return AlbumStream(path)
+
+
+def _member(key: str, value: Any) -> str:
+    """'  "key": value' as json.dump(indent=2) lays out a top-level member."""
+    text = json.dumps(value, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+    return "  " + json.dumps(key, ensure_ascii=False) + ": " + text
+
+
+class CollectionWriter:
+    """
+    Write a collection document album by album into `<path>.tmp`, then
+    atomically replace `path` on commit() (abort() discards the temp file).
+    """
+
+    def __init__(self, path: str, shape: Tuple[str, Optional[str]], head: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.shape = shape
+        # Top-level keys that precede the album array (AlbumStream.rest when
+        # the first album is reached); commit() writes the remaining ones
+        self._head = dict(head or {})
+        self._indent = "  " if shape[0] == "list" else "    "
+        self._count = 0
+        self._f = open(self.tmp_path, "w", encoding="utf-8")
+        if shape[0] == "list":
+            self._f.write("[")
+        else:
+            self._f.write("{\n" + "".join(_member(k, v) + ",\n" for k, v in self._head.items())
+                          + "  " + json.dumps(shape[1], ensure_ascii=False) + ": [")
+
+    def write(self, album: Dict) -> None:
+        text = json.dumps(album, ensure_ascii=False, indent=2).replace("\n", "\n" + self._indent)
+        self._f.write(("," if self._count else "") + "\n" + self._indent + text)
+        self._count += 1
+
+    def commit(self, rest: Optional[Dict[str, Any]] = None) -> None:
+        close = "\n" + self._indent[:-2] + "]" if self._count else "]"
+        if self.shape[0] == "dict":
+            for key, value in (rest or {}).items():
+                if key not in self._head:
+                    close += ",\n" + _member(key, value)
+            close += "\n}"
+        self._f.write(close)
+        self._f.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._f.close()
+        try:
+            os.unlink(self.tmp_path)
+        except OSError:
+            pass
@@ -0,0 +1,161 @@
+# backend/collection_sync.py
+"""
+Incremental sync of the Discogs user collection into the collection store.
+
+Pages /users/{user}/collection/folders/0/releases newest-first
+(sort=added, sort_order=desc) and stops at the first instance we already
+have, so a quiet day costs one API call instead of a full walk.
+
+- An album is "known" by its Discogs instance_id. Albums imported before
+  instance ids were stored are matched by release id, and the instance id
+  is backfilled so later syncs match exactly.
+- New instances become albums built from basic_information (artist, title,
+  year, label, format, genre, date_added), prepended newest-first, with
+  their tracklist from the shared release cache.
+- Their images are then fetched by the normal importer pipeline
+  (collection_importer.py --sync), which reuses the cached release payload.
+
+Needs DISCOGS_USER (or a DISCOGS_TOKEN, from which the username is looked
+up once via /oauth/identity).
+"""
+from __future__ import annotations
+
+import os
+import re
+import sys
+from typing import Dict, List, Set, Tuple
+
+import collection_changes
+import collection_db
+import collection_importer
+from collection_importer import extract_albums_shape, load_collection, save_collection, set_albums_back
+from discogs_client import discogs_get
+from fetch_tracklists import fetch_tracklist
+
+DISCOGS_USER = os.environ.get("DISCOGS_USER")
+SYNC_PER_PAGE = int(os.environ.get("DISCOGS_SYNC_PER_PAGE", "50"))
+
+# Discogs disambiguates same-named artists as "Name (2)"
+_DISAMBIGUATION_RE = re.compile(r"\s*\(\d+\)$")
+
+
+def resolve_username() -> str:
+    if DISCOGS_USER:
+        return DISCOGS_USER
+    resp = discogs_get("/oauth/identity")
+    return resp.json()["username"]
+
+
+# ------------------------------ Mapping ------------------------------
+
+def _artist_name(artists: List[Dict]) -> str:
+    parts = []
+    for i, a in enumerate(artists or []):
+        name = _DISAMBIGUATION_RE.sub("", a.get("anv") or a.get("name") or "")
+        parts.append(name)
+        if i < len(artists) - 1:
+            join = (a.get("join") or ",").strip()
+            parts.append(", " if join == "," else f" {join} ")
+    return "".join(parts).strip()
+
+
+def album_from_item(item: Dict) -> Dict:
+    """Collection item (release + instance) -> album record in collection.json's format."""
+    info = item.get("basic_information") or {}
+    labels = info.get("labels") or []
+    formats = info.get("formats") or []
+    album = {
+        "id": item.get("id") or info.get("id"),
+        "instance_id": item.get("instance_id"),
+        "artist": _artist_name(info.get("artists") or []),
+        "title": info.get("title"),
+        "year": info.get("year") or None,
+        "label": _DISAMBIGUATION_RE.sub("", labels[0].get("name", "")) if labels else None,
+        "format": formats[0].get("name") if formats else None,
+        "genre": list(info.get("genres") or []),
+        "date_added": item.get("date_added"),
+    }
+    return {k: v for k, v in album.items() if v not in (None, "")}
+
+
+# ------------------------------ Paging ------------------------------
+
+def fetch_new_items(username: str, known_instances: Set[int], legacy_ids: Set[int],
+                    per_page: int = SYNC_PER_PAGE) -> Tuple[List[Dict], Dict[int, int], int]:
+    """
+    Walk the collection newest-first until the first known item.
+    Returns (new items newest-first, {release_id: instance_id} backfills for
+    legacy albums, pages fetched).
+    """
+    new_items: List[Dict] = []
+    backfill: Dict[int, int] = {}
+    page = 1
+    while True:
+        resp = discogs_get(
+            f"/users/{username}/collection/folders/0/releases",
+            params={"sort": "added", "sort_order": "desc", "per_page": per_page, "page": page},
+        )
+        data = resp.json()
+        for item in data.get("releases") or []:
+            instance_id = item.get("instance_id")
+            rid = item.get("id")
+            if instance_id in known_instances:
+                return new_items, backfill, page
+            if rid in legacy_ids:
+                # Imported before instance ids were kept: same release, assume same copy
+                backfill[rid] = instance_id
+                return new_items, backfill, page
+            new_items.append(item)
+        pages = (data.get("pagination") or {}).get("pages") or page
+        if page >= pages:
+            return new_items, backfill, page
+        page += 1
+
+
+def _with_tracklist(album: Dict) -> Dict:
+    # Goes through the release cache, so the image refresh that follows
+    # reuses this payload instead of calling the API again
+    try:
+        album["tracklist"] = fetch_tracklist(int(album["id"]))
+    except Exception as e:
+        print(f"[WARN] id={album['id']}: tracklist fetch failed: {e}", file=sys.stderr)
+    return album
+
+
+# ------------------------------- Sync -------------------------------
+
+def sync_collection(dry_run: bool = False, per_page: int = SYNC_PER_PAGE) -> List[int]:
+    """
+    Merge instances added on Discogs since the last sync into the store.
+    Returns the release ids of the new albums (for the image refresh).
+    """
+    username = resolve_username()
+    raw = load_collection()
+    albums, shape = extract_albums_shape(raw)
+
+    known_instances = {int(a["instance_id"]) for a in albums if a.get("instance_id")}
+    legacy_ids = {int(a["id"]) for a in albums if a.get("id") and not a.get("instance_id")}
+
+    items, backfill, pages = fetch_new_items(username, known_instances, legacy_ids, per_page)
+    new_albums = [_with_tracklist(album_from_item(item)) for item in items if item.get("id")]
+    print(f"[INFO] Sync for {username}: {len(new_albums)} new album(s) in {pages} page(s)")
+    for album in new_albums:
+        print(f"[NEW] id={album['id']} {album.get('artist', '')} – {album.get('title', '')}")
+
+    if dry_run or not (new_albums or backfill):
+        return [int(a["id"]) for a in new_albums]
+
+    if collection_db.USE_SQLITE:
+        conn = collection_db.thread_connection()
+        with collection_db.batch(conn):  # one version for the whole sync
+            for rid, instance_id in backfill.items():
+                collection_db.update_album_fields(conn, rid, {"instance_id": instance_id})
+            collection_db.insert_albums(conn, new_albums, at_front=True)
+        print(f"[OK] Added {len(new_albums)} album(s) to {collection_db.DB_PATH}")
+    else:
+        for album in albums:
+            if album.get("id") in backfill and not album.get("instance_id"):
+                album["instance_id"] = backfill[album["id"]]
+        save_collection(set_albums_back(raw, new_albums + albums, shape), dry_run=False)
+    collection_changes.record_store(collection_importer.COLLECTION_PATH)
+    return [int(a["id"]) for a in new_albums]
@@ -0,0 +1,201 @@
+# backend/discogs_client.py
+"""
+Shared Discogs HTTP client.
+
+- One pooled keep-alive requests.Session per process (no TLS handshake per call)
+- A token-bucket limiter for API calls, resized from Discogs' own
+  X-Discogs-Ratelimit / X-Discogs-Ratelimit-Remaining response headers
+- Retries on 429/5xx, honoring Retry-After
+
+Image downloads from the CDN (i.discogs.com) share the session but are not
+counted against the API rate limit.
+
+Every entry point (web server, importer, tracklist fetcher) goes through
+get_client() / discogs_get().
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+DISCOGS_API_BASE = os.environ.get("DISCOGS_API_BASE", "https://api.discogs.com").rstrip("/")
+DISCOGS_TOKEN = os.environ.get("DISCOGS_TOKEN")
+USER_AGENT = os.environ.get("DISCOGS_UA", "RecordCollectionApp/1.0 (+https://example.local)")
+
+# Discogs allows 60 req/min authenticated, 25 unauthenticated (moving 60s window)
+DEFAULT_RATE_PER_MIN = 60 if DISCOGS_TOKEN else 25
+POOL_SIZE = int(os.environ.get("DISCOGS_POOL_SIZE", "8"))
+TIMEOUT_SEC = 20
+MAX_RETRIES = 3
+
+# target: "api" (rate limited) or "cdn" (image downloads); one sample per HTTP attempt
+DISCOGS_REQUESTS = metrics.counter("discogs_requests_total", "Discogs HTTP requests by target and status", ["target", "status"])
+DISCOGS_LATENCY = metrics.histogram("discogs_request_duration_seconds", "Discogs HTTP request latency", ["target"])
+DISCOGS_RATELIMIT = metrics.gauge("discogs_ratelimit_limit", "X-Discogs-Ratelimit from the last API response")
+DISCOGS_REMAINING = metrics.gauge("discogs_ratelimit_remaining", "X-Discogs-Ratelimit-Remaining from the last API response")
+
+
+class RateLimiter:
+    """
+    Token bucket: `capacity` tokens refilled at capacity/60 per second.
+    Server headers correct both the capacity and the current level, so the
+    bucket tracks the real remaining budget shared with other processes.
+    """
+
+    def __init__(self, per_minute: float):
+        self._lock = threading.Lock()
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.capacity / 60.0)
+        self._updated = now
+
+    def acquire(self) -> None:
+        """Block until one request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self._blocked_until - now, (1 - self.tokens) * 60.0 / self.capacity)
+            time.sleep(wait)
+
+    def update_from_headers(self, headers) -> None:
+        try:
+            limit = int(headers.get("X-Discogs-Ratelimit", "") or 0)
+            remaining = headers.get("X-Discogs-Ratelimit-Remaining")
+            remaining = int(remaining) if remaining not in (None, "") else None
+        except ValueError:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            if limit > 0:
+                self.capacity = float(limit)
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds` (e.g. after a 429)."""
+        with self._lock:
+            self.tokens = 0.0
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._updated = time.monotonic()
+
+
+def _record_rate_headers(headers) -> None:
+    for header, gauge in (("X-Discogs-Ratelimit", DISCOGS_RATELIMIT),
+                          ("X-Discogs-Ratelimit-Remaining", DISCOGS_REMAINING)):
+        try:
+            gauge.set(int(headers[header]))
+        except (KeyError, TypeError, ValueError):
+            pass
+
+
+def _retry_after(resp: requests.Response, attempt: int) -> float:
+    value = resp.headers.get("Retry-After")
+    try:
+        return max(float(value), 1.0)
+    except (TypeError, ValueError):
+        return float(min(60, 2 ** (attempt + 1)))
+
+
+class DiscogsClient:
+    def __init__(self, token: Optional[str] = DISCOGS_TOKEN, user_agent: str = USER_AGENT,
+                 per_minute: float = DEFAULT_RATE_PER_MIN, api_base: str = DISCOGS_API_BASE):
+        self.token = token
+        self.api_base = api_base
+        self._api_host = urlsplit(api_base).netloc
+        self.limiter = RateLimiter(per_minute)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = user_agent
+
+    def _is_api(self, url: str) -> bool:
+        return urlsplit(url).netloc == self._api_host
+
+    def _auth_headers(self, url: str) -> Dict[str, str]:
+        host = urlsplit(url).netloc
+        if self.token and (host == self._api_host or host.endswith("discogs.com")):
+            return {"Authorization": f"Discogs token={self.token}"}
+        return {}
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, **kwargs) -> requests.Response:
+        """
+        GET with pooling, rate limiting (API host only) and retries on 429/5xx.
+        Raises for HTTP errors once retries are exhausted (like the old
+        _discogs_get). 304 responses are returned, not raised.
+        """
+        if not url.startswith(("http://", "https://")):
+            url = f"{self.api_base}/{url.lstrip('/')}"
+        is_api = self._is_api(url)
+        req_headers = self._auth_headers(url)
+        req_headers.update(headers or {})
+        kwargs.setdefault("timeout", TIMEOUT_SEC)
+
+        attempt = 0
+        while True:
+            if is_api:
+                self.limiter.acquire()
+            target = "api" if is_api else "cdn"
+            t0 = time.perf_counter()
+            try:
+                resp = self.session.get(url, headers=req_headers, **kwargs)
+            except requests.RequestException:
+                DISCOGS_REQUESTS.labels(target=target, status="error").inc()
+                raise
+            finally:
+                DISCOGS_LATENCY.labels(target=target).observe(time.perf_counter() - t0)
+            DISCOGS_REQUESTS.labels(target=target, status=str(resp.status_code)).inc()
+            if is_api:
+                self.limiter.update_from_headers(resp.headers)
+                _record_rate_headers(resp.headers)
+
+            retryable = resp.status_code == 429 or resp.status_code >= 500
+            if retryable and attempt < MAX_RETRIES:
+                wait = _retry_after(resp, attempt)
+                if resp.status_code == 429 and is_api:
+                    self.limiter.pause(wait)
+                else:
+                    time.sleep(wait)
+                attempt += 1
+                continue
+
+            resp.raise_for_status()
+            return resp
+
+    def release_url(self, release_id: int) -> str:
+        return f"{self.api_base}/releases/{release_id}"
+
+
+_client: Optional[DiscogsClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> DiscogsClient:
+    """The process-wide client (one connection pool, one rate budget)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DiscogsClient()
+    return _client
+
+
+def discogs_get(url: str, **kwargs) -> requests.Response:
+    return get_client().get(url, **kwargs)
@@ -1,59 +1,160 @@
-import json
-import time
-import requests
-
-DISCOGS_TOKEN = "YOUR_DISCOGS_TOKEN"
-
-def fetch_tracklist(release_id):
-    url = f"https://api.discogs.com/releases/{release_id}"
-    headers = {
-        "User-Agent": "record-collection-app/1.0",
-        "Authorization": f"Discogs token={DISCOGS_TOKEN}",
-    }
-    response = requests.get(url, headers=headers)
-    # If we exceed the rate limit, raise an HTTPError so the caller can handle it
-    response.raise_for_status()
-    data = response.json()
+# backend/fetch_tracklists.py
+"""
+Tracklist backfill stage for collection.json.
+
+- Reads backend/collection.json in any supported shape (bare list, or a dict
+  with a records/collection/items array), like collection_importer.py.
+- Fetches tracklists concurrently through the shared release cache and
+  Discogs client, so throughput is bounded by the API rate limit, not sleeps.
+- Flushes completed tracklists to collection.json atomically every
+  --flush-every albums, so an interrupted run keeps its progress.
+- By default only albums without a tracklist are fetched. --since limits the
+  run to albums added on/after a date; --refresh revalidates releases that
+  already have tracklists (conditional requests) and writes only changes.
+- With COLLECTION_BACKEND=sqlite each tracklist is written to its own row as
+  it arrives instead of flushing the whole file; the web server sees a new
+  collection version every --flush-every albums, not per row.
+
+Usage examples:
+  python3 fetch_tracklists.py
+  python3 fetch_tracklists.py --workers 4
+  python3 fetch_tracklists.py --since 2024-01-01
+  python3 fetch_tracklists.py --refresh --since 2024-01-01
+  python3 fetch_tracklists.py --ids 1626692 --dry-run
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+
+import collection_changes
+import collection_db
+import collection_importer
+from collection_importer import extract_albums_shape, load_collection, set_albums_back
+from release_cache import DEFAULT_MAX_AGE_SEC, get_release
+
+DEFAULT_WORKERS = int(os.environ.get("TRACKLIST_WORKERS", "4"))
+DEFAULT_FLUSH_EVERY = 100
+
+
+def fetch_tracklist(release_id: int, max_age: float = DEFAULT_MAX_AGE_SEC) -> List[Optional[str]]:
+    # Read through the shared release cache (a release already fetched for
+    # its images costs no API call); misses go through the pooled,
+    # rate-limited Discogs client, so no sleeps are needed here
+    data = get_release(release_id, max_age=max_age)
     return [track.get("title") for track in data.get("tracklist", [])]
 
-def main():
-    with open("collection.json", "r") as f:
-        albums = json.load(f)
 
+def select_albums(albums: List[Dict], refresh: bool = False, since: str | None = None,
+                  ids: List[str] | None = None) -> List[Dict]:
+    """Albums this run should (re)fetch."""
+    idset = {int(x) for x in ids or [] if str(x).isdigit()}
+    selected = []
     for album in albums:
-        # Only fetch if there's no tracklist or it's empty
-        if not album.get("tracklist"):
-            release_id = album["id"]
-            retries = 0
-            while retries < 3:
-                try:
-                    album["tracklist"] = fetch_tracklist(release_id)
-                    print(f"Fetched {len(album['tracklist'])} tracks for {album['title']}")
-                    break  # Success, break out of retry loop
-                except requests.exceptions.HTTPError as e:
-                    if e.response.status_code == 429:
-                        # Too many requests: respect Retry-After header if present, else sleep 60s
-                        retry_after = int(e.response.headers.get("Retry-After", "60"))
-                        wait_time = max(retry_after, 5)
-                        print(
-                            f"Rate limit hit (429) while fetching {release_id}, "
-                            f"sleeping for {wait_time} seconds..."
-                        )
-                        time.sleep(wait_time)
-                        retries += 1
-                        continue
-                    else:
-                        # Other HTTP errors should be logged and break
-                        print(f"Failed to fetch tracklist for {release_id}: {e}")
-                        break
-                except Exception as e:
-                    print(f"Unexpected error fetching {release_id}: {e}")
-                    break
-            # Always sleep 1 second between attempts to avoid hitting the rate limit too quickly
-            time.sleep(1)
-
-    with open("collection.json", "w") as f:
-        json.dump(albums, f, indent=2)
+        if not album.get("id"):
+            continue
+        if idset and int(album["id"]) not in idset:
+            continue
+        if since and str(album.get("date_added") or "") < since:
+            continue
+        if album.get("tracklist") and not refresh:
+            continue
+        selected.append(album)
+    return selected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill Discogs tracklists into collection.json")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Concurrent fetches (default {DEFAULT_WORKERS})")
+    parser.add_argument("--since", help="Only albums with date_added on/after this date (YYYY-MM-DD)")
+    parser.add_argument("--refresh", action="store_true", help="Revalidate albums that already have a tracklist; write only changes")
+    parser.add_argument("--ids", nargs="*", help="Only process these release IDs")
+    parser.add_argument("--limit", type=int, default=0, help="Max number of albums to process (0 = all)")
+    parser.add_argument("--flush-every", type=int, default=DEFAULT_FLUSH_EVERY, help=f"Write progress every N updated albums (default {DEFAULT_FLUSH_EVERY})")
+    parser.add_argument("--dry-run", action="store_true", help="Do not write collection.json; just log actions")
+    args = parser.parse_args()
+
+    raw = load_collection()
+    albums, shape = extract_albums_shape(raw)
+    if not albums:
+        print("[ERROR] No albums found in collection.json (expected list or records/collection/items array).", file=sys.stderr)
+        sys.exit(1)
+
+    work = select_albums(albums, refresh=args.refresh, since=args.since, ids=args.ids)
+    if args.limit:
+        work = work[:args.limit]
+    total = len(work)
+    # --refresh forces a (conditional) revalidation of each cached release
+    max_age = 0 if args.refresh else DEFAULT_MAX_AGE_SEC
+    print(f"[INFO] Fetching tracklists for {total} album(s) with {max(1, args.workers)} worker(s)"
+          f"{' (dry-run)' if args.dry_run else ''}...")
+
+    updated = 0
+    unchanged = 0
+    errors = 0
+    pending_flush = 0
+    backed_up = False
+    db = collection_db.thread_connection() if collection_db.USE_SQLITE and not args.dry_run else None
+
+    def flush() -> None:
+        nonlocal pending_flush, backed_up
+        if args.dry_run or not pending_flush:
+            return
+        if db_batch is not None:
+            # Rows are committed as they arrive; readers see them as one new version
+            db_batch.flush()
+            pending_flush = 0
+            return
+        data = set_albums_back(raw, albums, shape)
+        if not backed_up:
+            # First write of the run keeps the usual timestamped backup
+            collection_importer.save_collection(data, dry_run=False)
+            backed_up = True
+        else:
+            collection_importer.write_collection_atomic(data)
+            print(f"[OK] Flushed {updated} tracklist(s) to collection.json")
+        pending_flush = 0
+
+    db_batch = collection_db.batch(db) if db is not None else None
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool, (db_batch or nullcontext()):
+        futures = {
+            pool.submit(fetch_tracklist, int(album["id"]), max_age): (idx, album)
+            for idx, album in enumerate(work, start=1)
+        }
+        for fut in as_completed(futures):
+            idx, album = futures[fut]
+            prefix = f"[{idx}/{total}] id={album['id']} {album.get('title', '')}".strip()
+            try:
+                tracklist = fut.result()
+            except Exception as e:
+                errors += 1
+                print(f"{prefix}: ERROR: {e}", file=sys.stderr)
+                continue
+
+            # Results are applied on this thread only; workers just fetch
+            if tracklist == album.get("tracklist"):
+                unchanged += 1
+                continue
+            album["tracklist"] = tracklist
+            updated += 1
+            pending_flush += 1
+            print(f"{prefix}: {len(tracklist)} track(s)")
+            if db is not None:
+                collection_db.update_album_fields(db, int(album["id"]), {"tracklist": tracklist})
+            if args.flush_every and pending_flush >= args.flush_every:
+                flush()
+
+        flush()
+    if not args.dry_run:
+        collection_changes.record_store(collection_importer.COLLECTION_PATH)
+    if args.dry_run and updated:
+        print("[DRY-RUN] Changes not written.")
+    print(f"[SUMMARY] updated={updated} unchanged={unchanged} errors={errors}")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,27 @@
+# backend/gunicorn.conf.py
+"""
+gunicorn settings for `gunicorn -c gunicorn.conf.py wsgi:app` (see wsgi.py).
+Every value can be overridden from the environment.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+
+# One process per core (a Pi 4 has four); threads per worker keep a slow
+# Discogs miss from blocking the other requests that worker is serving
+workers = int(os.environ.get("GUNICORN_WORKERS", str(min(4, multiprocessing.cpu_count()))))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+
+# Cold covers wait at most PREFETCH_WAIT_SEC; streamed collections can take longer
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+# Workers import the app themselves: background threads and SQLite
+# connections must not be created before the fork
+preload_app = False
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
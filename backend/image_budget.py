@@ -0,0 +1,224 @@
+# backend/image_budget.py
+"""
+Disk budget for images/ with least-recently-served eviction.
+
+Set IMAGE_CACHE_MAX_BYTES (0 = unlimited, the default). Once the files
+under images/ (blobs, derived sizes, legacy cover_/back_ files) exceed it,
+files are removed in this order, least recently served first in each tier:
+
+  0. orphans: blobs no image points at (e.g. replaced by --force) and
+     derived sizes whose original is gone
+  1. derived sizes (regenerated on the next ?w= / thumb request)
+  2. back images
+  3. covers of releases no longer in the collection
+
+Covers of the current collection are pinned and never evicted.
+
+Access time is the file's atime, set explicitly with os.utime() when a file
+is served (at most once per IMAGE_ATIME_RESOLUTION_SEC, so the SD card is
+not written on every request). It works on noatime mounts and is shared by
+the web server and the importer.
+
+Evicted files are recorded in the manifest (see ImageIndex.unassign_blob):
+/cover/<id> and /back/<id> fetch them again, and a stored /images/... URL
+of an evicted file redirects there.
+
+The web server enforces the budget in the background when its own writes
+push usage over it; collection_importer.py enforces it once at the end of
+a run.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+import metrics
+from image_index import BLOBS_DIR, EXT_PRIORITY, ImageIndex, parse_image_name
+
+MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", "0"))
+ATIME_RESOLUTION_SEC = float(os.environ.get("IMAGE_ATIME_RESOLUTION_SEC", "3600"))
+# Files written this recently may not be in the manifest yet
+MIN_AGE_SEC = 60.0
+
+DERIVED_DIR = "derived"
+
+ORPHAN, DERIVED, BACK, COVER = 0, 1, 2, 3
+TIER_NAMES = ("orphan", "derived", "back", "cover")
+
+IMAGE_CACHE_BYTES = metrics.gauge("image_cache_bytes", "Bytes under images/ as of the last scan or write")
+IMAGE_EVICTIONS = metrics.counter("image_cache_evictions_total", "Cached image files evicted by the disk budget", ["tier"])
+
+
+class Entry:
+    __slots__ = ("filename", "size", "atime", "mtime")
+
+    def __init__(self, filename: str, size: int, atime: float, mtime: float):
+        self.filename = filename
+        self.size = size
+        self.atime = atime
+        self.mtime = mtime
+
+
+def _is_image(name: str) -> bool:
+    return name.rsplit(".", 1)[-1].lower() in EXT_PRIORITY
+
+
+def scan(directory: str) -> List[Entry]:
+    """Every image file under `directory` (top level, blobs/, derived/)."""
+    entries: List[Entry] = []
+    for sub in ("", BLOBS_DIR, DERIVED_DIR):
+        try:
+            with os.scandir(os.path.join(directory, sub)) as it:
+                for e in it:
+                    if e.is_file() and _is_image(e.name) and not e.name.startswith("."):
+                        st = e.stat()
+                        name = f"{sub}/{e.name}" if sub else e.name
+                        entries.append(Entry(name, st.st_size, st.st_atime, st.st_mtime))
+        except FileNotFoundError:
+            continue
+    return entries
+
+
+def _stem(filename: str) -> str:
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def classify(entries: Iterable[Entry], images: dict, pinned: Set[int]) -> List[Tuple[int, Entry]]:
+    """
+    (tier, entry) for every evictable entry; pinned covers are left out.
+    `images` is the manifest's "kind:release_id" -> blob map.
+    """
+    entries = list(entries)
+    users: dict = {}
+    for key, blob in images.items():
+        kind, _, rid = key.partition(":")
+        users.setdefault(blob, []).append((kind, int(rid)))
+    originals = {_stem(e.filename) for e in entries if not e.filename.startswith(f"{DERIVED_DIR}/")}
+
+    tiers: List[Tuple[int, Entry]] = []
+    for e in entries:
+        if e.filename.startswith(f"{DERIVED_DIR}/"):
+            # derived/<original stem>_w<width>.<ext>
+            tiers.append((DERIVED if _stem(e.filename).rsplit("_w", 1)[0] in originals else ORPHAN, e))
+            continue
+        used_by = list(users.get(e.filename, []))
+        parsed = parse_image_name(e.filename)
+        if parsed:
+            used_by.append(parsed[:2])
+        if not used_by:
+            tiers.append((ORPHAN, e))
+        elif any(kind == "cover" and rid in pinned for kind, rid in used_by):
+            continue
+        elif all(kind == "back" for kind, _ in used_by):
+            tiers.append((BACK, e))
+        else:
+            tiers.append((COVER, e))
+    return tiers
+
+
+def plan_eviction(entries: List[Entry], images: dict, pinned: Set[int], max_bytes: int,
+                  now: Optional[float] = None) -> List[Tuple[int, Entry]]:
+    """The (tier, entry) pairs to delete to get total size under max_bytes."""
+    now = time.time() if now is None else now
+    excess = sum(e.size for e in entries) - max_bytes
+    if excess <= 0:
+        return []
+    candidates = [(t, e) for t, e in classify(entries, images, pinned) if now - e.mtime >= MIN_AGE_SEC]
+    candidates.sort(key=lambda te: (te[0], te[1].atime))
+    plan = []
+    for tier, e in candidates:
+        if excess <= 0:
+            break
+        plan.append((tier, e))
+        excess -= e.size
+    return plan
+
+
+class DiskBudget:
+    """
+    Tracks usage of one image directory and evicts down to max_bytes.
+    `pinned` returns the release ids whose covers must stay; automatic
+    enforcement after writes only runs once it is set (an importer run has
+    no collection snapshot, so it calls enforce() itself at the end).
+    """
+
+    def __init__(self, directory: str, index: ImageIndex, max_bytes: int = MAX_BYTES,
+                 pinned: Optional[Callable[[], Set[int]]] = None):
+        self.directory = directory
+        self.index = index
+        self.max_bytes = max_bytes
+        self.pinned = pinned
+        self._lock = threading.Lock()
+        self._usage: Optional[int] = None
+        self._running = False
+
+    # ------------------------------ Access time ------------------------------
+
+    def touch(self, filename: str) -> None:
+        """Mark a cached file as just served (atime only; mtime drives variant freshness)."""
+        if not self.max_bytes:
+            return
+        path = os.path.join(self.directory, filename)
+        try:
+            st = os.stat(path)
+            now = time.time()
+            if now - st.st_atime >= ATIME_RESOLUTION_SEC:
+                os.utime(path, ns=(int(now * 1e9), st.st_mtime_ns))
+        except OSError:
+            pass
+
+    # ------------------------------ Enforcement ------------------------------
+
+    def note_written(self, nbytes: int) -> None:
+        """Account for a file this process wrote; evict in the background if over budget."""
+        if not self.max_bytes:
+            return
+        with self._lock:
+            if self._usage is None:
+                self._usage = sum(e.size for e in scan(self.directory))
+            else:
+                self._usage += nbytes
+            IMAGE_CACHE_BYTES.set(self._usage)
+            if self._usage <= self.max_bytes or self._running or self.pinned is None:
+                return
+            self._running = True
+        threading.Thread(target=self._enforce_in_background, name="image-budget", daemon=True).start()
+
+    def _enforce_in_background(self) -> None:
+        try:
+            self.enforce(self.pinned())
+        except Exception as e:
+            print(f"[WARN] Image cache eviction failed: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._running = False
+
+    def enforce(self, pinned: Iterable[int]) -> Tuple[int, int]:
+        """Evict until usage <= max_bytes. Returns (files removed, bytes freed)."""
+        if not self.max_bytes:
+            return 0, 0
+        entries = scan(self.directory)
+        plan = plan_eviction(entries, self.index.images(), {int(r) for r in pinned}, self.max_bytes)
+
+        removed = freed = 0
+        for tier, e in plan:
+            if not e.filename.startswith(f"{DERIVED_DIR}/"):
+                # Manifest first: a lookup never returns a file that is gone
+                self.index.unassign_blob(e.filename)
+            try:
+                os.unlink(os.path.join(self.directory, e.filename))
+            except FileNotFoundError:
+                pass
+            IMAGE_EVICTIONS.labels(tier=TIER_NAMES[tier]).inc()
+            removed += 1
+            freed += e.size
+        with self._lock:
+            self._usage = sum(e.size for e in entries) - freed
+            IMAGE_CACHE_BYTES.set(self._usage)
+            if self._usage > self.max_bytes:
+                print(f"[WARN] Image cache still {self._usage} bytes (budget {self.max_bytes}); "
+                      f"the rest is pinned or too new to evict", file=sys.stderr)
+        return removed, freed
@@ -1,7 +1,19 @@
 # backend/image_cache.py
+import fcntl
+import hashlib
 import os
+import tempfile
+import threading
+from contextlib import contextmanager
 import requests
-from typing import Optional, Tuple, List
+from typing import Any, Callable, Dict, Optional, Tuple, List
+
+import metrics
+from discogs_client import discogs_get
+from image_budget import DiskBudget
+from image_index import BLOBS_DIR, ImageIndex
+from negative_cache import NegativeCache, NO_BACK, NO_COVER, ERROR
+from release_cache import get_release
 
 # --------------------------- Paths & constants ---------------------------
 
@@ -9,12 +21,20 @@ HERE = os.path.dirname(__file__)
 CACHE_DIR = os.path.join(HERE, "images")
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+# (kind, release_id) -> cached filename, shared by the server and the importer
+image_index = ImageIndex(CACHE_DIR)
+
+# IMAGE_CACHE_MAX_BYTES budget for CACHE_DIR (see image_budget.py)
+disk_budget = DiskBudget(CACHE_DIR, image_index)
+
+# Remembers releases with no back/cover image and upstream failures (with backoff)
+negative_cache = NegativeCache(os.path.join(CACHE_DIR, "negative_cache.json"))
+
 # IMPORTANT: absolute path so it works from any route (/list, /report, etc.)
 FALLBACK_IMAGE = "/static/fallback.jpg"
 
-# Discogs API configuration (set in your environment)
-DISCOGS_TOKEN = os.environ.get("DISCOGS_TOKEN")
-USER_AGENT = os.environ.get("DISCOGS_UA", "RecordCollectionApp/1.0 (+https://example.local)")
+IMAGE_LOOKUPS = metrics.counter("image_cache_lookups_total", "Release image lookups on the request path by result", ["result"])
+IMAGE_FALLBACKS = metrics.counter("image_cache_fallbacks_total", "Release image lookups answered with the fallback cover")
 
 # For content-type → extension mapping
 _EXT_BY_CTYPE = [
@@ -30,27 +50,118 @@ _EXT_BY_CTYPE = [
 def _abs_path_for(filename: str) -> str:
     return os.path.join(CACHE_DIR, filename)
 
-def _exists(filename: str) -> bool:
-    return os.path.exists(_abs_path_for(filename))
-
 def _save_bytes(filename: str, content: bytes) -> None:
-    with open(_abs_path_for(filename), "wb") as f:
-        f.write(content)
+    """
+    Write atomically: readers (and concurrent writers of the same file) only
+    ever see a complete image, never a partially written one.
+    """
+    os.makedirs(os.path.dirname(_abs_path_for(filename)), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=".tmp-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)  # mkstemp creates 0600; the web server must read it
+        os.replace(tmp_path, _abs_path_for(filename))
+        image_index.record(filename)
+        disk_budget.note_written(len(content))
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+# ---------------------------- Single-flight ------------------------------
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key: the first caller runs the
+    function, everyone arriving while it runs waits for and shares its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, _Call] = {}
+
+    def do(self, key: Any, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+# One in-flight fetch per release id (cover, back and legacy thumb routes share it)
+_release_flights = SingleFlight()
+
+
+# --------------------------- Cross-process lock ---------------------------
+
+_lock_files: Dict[Tuple[int, str], int] = {}
+_lock_files_guard = threading.Lock()
+
+
+def _lock_fd() -> int:
+    # One descriptor per process: closing any descriptor of the file would drop
+    # all of this process's record locks on it. Keyed by pid for forked workers.
+    path = os.path.join(CACHE_DIR, ".fetch.lock")
+    key = (os.getpid(), path)
+    with _lock_files_guard:
+        fd = _lock_files.get(key)
+        if fd is None:
+            fd = _lock_files[key] = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        return fd
+
+
+@contextmanager
+def release_fetch_lock(release_id: int):
+    """
+    Exclusive across processes (server workers, importer) for one release:
+    a one-byte record lock at offset `release_id` of images/.fetch.lock.
+    Record locks belong to the process, so threads rely on _release_flights
+    to never take the same release twice.
+    """
+    fd = _lock_fd()
+    fcntl.lockf(fd, fcntl.LOCK_EX, 1, int(release_id))
+    try:
+        yield
+    finally:
+        fcntl.lockf(fd, fcntl.LOCK_UN, 1, int(release_id))
 
 
 # ----------------------------- Discogs helpers ---------------------------
 
 def _discogs_get(url: str) -> requests.Response:
     """
-    GET a URL from Discogs with auth headers (if provided) and a UA.
-    Raises for HTTP errors.
+    GET a URL from Discogs through the shared pooled, rate-limited client
+    (auth headers and UA included). Raises for HTTP errors.
     """
-    headers = {"User-Agent": USER_AGENT}
-    if DISCOGS_TOKEN:
-        headers["Authorization"] = f"Discogs token={DISCOGS_TOKEN}"
-    resp = requests.get(url, headers=headers, timeout=20)
-    resp.raise_for_status()
-    return resp
+    return discogs_get(url)
 
 def _choose_images_from_release_payload(images: List[dict]) -> Tuple[Optional[str], Optional[str]]:
     """
@@ -93,64 +204,133 @@ def _infer_ext_from_headers(resp: requests.Response) -> str:
     # Fallback default
     return "jpg"
 
-def _download_to_cache(url: Optional[str], filename_base: str) -> Optional[str]:
+def _download_to_cache(url: Optional[str], kind: str, release_id: int) -> Optional[str]:
     """
-    Download an image and store it in CACHE_DIR as <filename_base>.<ext>.
-    Returns the public '/images/<file>' path on success, else None.
+    Download an image into the content-addressed store
+    (CACHE_DIR/blobs/<sha256>.<ext>) and point (kind, release_id) at it.
+    Identical artwork (e.g. shared by several pressings) is stored once, and
+    a source URL seen before is not downloaded again.
+    Returns the public '/images/blobs/<file>' path on success, else None.
     """
     if not url:
         return None
-    resp = _discogs_get(url)
-    ext = _infer_ext_from_headers(resp)
-    filename = f"{filename_base}.{ext}"
-    _save_bytes(filename, resp.content)
-    return f"/images/{filename}"
+    blob = image_index.blob_for_source(url)
+    if not blob or not os.path.exists(_abs_path_for(blob)):
+        resp = _discogs_get(url)
+        ext = _infer_ext_from_headers(resp)
+        blob = f"{BLOBS_DIR}/{hashlib.sha256(resp.content).hexdigest()}.{ext}"
+        if not os.path.exists(_abs_path_for(blob)):
+            _save_bytes(blob, resp.content)
+    image_index.assign(kind, release_id, blob, source_url=url)
+    return f"/images/{blob}"
 
 
 # ------------------------- Public: ensure images -------------------------
 
-def ensure_release_images(release_id: int) -> Tuple[str, Optional[str]]:
+def cached_image_url(kind: str, release_id: int) -> Optional[str]:
+    """Public '/images/<file>' URL of a cached 'cover'/'back' image, else None (no stat calls)."""
+    filename = image_index.lookup(kind, release_id)
+    return f"/images/{filename}" if filename else None
+
+
+def ensure_release_images(release_id: int, record_metrics: bool = True) -> Tuple[str, Optional[str]]:
     """
     Ensure (cover, back) images for a Discogs release exist locally.
     Returns tuple of public URLs: (cover_url, back_url_or_None).
     - If already cached, returns cached paths immediately.
     - Otherwise fetches from Discogs, caches, and returns the new paths.
+      Concurrent misses for the same release share a single fetch, also
+      across processes (release_fetch_lock).
+    - Releases known to lack an image, or failing upstream (within their
+      backoff window), are answered from the negative cache without a fetch.
+    - record_metrics=False keeps background fetches (prefetch queue) out of
+      the hit/miss counters, which describe what requests saw.
     """
-    cover_base = f"cover_{release_id}"
-    back_base = f"back_{release_id}"
+    known = lookup_release_images(release_id)
+    if known is not None:
+        if record_metrics:
+            record_lookup(known, "hit" if known[0] != FALLBACK_IMAGE else "negative")
+        return known
+    result = _release_flights.do(release_id, lambda: _fetch_release_images_locked(release_id))
+    if record_metrics:
+        record_lookup(result, "miss")
+    return result
 
-    # Check for existing cached files (any supported extension)
-    def _first_existing(base: str) -> Optional[str]:
-        for ext in ("jpg", "jpeg", "png", "webp"):
-            f = f"{base}.{ext}"
-            if _exists(f):
-                return f"/images/{f}"
-        return None
 
-    cover_url = _first_existing(cover_base)
-    back_url = _first_existing(back_base)
+def record_lookup(urls: Tuple[str, Optional[str]], result: str) -> None:
+    """Count one request-path lookup: 'hit', 'negative' (no fetch needed, nothing cached) or 'miss'."""
+    IMAGE_LOOKUPS.labels(result=result).inc()
+    if urls[0] == FALLBACK_IMAGE:
+        IMAGE_FALLBACKS.inc()
 
+
+def lookup_release_images(release_id: int) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    Cache-only variant of ensure_release_images(): the (cover, back) URLs when
+    no fetch is needed (cached, or answered by the negative cache), else None.
+    Never touches the network.
+    """
+    cover_url = cached_image_url("cover", release_id)
+    back_url = cached_image_url("back", release_id)
     if cover_url and back_url:
         return cover_url, back_url
-    if cover_url and not back_url:
-        # We still try to find a back image; if none, we'll return cover as fallback in main.py
-        pass
+    if _nothing_to_fetch(release_id, cover_url, back_url):
+        return cover_url or FALLBACK_IMAGE, back_url
+    return None
+
+
+def _nothing_to_fetch(release_id: int, cover_url: Optional[str], back_url: Optional[str]) -> bool:
+    if negative_cache.is_suppressed(release_id, ERROR):
+        return True
+    cover_done = bool(cover_url) or negative_cache.is_suppressed(release_id, NO_COVER)
+    # An evicted back is only fetched again when /back/<id> asks for it
+    back_done = (bool(back_url) or negative_cache.is_suppressed(release_id, NO_BACK)
+                 or image_index.is_evicted("back", release_id))
+    return cover_done and back_done
 
-    # Fetch release payload to discover image URLs
+
+def _fetch_release_images_locked(release_id: int) -> Tuple[str, Optional[str]]:
+    with release_fetch_lock(release_id):
+        # Another process may have fetched it while we waited for the lock
+        image_index.refresh()
+        return _fetch_release_images(release_id)
+
+
+def _fetch_release_images(release_id: int) -> Tuple[str, Optional[str]]:
+    # Re-check: a flight that just finished may have filled the cache
+    cover_url = cached_image_url("cover", release_id)
+    back_url = cached_image_url("back", release_id)
+
+    if cover_url and back_url:
+        return cover_url, back_url
+    if _nothing_to_fetch(release_id, cover_url, back_url):
+        return cover_url or FALLBACK_IMAGE, back_url
+
+    # Release payload (shared on-disk cache) tells us the image URLs
     try:
-        release_api = f"https://api.discogs.com/releases/{release_id}"
-        rel = _discogs_get(release_api).json()
+        rel = get_release(release_id)
         images = rel.get("images", []) or []
     except Exception:
-        # Network/API error: return what we have (or fallback)
+        # Network/API error: back off, and return what we have (or fallback)
+        negative_cache.record_failure(release_id)
         return cover_url or FALLBACK_IMAGE, back_url
 
     front_src, back_src = _choose_images_from_release_payload(images)
 
-    if not cover_url:
-        cover_url = _download_to_cache(front_src, cover_base) or FALLBACK_IMAGE
-    if not back_url and back_src:
-        back_url = _download_to_cache(back_src, back_base)
+    try:
+        if not cover_url:
+            cover_url = _download_to_cache(front_src, "cover", release_id)
+        if not back_url and back_src:
+            back_url = _download_to_cache(back_src, "back", release_id)
+    except Exception:
+        negative_cache.record_failure(release_id)
+        raise
+
+    negative_cache.clear(release_id, ERROR)
+    if not front_src:
+        negative_cache.record_missing(release_id, NO_COVER)
+    if not back_src:
+        negative_cache.record_missing(release_id, NO_BACK)
 
     return cover_url or FALLBACK_IMAGE, back_url
 
@@ -163,7 +343,7 @@ def normalize_album_paths(album: dict) -> dict:
     Strategy:
       - If album has an 'id', prefer our self-healing endpoints '/cover/:id' and '/back/:id'
       - Absolutize any relative paths (prefix '/')
-      - Rewrite legacy 'thumb' / 'back_thumb' to '/cover/:id' and '/back/:id'
+      - Rewrite legacy 'thumb' / 'back_thumb' to '/cover/:id/thumb' and '/back/:id/thumb'
       - Guarantee a 'cover_image' (fallback if necessary)
     """
     rid = album.get("id")
@@ -187,11 +367,11 @@ def normalize_album_paths(album: dict) -> dict:
         else:
             album["back_image"] = f"/back/{rid}"
 
-        # Legacy fields → rewrite to id-based endpoints
+        # Legacy fields → rewrite to id-based thumbnail endpoints
         if album.get("thumb"):
-            album["thumb"] = f"/cover/{rid}"
+            album["thumb"] = f"/cover/{rid}/thumb"
         if album.get("back_thumb"):
-            album["back_thumb"] = f"/back/{rid}"
+            album["back_thumb"] = f"/back/{rid}/thumb"
     else:
         # No id: just absolutize anything present
         for f in ("cover_image", "thumb", "back_image", "back_thumb"):
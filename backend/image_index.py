@@ -0,0 +1,380 @@
+# backend/image_index.py
+"""
+In-memory index of cached release images: (kind, release_id) -> filename.
+
+Replaces per-request os.path.exists probing (up to 4 extensions x cover/back)
+with dict lookups:
+- built with a single os.scandir of images/
+- updated in place whenever this process writes an image
+- legacy files rescanned when the directory's mtime changes, manifest
+  changes read from the tail of its journal; both checked at most once per
+  REFRESH_INTERVAL_SEC
+
+Images are stored content-addressed (blobs/<sha256>.<ext>, shared by every
+release with the same artwork); manifest.json maps "kind:release_id" to its
+blob and remembers which source URL produced which blob. Legacy
+cover_<id>.<ext> / back_<id>.<ext> files are still found by the scan.
+Blobs removed by the disk budget (image_budget.py) are listed under
+"evicted" with the images that used them, so their URLs can self-heal.
+
+Writers append to manifest.log instead of rewriting manifest.json, under a
+flock on manifest.lock shared by every process; the log is folded into
+manifest.json once it outgrows it (see the Manifest section).
+"""
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+
+# Same preference order the old probing loops used
+EXT_PRIORITY = ("jpg", "jpeg", "png", "webp")
+
+REFRESH_INTERVAL_SEC = float(os.environ.get("IMAGE_INDEX_REFRESH_SEC", "1.0"))
+
+MANIFEST_NAME = "manifest.json"
+JOURNAL_NAME = "manifest.log"
+LOCK_NAME = "manifest.lock"
+# The journal is compacted once it has more lines than this and than the manifest has images
+COMPACT_MIN_LINES = 1000
+BLOBS_DIR = "blobs"
+
+_NAME_RE = re.compile(r"^(cover|back)_(\d+)\.(jpg|jpeg|png|webp)$")
+
+
+def parse_image_name(filename: str) -> Optional[Tuple[str, int, str]]:
+    """'cover_123.jpg' -> ('cover', 123, 'jpg'); None for anything else."""
+    m = _NAME_RE.match(filename)
+    if not m:
+        return None
+    return m.group(1), int(m.group(2)), m.group(3)
+
+
+class ImageIndex:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._files: Dict[Tuple[str, int], str] = {}
+        self._manifest: Dict[str, Dict] = {"images": {}, "sources": {}, "evicted": {}}
+        self._evicted: Set[str] = set()  # "kind:release_id" keys under manifest["evicted"]
+        self._dir_mtime: Optional[int] = None
+        self._checked_at = 0.0
+        # What self._manifest was built from: manifest.json's stat, and how
+        # far into which journal file we have applied
+        self._base: Optional[Tuple[int, int, int]] = None
+        self._journal_ino: Optional[int] = None
+        self._journal_offset = 0
+        self._journal_lines = 0
+        self._writing_now = False  # holding the exclusive flock (flock would self-deadlock)
+
+    def _better(self, current: Optional[str], candidate: str) -> bool:
+        if current is None:
+            return True
+        cur_ext = current.rsplit(".", 1)[-1]
+        new_ext = candidate.rsplit(".", 1)[-1]
+        return EXT_PRIORITY.index(new_ext) <= EXT_PRIORITY.index(cur_ext)
+
+    def _rescan_files(self) -> None:
+        """Legacy cover_<id>/back_<id> files (the manifest is read separately)."""
+        files: Dict[Tuple[str, int], str] = {}
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    parsed = parse_image_name(entry.name)
+                    if parsed and self._better(files.get(parsed[:2]), entry.name):
+                        files[parsed[:2]] = entry.name
+        except FileNotFoundError:
+            mtime = None
+        self._files = files
+        self._dir_mtime = mtime
+
+    # ------------------------------ Manifest ------------------------------
+    #
+    # Changes are appended to manifest.log, one JSON op per line, under an
+    # exclusive flock on manifest.lock; other processes apply only the lines
+    # they have not seen. Once the journal is longer than the manifest (and at
+    # least COMPACT_MIN_LINES) the writer folds it into manifest.json and
+    # starts an empty journal. Replaying a journal over a manifest that
+    # already contains it gives the same state, so a crash between the two
+    # replaces is harmless.
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    @property
+    def journal_path(self) -> str:
+        return os.path.join(self.directory, JOURNAL_NAME)
+
+    @contextmanager
+    def _flock(self, mode: int):
+        if self._writing_now:
+            yield
+            return
+        try:
+            f = open(os.path.join(self.directory, LOCK_NAME), "a")
+        except OSError:
+            yield  # no directory yet (or read-only): nothing to protect
+            return
+        with f:
+            fcntl.flock(f, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _manifest_version(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _read_manifest(self) -> Dict[str, Dict]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        return {
+            "images": dict(data.get("images") or {}),
+            "sources": dict(data.get("sources") or {}),
+            "evicted": dict(data.get("evicted") or {}),  # file -> ["kind:release_id", ...]
+        }
+
+    def _install(self, manifest: Dict[str, Dict]) -> None:
+        self._manifest = manifest
+        self._evicted = {k for keys in manifest["evicted"].values() for k in keys}
+
+    def _write_manifest(self) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-", suffix=".part")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._manifest, f)
+            os.chmod(tmp_path, 0o644)  # mkstemp creates 0600; every server process must read it
+            os.replace(tmp_path, self.manifest_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _reload(self) -> None:
+        """manifest.json plus the whole journal, read under a shared lock so no compaction runs in between."""
+        with self._flock(fcntl.LOCK_SH):
+            self._install(self._read_manifest())
+            self._base = self._manifest_version()
+            self._journal_ino = None
+            self._journal_offset = self._journal_lines = 0
+            try:
+                with open(self.journal_path, "rb") as f:
+                    self._journal_ino = os.fstat(f.fileno()).st_ino
+                    self._consume(f.read())
+            except FileNotFoundError:
+                pass
+
+    def _catch_up(self) -> None:
+        """Apply journal lines appended since we last looked (reload after a compaction)."""
+        if self._manifest_version() != self._base:
+            self._reload()
+            return
+        try:
+            f = open(self.journal_path, "rb")
+        except FileNotFoundError:
+            if self._journal_ino is not None:
+                self._reload()
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self._journal_ino or st.st_size < self._journal_offset:
+                self._reload()
+                return
+            if st.st_size > self._journal_offset:
+                f.seek(self._journal_offset)
+                self._consume(f.read())
+
+    def _consume(self, data: bytes) -> None:
+        # Only complete lines; a line still being written is picked up next time
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                op = json.loads(line)
+            except ValueError:
+                continue  # torn by a crashed writer (terminated by the next append)
+            self._apply(op)
+            self._journal_lines += 1
+        self._journal_offset += end
+
+    def _apply(self, op: Dict) -> None:
+        manifest = self._manifest
+        if op.get("op") == "assign":
+            manifest["images"][op["key"]] = op["blob"]
+            if op.get("source"):
+                manifest["sources"][op["source"]] = op["blob"]
+            self._drop_evicted(op["key"])
+        elif op.get("op") == "unassign":
+            filename, keys = op["file"], op["keys"]
+            for k in keys:
+                manifest["images"].pop(k, None)
+            manifest["sources"] = {u: b for u, b in manifest["sources"].items() if b != filename}
+            if keys:
+                manifest["evicted"][filename] = sorted(set(keys) | set(manifest["evicted"].get(filename, [])))
+                self._evicted.update(keys)
+        elif op.get("op") == "unevict":
+            self._drop_evicted(op["key"])
+
+    def _write_op(self, op: Dict) -> None:
+        """Append one op to the journal and apply it (caller holds the exclusive flock and is caught up)."""
+        line = json.dumps(op, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        with open(self.journal_path, "ab") as f:
+            if f.tell() != self._journal_offset:
+                line = b"\n" + line  # terminate a partial line left by a crashed writer
+            f.write(line)
+            f.flush()
+            self._journal_ino = os.fstat(f.fileno()).st_ino
+            self._journal_offset = f.tell()
+        self._journal_lines += 1
+        self._apply(op)
+        if self._journal_lines > max(COMPACT_MIN_LINES, len(self._manifest["images"])):
+            self._compact()
+
+    def _compact(self) -> None:
+        self._write_manifest()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-", suffix=".part")
+        os.close(fd)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, self.journal_path)
+        self._base = self._manifest_version()
+        self._journal_ino = os.stat(self.journal_path).st_ino
+        self._journal_offset = self._journal_lines = 0
+
+    @contextmanager
+    def _writing(self):
+        with self._lock, self._flock(fcntl.LOCK_EX):
+            self._writing_now = True
+            try:
+                self._catch_up()
+                yield
+            finally:
+                self._writing_now = False
+
+    def assign(self, kind: str, release_id: int, blob: str, source_url: Optional[str] = None) -> None:
+        """
+        Point (kind, release_id) at a content-addressed blob and persist it
+        (one journal line; entries other processes added are kept).
+        """
+        with self._writing():
+            self._write_op({"op": "assign", "key": f"{kind}:{int(release_id)}", "blob": blob, "source": source_url})
+
+    # ------------------------------ Eviction ------------------------------
+
+    def _drop_evicted(self, key: str) -> None:
+        if key not in self._evicted:
+            return
+        self._evicted.discard(key)
+        evicted = self._manifest["evicted"]
+        for filename, keys in list(evicted.items()):
+            if key in keys:
+                keys = [k for k in keys if k != key]
+                if keys:
+                    evicted[filename] = keys
+                else:
+                    del evicted[filename]
+
+    def unassign_blob(self, filename: str) -> List[str]:
+        """
+        Forget a cached file before it is deleted: drop every image and source
+        entry pointing at it and record the images under "evicted".
+        Returns the affected "kind:release_id" keys.
+        """
+        with self._writing():
+            keys = [k for k, blob in self._manifest["images"].items() if blob == filename]
+            parsed = parse_image_name(filename)
+            if parsed:
+                keys.append(f"{parsed[0]}:{parsed[1]}")
+                if self._files.get(parsed[:2]) == filename:
+                    del self._files[parsed[:2]]
+            self._write_op({"op": "unassign", "file": filename, "keys": keys})
+            return keys
+
+    def evicted_keys(self, filename: str) -> List[str]:
+        """The "kind:release_id" images that used an evicted file (empty if none)."""
+        with self._lock:
+            self._refresh_if_stale()
+            return list(self._manifest["evicted"].get(filename, []))
+
+    def is_evicted(self, kind: str, release_id: int) -> bool:
+        key = f"{kind}:{int(release_id)}"
+        with self._lock:
+            self._refresh_if_stale()
+            return key in self._evicted
+
+    def unevict(self, kind: str, release_id: int) -> None:
+        """Make an evicted image fetchable again (it is about to be re-requested)."""
+        if not self.is_evicted(kind, release_id):
+            return
+        with self._writing():
+            self._write_op({"op": "unevict", "key": f"{kind}:{int(release_id)}"})
+
+    def images(self) -> Dict[str, str]:
+        """Copy of the manifest's "kind:release_id" -> blob map."""
+        with self._lock:
+            self._refresh_if_stale()
+            return dict(self._manifest["images"])
+
+    def blob_for_source(self, source_url: str) -> Optional[str]:
+        """Blob previously downloaded from this URL (skips the download)."""
+        with self._lock:
+            self._refresh_if_stale()
+            return self._manifest["sources"].get(source_url)
+
+    def refresh(self) -> None:
+        """Pick up other processes' writes now, ignoring REFRESH_INTERVAL_SEC."""
+        with self._lock:
+            self._refresh_if_stale(force=True)
+
+    def _refresh_if_stale(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and self._dir_mtime is not None and now - self._checked_at < REFRESH_INTERVAL_SEC:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._dir_mtime or mtime is None:
+            self._rescan_files()
+        self._catch_up()
+
+    def lookup(self, kind: str, release_id: int) -> Optional[str]:
+        """Path (relative to the directory) of the cached `kind` ('cover'/'back') image, or None."""
+        with self._lock:
+            self._refresh_if_stale()
+            blob = self._manifest["images"].get(f"{kind}:{int(release_id)}")
+            return blob or self._files.get((kind, int(release_id)))
+
+    def record(self, filename: str) -> None:
+        """Register a file this process just wrote into the directory."""
+        parsed = parse_image_name(filename)
+        if not parsed:
+            return
+        with self._lock:
+            if self._better(self._files.get(parsed[:2]), filename):
+                self._files[parsed[:2]] = filename
+
+    def discard(self, filename: str) -> None:
+        """Forget a file this process just removed."""
+        parsed = parse_image_name(filename)
+        if not parsed:
+            return
+        with self._lock:
+            if self._files.get(parsed[:2]) == filename:
+                del self._files[parsed[:2]]
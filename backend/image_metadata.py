@@ -0,0 +1,154 @@
+# backend/image_metadata.py
+"""
+Importer stage: precomputed metadata for each album's cached images, so the
+gallery can lay out and paint placeholders before any image bytes arrive.
+
+For the cover and back image of an album, decodes the cached file once and
+records into the album (and so into /api/collection):
+
+  "cover_meta": {"width": 600, "height": 598, "color": "#2a2f3b",
+                 "placeholder": "data:image/webp;base64,...",
+                 "src": "blobs/<sha256>.jpg", "stamp": "<mtime>-<size>"}
+  "back_meta":  same, without the placeholder
+
+- color is the dominant color (most common of a 5-color median-cut palette)
+- placeholder is a ~12px WebP (PNG without WebP support), ~150 bytes inline
+- src/stamp identify the decoded file; an album whose image still has the
+  same src and stamp is skipped without opening the file
+- decoding runs in a process pool across cores (collection_importer.py
+  passes one); without Pillow the stage is skipped
+
+Usage (normally run by collection_importer.py after refresh_album_images()):
+  python3 collection_importer.py                  # refresh + metadata
+  python3 collection_importer.py --no-metadata    # refresh only
+"""
+from __future__ import annotations
+
+import base64
+import io
+import os
+import sys
+from concurrent.futures import Executor, as_completed
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from PIL import Image, features
+except ImportError:  # pragma: no cover - depends on environment
+    Image = None
+
+import image_cache
+
+# album field -> (image field it describes, include placeholder)
+META_FIELDS = {
+    "cover_meta": ("cover_image", True),
+    "back_meta": ("back_image", False),
+}
+
+PLACEHOLDER_SIZE = 12
+PALETTE_COLORS = 5
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def cached_path(url: Optional[str]) -> Optional[Tuple[str, str]]:
+    """'/images/<file>' -> (file relative to the cache, absolute path); None for anything else."""
+    if not url or not url.startswith("/images/"):
+        return None
+    rel = url[len("/images/"):].split("?", 1)[0]
+    return rel, os.path.join(image_cache.CACHE_DIR, rel)
+
+
+def file_stamp(path: str) -> Optional[str]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+# ------------------------------ Decoding ------------------------------
+
+def _placeholder(img) -> str:
+    thumb = img.copy()
+    thumb.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    buf = io.BytesIO()
+    if features.check("webp"):
+        thumb.save(buf, "WEBP", quality=40)
+        mime = "image/webp"
+    else:
+        thumb.save(buf, "PNG", optimize=True)
+        mime = "image/png"
+    return f"data:{mime};base64,{base64.b64encode(buf.getvalue()).decode('ascii')}"
+
+
+def _dominant_color(img) -> str:
+    small = img.copy()
+    small.thumbnail((64, 64))
+    quantized = small.quantize(colors=PALETTE_COLORS)
+    _, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3:index * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def compute(path: str, placeholder: bool = True) -> Dict:
+    """Decode one image file. Runs in pool worker processes, so it only takes and returns plain data."""
+    with Image.open(path) as img:
+        width, height = img.size
+        rgb = img.convert("RGB")
+    meta = {"width": width, "height": height, "color": _dominant_color(rgb)}
+    if placeholder:
+        meta["placeholder"] = _placeholder(rgb)
+    return meta
+
+
+# ------------------------------ Stage ------------------------------
+
+def _jobs(album: Dict) -> Tuple[List[Tuple[str, str, str, str, bool]], bool]:
+    """
+    (meta field, src, path, stamp, placeholder) for images that need decoding,
+    and whether stale metadata was dropped (the image is gone or a fallback).
+    """
+    jobs = []
+    dropped = False
+    for field, (image_field, placeholder) in META_FIELDS.items():
+        located = cached_path(album.get(image_field))
+        stamp = file_stamp(located[1]) if located else None
+        if stamp is None:
+            if field in album:
+                del album[field]
+                dropped = True
+            continue
+        meta = album.get(field) or {}
+        if meta.get("src") == located[0] and meta.get("stamp") == stamp:
+            continue  # unchanged file
+        jobs.append((field, located[0], located[1], stamp, placeholder))
+    return jobs, dropped
+
+
+def annotate(albums: Iterable[Dict], pool: Executor) -> List[Dict]:
+    """
+    Record image metadata into `albums` in place, decoding only new or
+    changed files (in `pool`). Returns the albums that changed.
+    """
+    changed: Dict[int, Dict] = {}
+    futures = {}
+    for album in albums:
+        jobs, dropped = _jobs(album)
+        if dropped:
+            changed[id(album)] = album
+        for field, src, path, stamp, placeholder in jobs:
+            futures[pool.submit(compute, path, placeholder)] = (album, field, src, stamp)
+
+    for fut in as_completed(futures):
+        album, field, src, stamp = futures[fut]
+        try:
+            meta = fut.result()
+        except Exception as e:
+            print(f"[WARN] id={album.get('id')}: could not read {src}: {e}", file=sys.stderr)
+            continue
+        meta.update(src=src, stamp=stamp)
+        album[field] = meta
+        changed[id(album)] = album
+    return list(changed.values())
@@ -0,0 +1,111 @@
+# backend/image_variants.py
+"""
+Resized derivatives of cached cover/back images (thumbnails for List/Gallery).
+
+- Widths are snapped to a small fixed set so the derived cache stays bounded
+- Each (source, width, format) is generated once with Pillow and stored in
+  images/derived/<source-stem>_w<width>.<ext>; later requests are served
+  from disk. A re-downloaded original (newer mtime) regenerates its variants.
+- Without Pillow installed, callers fall back to the original image.
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+from typing import Optional
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - depends on environment
+    Image = None
+
+import image_cache
+from image_cache import SingleFlight
+
+ALLOWED_WIDTHS = (64, 128, 256, 512, 1024)
+THUMB_WIDTH = 256  # 64px list tiles at high DPI and small gallery cards
+
+# fmt query value -> (file extension, Pillow format, save options)
+FORMATS = {
+    "jpeg": ("jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+    "webp": ("webp", "WEBP", {"quality": 80, "method": 4}),
+}
+FORMAT_ALIASES = {"jpg": "jpeg"}
+
+_flights = SingleFlight()
+
+
+def snap_width(width: int) -> int:
+    """Smallest allowed width >= the requested one (largest if beyond)."""
+    for w in ALLOWED_WIDTHS:
+        if width <= w:
+            return w
+    return ALLOWED_WIDTHS[-1]
+
+
+def normalize_format(fmt: Optional[str]) -> Optional[str]:
+    fmt = (fmt or "jpeg").lower()
+    fmt = FORMAT_ALIASES.get(fmt, fmt)
+    return fmt if fmt in FORMATS else None
+
+
+def variant_filename(source_filename: str, width: int, fmt: str) -> str:
+    """'cover_1.png' -> 'derived/cover_1_w256.jpg' (relative to CACHE_DIR)."""
+    stem = os.path.splitext(os.path.basename(source_filename))[0]
+    return f"derived/{stem}_w{width}.{FORMATS[fmt][0]}"
+
+
+def _generate(source_path: str, target_path: str, width: int, fmt: str) -> None:
+    _, pil_format, options = FORMATS[fmt]
+    with Image.open(source_path) as img:
+        img = img.convert("RGB")
+        # Only ever shrink; height follows the aspect ratio
+        img.thumbnail((width, width * 4), Image.LANCZOS)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), prefix=".tmp-", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                img.save(f, pil_format, **options)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, target_path)
+            image_cache.disk_budget.note_written(os.path.getsize(target_path))
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+def ensure_variant(source_filename: str, width: int, fmt: str = "jpeg") -> Optional[str]:
+    """
+    Return the derived filename (relative to CACHE_DIR) for a cached image at
+    `width`, generating it on first use. None if Pillow is unavailable or the
+    source cannot be decoded (callers then serve the original).
+    """
+    if Image is None:
+        return None
+    width = snap_width(width)
+    rel = variant_filename(source_filename, width, fmt)
+    source_path = os.path.join(image_cache.CACHE_DIR, source_filename)
+    target_path = os.path.join(image_cache.CACHE_DIR, rel)
+
+    def fresh() -> bool:
+        try:
+            return os.stat(target_path).st_mtime_ns >= os.stat(source_path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+    if fresh():
+        return rel
+
+    def build() -> Optional[str]:
+        if not fresh():
+            try:
+                _generate(source_path, target_path, width, fmt)
+            except (OSError, ValueError, Image.DecompressionBombError):
+                # Undecodable or oversized original: the caller serves it as is
+                return None
+        return rel
+
+    return _flights.do(target_path, build)
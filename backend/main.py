@@ -1,64 +1,202 @@
 # backend/main.py
-import os
 import json
-from flask import Flask, jsonify, send_from_directory
+import mimetypes
+import os
+import time
+from typing import Optional
+
+from flask import Flask, Response, abort, g, jsonify, redirect, request, send_from_directory, stream_with_context
+from werkzeug.utils import safe_join
 from flask_cors import CORS
 
-from image_cache import (
-    ensure_release_images,
-    normalize_album_paths,
-    FALLBACK_IMAGE,
-)
+import collection_changes
+import image_cache
+import metrics
+import prefetch
+from image_index import BLOBS_DIR
+from image_variants import THUMB_WIDTH, ensure_variant, normalize_format
+from collection_snapshot import COLLECTION_PATH, get_snapshot, available_encodings, normalize_for_ui
+from collection_stream import open_album_stream
+from collection_index import CollectionIndex, SORTS
+from collection_stats import compute_stats
 
 HERE = os.path.dirname(__file__)
 STATIC_DIR = os.path.join(HERE, "static")
 IMAGES_DIR = os.path.join(HERE, "images")
 
 app = Flask(__name__, static_folder="static")
-CORS(app)
+# Browsers only let scripts read exposed headers
+CORS(app, expose_headers=["X-Collection-Version"])
+
+# ------------------------------ Metrics ------------------------------
+
+HTTP_REQUESTS = metrics.counter("http_requests_total", "HTTP requests by route, method and status", ["route", "method", "status"])
+HTTP_LATENCY = metrics.histogram("http_request_duration_seconds", "Time to produce a response (streamed bodies excluded)", ["route", "method"])
 
-def load_collection():
-    """Load collection.json from backend/."""
-    path = os.path.join(HERE, "collection.json")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request(resp):
+    started = g.pop("request_started", None)
+    # The URL rule, not the path: /cover/<int:release_id> is one series, not one per id
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.labels(route=route, method=request.method, status=str(resp.status_code)).inc()
+    if started is not None:
+        HTTP_LATENCY.labels(route=route, method=request.method).observe(time.perf_counter() - started)
+    return resp
+
+@app.route("/metrics")
+def get_metrics():
+    """Prometheus text exposition of this process's metrics."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route("/static/<path:filename>")
 def serve_static(filename: str):
     return send_from_directory(STATIC_DIR, filename)
 
+# ------------------------- Image caching / sendfile -------------------------
+
+# Self-healing routes can change (fallback -> real image), so they revalidate;
+# content-addressed blobs and versioned URLs (?v=...) never change and are
+# cached for a year.
+IMAGE_MAX_AGE = int(os.environ.get("IMAGE_MAX_AGE_SEC", str(24 * 3600)))
+RELEASE_IMAGE_MAX_AGE = int(os.environ.get("RELEASE_IMAGE_MAX_AGE_SEC", "3600"))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# "nginx" -> X-Accel-Redirect, "apache" -> X-Sendfile; Flask then only resolves
+# the path and the front server streams the bytes (see deploy/nginx.conf)
+IMAGE_SENDFILE = os.environ.get("IMAGE_SENDFILE", "").lower()
+X_ACCEL_PREFIX = os.environ.get("X_ACCEL_PREFIX", "/_images/")
+
+def _send_image_file(filename: str, max_age: int = IMAGE_MAX_AGE):
+    """
+    Serve a file from IMAGES_DIR with Cache-Control, ETag/Last-Modified and
+    304 handling, or hand it to the front server in sendfile mode.
+    """
+    # Decided by the URL, not the file: /cover/<id> may resolve to a blob but
+    # points at another one once the release's artwork changes
+    immutable = request.path.startswith(f"/images/{BLOBS_DIR}/") or "v" in request.args
+    if immutable:
+        max_age = IMMUTABLE_MAX_AGE
+    # Least-recently-served files are evicted first when over IMAGE_CACHE_MAX_BYTES
+    image_cache.disk_budget.touch(filename)
+
+    if IMAGE_SENDFILE in ("nginx", "apache"):
+        path = safe_join(IMAGES_DIR, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        resp = Response(mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+        if IMAGE_SENDFILE == "nginx":
+            # nginx serves the file (with its own ETag/304s) and keeps our Cache-Control
+            resp.headers["X-Accel-Redirect"] = X_ACCEL_PREFIX + filename
+        else:
+            resp.headers["X-Sendfile"] = os.path.abspath(path)
+    else:
+        resp = send_from_directory(IMAGES_DIR, filename, max_age=max_age, conditional=True, etag=True)
+
+    resp.cache_control.public = True
+    resp.cache_control.max_age = max_age
+    if immutable:
+        resp.cache_control.immutable = True
+    return resp
+
 @app.route("/images/<path:filename>")
 def serve_image(filename: str):
-    return send_from_directory(IMAGES_DIR, filename)
+    evicted = image_cache.image_index.evicted_keys(filename)
+    path = safe_join(IMAGES_DIR, filename) if evicted else None
+    if path and not os.path.isfile(path):
+        # Removed by the disk budget but still referenced (e.g. from collection.json):
+        # the self-healing route fetches it again
+        kind, _, release_id = evicted[0].partition(":")
+        resp = redirect(f"/{kind}/{release_id}", code=302)
+        resp.cache_control.no_cache = True
+        return resp
+    return _send_image_file(filename)
+
+def _pinned_release_ids():
+    # Covers of the current collection are never evicted
+    return get_snapshot().derived("release_ids", lambda s: {
+        int(a["id"]) for a in s.albums if str(a.get("id", "")).isdigit()
+    })
+
+image_cache.disk_budget.pinned = _pinned_release_ids
 
 # ---------- Self-healing image endpoints ----------
 
-@app.route("/cover/<int:release_id>")
-def cover_release(release_id: int):
-    cover_url, _ = ensure_release_images(release_id)
+def _send_public_url(url: str):
+    """Serve a public /images/... or /static/... URL from disk."""
+    if url.startswith("/static/"):
+        # Fallback image: never cache, so the real cover shows once fetched
+        resp = send_from_directory(STATIC_DIR, url.split("/static/", 1)[-1])
+        resp.cache_control.no_cache = True
+        return resp
     # Map /images/xyz.ext -> serve file from IMAGES_DIR
-    filename = cover_url.split("/images/", 1)[-1]
-    return send_from_directory(IMAGES_DIR, filename)
+    return _send_image_file(url.split("/images/", 1)[-1], RELEASE_IMAGE_MAX_AGE)
+
+def _send_release_image(url: str, width: Optional[int] = None):
+    """
+    Serve a cached release image, or its resized variant when a width is
+    requested (?w=, /thumb). Falls back to the original when no variant can
+    be made (Pillow missing, fallback image, undecodable file).
+    """
+    if width and url.startswith("/images/"):
+        fmt = normalize_format(request.args.get("fmt"))
+        if fmt is None:
+            return jsonify({"error": "fmt must be jpeg or webp"}), 400
+        variant = ensure_variant(url.split("/images/", 1)[-1], width, fmt)
+        if variant:
+            return _send_image_file(variant, RELEASE_IMAGE_MAX_AGE)
+    return _send_public_url(url)
+
+def _requested_width() -> Optional[int]:
+    w = request.args.get("w", type=int)
+    return w if w and w > 0 else None
+
+def _uncacheable_if(pending: bool, resp):
+    # Still being prefetched: the client must come back for the real image
+    if pending:
+        resp.cache_control.public = False
+        resp.cache_control.max_age = None
+        resp.cache_control.immutable = False
+        resp.cache_control.no_cache = True
+    return resp
+
+@app.route("/cover/<int:release_id>")
+def cover_release(release_id: int, width: Optional[int] = None):
+    # Cold covers are fetched by the background prefetcher (see prefetch.py);
+    # the request waits only briefly, then serves the fallback
+    cover_url, _, pending = prefetch.resolve_release_images(release_id, "cover")
+    return _uncacheable_if(pending, _send_release_image(cover_url, width or _requested_width()))
 
 @app.route("/back/<int:release_id>")
-def back_release(release_id: int):
-    _, back_url = ensure_release_images(release_id)
+def back_release(release_id: int, width: Optional[int] = None):
+    cover_url, back_url, pending = prefetch.resolve_release_images(release_id, "back")
     if not back_url:
-        return cover_release(release_id)  # fall back to cover
-    filename = back_url.split("/images/", 1)[-1]
-    return send_from_directory(IMAGES_DIR, filename)
+        # fall back to cover
+        return _uncacheable_if(pending, _send_release_image(cover_url, width or _requested_width()))
+    return _send_release_image(back_url, width or _requested_width())
+
+@app.route("/cover/<int:release_id>/thumb")
+def cover_thumb(release_id: int):
+    return cover_release(release_id, THUMB_WIDTH)
+
+@app.route("/back/<int:release_id>/thumb")
+def back_thumb(release_id: int):
+    return back_release(release_id, THUMB_WIDTH)
 
 # ---------- Compatibility routes for legacy absolute thumb paths ----------
 
 @app.route("/thumb_<int:release_id>.<ext>")
 def legacy_thumb_release(release_id: int, ext: str):
-    # Serve the cover for any legacy /thumb_<id>.<ext> request
-    return cover_release(release_id)
+    # Serve the cover thumbnail for any legacy /thumb_<id>.<ext> request
+    return cover_thumb(release_id)
 
 @app.route("/back_thumb_<int:release_id>.<ext>")
 def legacy_back_thumb_release(release_id: int, ext: str):
-    # Serve the back (or cover) for any legacy /back_thumb_<id>.<ext> request
-    return back_release(release_id)
+    # Serve the back (or cover) thumbnail for any legacy /back_thumb_<id>.<ext> request
+    return back_thumb(release_id)
 
 # -------------------------- API: collection --------------------------
 
@@ -69,45 +207,226 @@ def get_collection():
     If an album has an ID, prefer /cover/:id and /back/:id so the first
     request can auto-fetch and cache images if they are missing locally.
     Also rewrites any legacy thumb/back_thumb to those endpoints.
+
+    The parsed, normalized and serialized body is cached per collection.json
+    version (see collection_snapshot.py), so repeat loads are a memory copy.
+    Clients revalidating with If-None-Match / If-Modified-Since get a 304.
+    X-Collection-Version is the change-log version to pass to
+    /api/collection/changes?since= afterwards.
+
+    ?stream=1 streams the same document without building it in memory.
     """
+    if request.args.get("stream") in ("1", "true"):
+        return _stream_collection(ndjson=False)
+    # Read before the snapshot: writers update the store, then the log, so a
+    # client may get a body newer than its version (and re-apply a few
+    # changes), never an older one
+    version = collection_changes.current_version()
     try:
-        raw = load_collection()
-
-        # Extract album list while preserving original shape
-        if isinstance(raw, list):
-            albums = raw
-            shape = ("list", None)
-        elif isinstance(raw, dict):
-            key_used = None
-            albums = []
-            for key in ("records", "collection", "items"):
-                if isinstance(raw.get(key), list):
-                    key_used = key
-                    albums = raw[key]
-                    break
-            shape = ("dict", key_used)
-        else:
-            albums = []
-            shape = ("list", None)
-
-        # Normalize each album's image fields
-        for a in albums:
-            normalize_album_paths(a)
-            if not a.get("cover_image"):
-                a["cover_image"] = FALLBACK_IMAGE
-
-        # Return with original shape
-        kind, key = shape
-        if kind == "list":
-            return jsonify(albums)
-        else:
-            out = dict(raw)
-            if key:
-                out[key] = albums
-            return jsonify(out)
+        snap = get_snapshot()
+    except Exception:
+        return jsonify({"error": "Failed to read collection"}), 500
+    if prefetch.ENABLED and not snap.shared:
+        # Warm uncached covers in the background, once per collection version.
+        # Only the process that built this version does it: workers mapping the
+        # shared copy would each parse it, and the importer that published it
+        # has just fetched the images anyway.
+        snap.derived("prefetch", lambda s: prefetch.enqueue_uncached(s.albums))
+    resp = _snapshot_response(snap)
+    resp.headers["X-Collection-Version"] = str(version)
+    return resp
+
+def _snapshot_response(snap) -> Response:
+    """
+    Serve a snapshot body with a strong ETag and Last-Modified, answering
+    conditional requests with 304 and picking a precompressed encoding.
+    """
+    encoding = request.accept_encodings.best_match(available_encodings()) or "identity"
+    # One strong validator per representation; any of them revalidates the version
+    etag = snap.etag if encoding == "identity" else f"{snap.etag}-{encoding}"
+    validators = [snap.etag] + [f"{snap.etag}-{e}" for e in available_encodings()]
+
+    not_modified = False
+    if request.if_none_match:
+        not_modified = request.if_none_match.star_tag or any(
+            request.if_none_match.contains(v) for v in validators
+        )
+    elif request.if_modified_since:
+        not_modified = int(snap.mtime) <= request.if_modified_since.timestamp()
 
+    if not_modified:
+        resp = Response(status=304)
+    else:
+        body = snap.encoded_body(encoding)
+        # A one-chunk iterable rather than bytes: a shared snapshot's body is a
+        # memoryview of the mapping, which the WSGI server writes without a copy
+        resp = Response([body], mimetype="application/json")
+        resp.content_length = len(body)
+        if encoding != "identity":
+            resp.headers["Content-Encoding"] = encoding
+    resp.set_etag(etag)
+    resp.last_modified = int(snap.mtime)
+    # Always revalidate; a matching ETag costs a few hundred bytes
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+# ---------------------- API: streamed collection ----------------------
+
+STREAM_CHUNK_BYTES = 64 * 1024
+
+@app.route("/api/collection.ndjson", methods=["GET"])
+def get_collection_ndjson():
+    """One normalized album per line, streamed as the file is read."""
+    return _stream_collection(ndjson=True)
+
+def _stream_collection(ndjson: bool) -> Response:
+    """
+    Stream albums straight from collection.json (or the SQLite store),
+    normalizing each as it is read, so memory stays flat and the first
+    bytes go out immediately. Nothing is compressed or cached here; use
+    plain /api/collection for that.
+    """
+    try:
+        stream = open_album_stream(COLLECTION_PATH)
+    except Exception:
+        return jsonify({"error": "Failed to read collection"}), 500
+
+    etag = f"{stream.version[0]:x}-{stream.version[1]:x}-{'ndjson' if ndjson else 'stream'}"
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+
+    def pieces():
+        albums = iter(stream)
+        first = next(albums, None)  # reading the first album also detects the shape
+        kind, key = stream.shape
+        if not ndjson:
+            yield "[" if kind == "list" else "{" + json.dumps(key, ensure_ascii=False) + ":["
+        sep = "\n" if ndjson else ","
+        album = first
+        n = 0
+        while album is not None:
+            text = json.dumps(normalize_for_ui(album), ensure_ascii=False, separators=(",", ":"))
+            yield (text + sep) if ndjson else ((sep if n else "") + text)
+            n += 1
+            album = next(albums, None)
+        if not ndjson:
+            tail = "]"
+            if kind == "dict":
+                for k, v in stream.rest.items():
+                    tail += "," + json.dumps(k, ensure_ascii=False) + ":" + json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+                tail += "}"
+            yield tail
+
+    def chunks():
+        # Batch small per-album strings into socket-sized writes
+        buf, size = [], 0
+        for piece in pieces():
+            data = piece.encode("utf-8")
+            buf.append(data)
+            size += len(data)
+            if size >= STREAM_CHUNK_BYTES:
+                yield b"".join(buf)
+                buf, size = [], 0
+        if buf:
+            yield b"".join(buf)
+
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    resp = Response(stream_with_context(chunks()), mimetype=mimetype)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+@app.route("/api/collection/changes", methods=["GET"])
+def get_collection_changes():
+    """
+    Albums added/modified (full normalized records) and removed (ids) since
+    change-log version ?since=, from X-Collection-Version or a previous call.
+    {"reset": true} means the log no longer reaches back that far: reload
+    /api/collection.
+    """
+    try:
+        since = int(request.args["since"])
+    except (KeyError, ValueError):
+        return jsonify({"error": "since must be an integer version"}), 400
+
+    changes = collection_changes.changes_since(since)
+    if changes.get("reset") or not (changes["added"] or changes["modified"]):
+        return jsonify(changes)
+    try:
+        snap = get_snapshot()
     except Exception:
         return jsonify({"error": "Failed to read collection"}), 500
 
+    by_id = snap.derived("by_id", lambda s: {str(a["id"]): a for a in s.albums if a.get("id") not in (None, "")})
+    for kind in ("added", "modified"):
+        # An id missing from the snapshot was removed again after the log was read
+        changes[kind] = [by_id[k] for k in changes[kind] if k in by_id]
+    return jsonify(changes)
+
+def _collection_index(snap) -> CollectionIndex:
+    return snap.derived("index", lambda s: CollectionIndex(s.albums))
+
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 500
+
+@app.route("/api/collection/search", methods=["GET"])
+def search_collection():
+    """
+    Server-side search/filter/pagination over the collection.
+    Query params: q, genre, label, year, sort (recent|alpha|year), offset, limit.
+    Answered from an index built once per collection version.
+    """
+    args = request.args
+    try:
+        year = int(args["year"]) if args.get("year") else None
+        offset = max(0, int(args.get("offset", 0)))
+        limit = min(SEARCH_MAX_LIMIT, max(1, int(args.get("limit", SEARCH_DEFAULT_LIMIT))))
+    except ValueError:
+        return jsonify({"error": "year, offset and limit must be integers"}), 400
+    sort = args.get("sort", "recent")
+    if sort not in SORTS:
+        return jsonify({"error": f"sort must be one of {', '.join(SORTS)}"}), 400
+
+    try:
+        snap = get_snapshot()
+    except Exception:
+        return jsonify({"error": "Failed to read collection"}), 500
+
+    index = _collection_index(snap)
+    total, items = index.search(
+        q=args.get("q", ""),
+        genre=args.get("genre", ""),
+        label=args.get("label", ""),
+        year=year,
+        sort=sort,
+        offset=offset,
+        limit=limit,
+    )
+    return jsonify({"total": total, "offset": offset, "limit": limit, "items": items})
+
+@app.route("/api/stats", methods=["GET"])
+def get_stats():
+    """
+    Precomputed report histograms (genre, decade, label, year, date_added,
+    genre x decade), optionally filtered by exact genre/label.
+    Cached per collection version and (genre, label) filter tuple.
+    """
+    genre = request.args.get("genre", "").strip()
+    label = request.args.get("label", "").strip()
+    try:
+        snap = get_snapshot()
+    except Exception:
+        return jsonify({"error": "Failed to read collection"}), 500
+
+    albums = _collection_index(snap).select(genre=genre, label=label)
+    if not albums:
+        # Unknown filter values: cheap to answer, not worth a cache slot
+        return jsonify(compute_stats([]))
+    key = ("stats", genre.lower(), label.lower())
+    return jsonify(snap.derived(key, lambda s: compute_stats(albums)))
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=False)
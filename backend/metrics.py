@@ -0,0 +1,243 @@
+# backend/metrics.py
+"""
+Minimal in-process metrics registry with Prometheus text exposition.
+
+- Counter / Gauge / Histogram, optionally with labels
+- Modules declare their metrics at import time next to the code they measure:
+
+    LOOKUPS = metrics.counter("image_cache_lookups_total", "Release image lookups", ["result"])
+    LOOKUPS.labels(result="hit").inc()
+
+- The web server exposes render() at /metrics; the importer dumps
+  as_dict() into its per-run summary
+
+Values are per process (no multiprocess aggregation); with several server
+workers, scrape each or sum in Prometheus.
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    inner = ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs)
+    return "{" + inner + "}" if inner else ""
+
+
+def _format_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, **labels: str) -> "_Metric":
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self) -> "_Metric":
+        return type(self)(self.name, self.help)
+
+    def _series(self) -> List[Tuple[Tuple[Tuple[str, str], ...], "_Metric"]]:
+        if not self.labelnames:
+            return [((), self)]
+        with self._lock:
+            items = list(self._children.items())
+        return [(tuple(zip(self.labelnames, key)), child) for key, child in sorted(items)]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def _samples(self, labels) -> List[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(self.value)}"]
+
+    def _dict(self):
+        return self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.value = 0.0
+        self._fn: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        """Read the value from fn() at collection time (e.g. a queue length)."""
+        self._fn = fn
+
+    def _current(self) -> float:
+        return float(self._fn()) if self._fn is not None else self.value
+
+    def _samples(self, labels) -> List[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(self._current())}"]
+
+    def _dict(self):
+        return self._current()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.help, buckets=self.buckets[:-1])
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def time(self) -> "_Timer":
+        """Context manager observing the elapsed seconds."""
+        return _Timer(self)
+
+    def _samples(self, labels) -> List[str]:
+        out = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            le = labels + (("le", _format_value(bound)),)
+            out.append(f"{self.name}_bucket{_format_labels(le)} {cumulative}")
+        out.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(self.sum)}")
+        out.append(f"{self.name}_count{_format_labels(labels)} {self.count}")
+        return out
+
+    def _dict(self):
+        return {"count": self.count, "sum": round(self.sum, 6),
+                "mean": round(self.sum / self.count, 6) if self.count else None}
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self) -> "_Timer":
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self._t0)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Re-import (e.g. reloaded module): keep the live series
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for labels, series in m._series():
+                lines.extend(series._samples(labels))
+        return "\n".join(lines) + "\n"
+
+    def as_dict(self) -> Dict[str, object]:
+        """JSON-friendly values: {name: value} or {name: {"label=value,...": value}}."""
+        out: Dict[str, object] = {}
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        for m in metrics:
+            if not m.labelnames:
+                out[m.name] = m._dict()
+            else:
+                out[m.name] = {",".join(f"{k}={v}" for k, v in labels): s._dict() for labels, s in m._series()}
+        return out
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames))
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def as_dict() -> Dict[str, object]:
+    return REGISTRY.as_dict()
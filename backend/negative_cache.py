@@ -0,0 +1,183 @@
+# backend/negative_cache.py
+"""
+Persistent negative cache for Discogs image lookups.
+
+Remembers "nothing to fetch" outcomes so repeat requests do not hit Discogs:
+- no_back / no_cover: the release payload has no such image (long TTL)
+- error: the release fetch/download failed; retried with exponential backoff
+
+Stored as JSON in backend/images/negative_cache.json, shared by the web
+server and the importer:
+- changes are written at most once per FLUSH_INTERVAL_SEC (a background
+  timer), on flush() (the importer calls it after each batch) and at exit;
+  each write merges this process's changes into the file under a flock
+- the file is checked for other processes' writes at most once per
+  RELOAD_INTERVAL_SEC
+"""
+from __future__ import annotations
+
+import atexit
+import fcntl
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+NO_IMAGE_TTL_SEC = float(os.environ.get("NEGATIVE_CACHE_TTL_SEC", str(30 * 24 * 3600)))  # 30 days
+ERROR_BASE_SEC = float(os.environ.get("NEGATIVE_CACHE_ERROR_BASE_SEC", "300"))  # 5 min, doubling
+ERROR_MAX_SEC = float(os.environ.get("NEGATIVE_CACHE_ERROR_MAX_SEC", str(24 * 3600)))  # capped at 1 day
+FLUSH_INTERVAL_SEC = float(os.environ.get("NEGATIVE_CACHE_FLUSH_SEC", "5.0"))
+RELOAD_INTERVAL_SEC = float(os.environ.get("NEGATIVE_CACHE_RELOAD_SEC", "1.0"))
+
+NO_BACK = "no_back"
+NO_COVER = "no_cover"
+ERROR = "error"
+
+
+class NegativeCache:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, dict]] = {}
+        self._loaded_mtime: Optional[int] = None
+        self._checked_at: Optional[float] = None
+        # release id -> its entries as this process last set them (None: cleared), not yet written
+        self._pending: Dict[str, Optional[Dict[str, dict]]] = {}
+        self._timer: Optional[threading.Timer] = None
+        atexit.register(self._flush_at_exit)
+
+    # ------------------------------ Storage ------------------------------
+
+    def _reload_if_changed(self) -> None:
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < RELOAD_INTERVAL_SEC:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._loaded_mtime:
+            return
+        self._entries = self._read() if mtime is not None else {}
+        self._overlay_pending()
+        self._loaded_mtime = mtime
+
+    def _read(self) -> Dict[str, Dict[str, dict]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            return {}  # corrupt/unreadable: start over rather than fail requests
+
+    def _overlay_pending(self) -> None:
+        for rid, kinds in self._pending.items():
+            if kinds:
+                self._entries[rid] = dict(kinds)
+            else:
+                self._entries.pop(rid, None)
+
+    def _changed(self, rid: str) -> None:
+        """Note a mutation of `rid`; it is written by the next flush."""
+        kinds = self._entries.get(rid)
+        self._pending[rid] = dict(kinds) if kinds else None
+        if self._timer is None:
+            self._timer = threading.Timer(FLUSH_INTERVAL_SEC, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        """Write pending changes now, merged into the file's current contents."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(f"{self.path}.lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    # Other processes may have written since we loaded
+                    self._entries = self._read()
+                    self._overlay_pending()
+                    self._save()
+                    self._pending.clear()  # kept for the next flush if the write failed
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _flush_at_exit(self) -> None:
+        try:
+            self.flush()
+        except OSError as e:
+            print(f"[WARN] Could not save {self.path}: {e}", file=sys.stderr)
+
+    def _save(self) -> None:
+        now = time.time()
+        # Drop expired "no image" entries so the file does not grow forever.
+        # Error entries are kept: their failure count drives the backoff.
+        for rid in list(self._entries):
+            kinds = self._entries[rid]
+            for k in [k for k, e in kinds.items() if k != ERROR and e.get("until", 0) <= now]:
+                del kinds[k]
+            if not kinds:
+                del self._entries[rid]
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".tmp-", suffix=".part")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.chmod(tmp_path, 0o644)  # mkstemp creates 0600; the server and importer may run as different users
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._loaded_mtime = os.stat(self.path).st_mtime_ns
+
+    # ------------------------------ Queries ------------------------------
+
+    def is_suppressed(self, release_id: int, kind: str) -> bool:
+        """True while a fresh `kind` entry says not to ask Discogs again."""
+        with self._lock:
+            self._reload_if_changed()
+            entry = self._entries.get(str(release_id), {}).get(kind)
+            return bool(entry) and entry.get("until", 0) > time.time()
+
+    # ----------------------------- Mutations -----------------------------
+
+    def record_missing(self, release_id: int, kind: str) -> None:
+        """Release has no image of this kind (NO_BACK / NO_COVER)."""
+        with self._lock:
+            self._reload_if_changed()
+            self._entries.setdefault(str(release_id), {})[kind] = {"until": time.time() + NO_IMAGE_TTL_SEC}
+            self._changed(str(release_id))
+
+    def record_failure(self, release_id: int) -> None:
+        """Upstream failure: back off base * 2^(n-1), capped."""
+        with self._lock:
+            self._reload_if_changed()
+            kinds = self._entries.setdefault(str(release_id), {})
+            failures = kinds.get(ERROR, {}).get("failures", 0) + 1
+            delay = min(ERROR_BASE_SEC * (2 ** (failures - 1)), ERROR_MAX_SEC)
+            kinds[ERROR] = {"until": time.time() + delay, "failures": failures}
+            self._changed(str(release_id))
+
+    def clear(self, release_id: int, *kinds: str) -> None:
+        """Forget entries for a release (all kinds if none given)."""
+        with self._lock:
+            self._reload_if_changed()
+            current = self._entries.get(str(release_id))
+            if not current:
+                return
+            for k in (kinds or tuple(current)):
+                current.pop(k, None)
+            if not current:
+                del self._entries[str(release_id)]
+            self._changed(str(release_id))
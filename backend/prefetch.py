@@ -0,0 +1,183 @@
+# backend/prefetch.py
+"""
+Background cover prefetching for the web server.
+
+A cold /cover/<id> used to block the request for the whole Discogs round
+trip and download. Instead, misses are fetched by a small pool of daemon
+threads from one bounded priority queue:
+
+- /api/collection enqueues every release without cached images at LOW
+  priority, once per collection version
+- a request miss promotes its release to HIGH (front of the queue) and waits
+  at most PREFETCH_WAIT_SEC; if the image is still missing the route serves
+  the fallback uncacheably and the next request gets the real image
+- LOW entries beyond PREFETCH_QUEUE_MAX are dropped (they are re-enqueued on
+  the next collection version, or fetched on demand); HIGH ones never are
+
+Fetches go through ensure_release_images(), so the single-flight, negative
+cache and Discogs rate limiting all still apply. PREFETCH_ENABLED=0 restores
+the old blocking behaviour.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import sys
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import image_cache
+import metrics
+
+ENABLED = os.environ.get("PREFETCH_ENABLED", "1") not in ("0", "false", "no")
+WAIT_SEC = float(os.environ.get("PREFETCH_WAIT_SEC", "2.0"))
+QUEUE_MAX = int(os.environ.get("PREFETCH_QUEUE_MAX", "10000"))
+WORKERS = int(os.environ.get("PREFETCH_WORKERS", "2"))
+
+HIGH = 0
+LOW = 1
+
+
+class PrefetchQueue:
+    """
+    Bounded priority queue of release ids plus the worker threads draining it.
+    Each id is queued at most once; re-enqueueing at a higher priority moves
+    it forward. Workers start lazily on the first enqueue.
+    """
+
+    def __init__(self, fetch: Callable[[int], object], maxsize: int = QUEUE_MAX, workers: int = WORKERS):
+        self._fetch = fetch
+        self._maxsize = maxsize
+        self._workers = max(1, workers)
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[int, int, int]] = []
+        self._seq = itertools.count()
+        self._queued: Dict[int, int] = {}               # release_id -> priority
+        self._done: Dict[int, threading.Event] = {}     # queued or in flight
+        self._threads: List[threading.Thread] = []
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._queued)
+
+    def enqueue(self, release_id: int, priority: int = LOW) -> Optional[threading.Event]:
+        """
+        Queue a release (or move it forward). Returns an Event set once it has
+        been fetched, or None if a LOW entry was dropped because the queue is full.
+        """
+        release_id = int(release_id)
+        with self._cond:
+            done = self._done.get(release_id)
+            current = self._queued.get(release_id)
+            if done is not None and (current is None or current <= priority):
+                return done  # in flight, or already queued at least this urgently
+            if done is None and priority == LOW and len(self._queued) >= self._maxsize:
+                return None
+            if done is None:
+                done = self._done[release_id] = threading.Event()
+            # Older heap entries for this id are skipped when popped (see _next)
+            self._queued[release_id] = priority
+            heapq.heappush(self._heap, (priority, next(self._seq), release_id))
+            self._start_workers()
+            self._cond.notify()
+            return done
+
+    def enqueue_many(self, release_ids: Iterable[int], priority: int = LOW) -> int:
+        queued = 0
+        for rid in release_ids:
+            if self.enqueue(rid, priority) is None:
+                break
+            queued += 1
+        return queued
+
+    def fetch_soon(self, release_id: int, wait: float = WAIT_SEC) -> bool:
+        """Promote a release to the front and wait up to `wait` seconds; True if fetched."""
+        done = self.enqueue(release_id, HIGH)
+        return done.wait(wait) if done is not None and wait > 0 else False
+
+    def _start_workers(self) -> None:
+        # Caller holds self._cond
+        if self._threads:
+            return
+        for i in range(self._workers):
+            t = threading.Thread(target=self._run, name=f"prefetch-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _next(self) -> int:
+        with self._cond:
+            while True:
+                while not self._heap:
+                    self._cond.wait()
+                priority, _, rid = heapq.heappop(self._heap)
+                if self._queued.get(rid) == priority:
+                    del self._queued[rid]
+                    return rid
+
+    def _run(self) -> None:
+        while True:
+            rid = self._next()
+            try:
+                self._fetch(rid)
+            except Exception as e:
+                print(f"[WARN] Prefetch of release {rid} failed: {e}", file=sys.stderr)
+            finally:
+                with self._cond:
+                    done = self._done.pop(rid, None)
+                if done is not None:
+                    done.set()
+
+
+prefetcher = PrefetchQueue(lambda rid: image_cache.ensure_release_images(rid, record_metrics=False))
+
+PREFETCH_QUEUE_LENGTH = metrics.gauge("prefetch_queue_length", "Releases waiting in the cover prefetch queue")
+PREFETCH_QUEUE_LENGTH.set_function(lambda: len(prefetcher))
+
+
+def enqueue_uncached(albums: Iterable[dict]) -> int:
+    """Queue (LOW) every album whose release images still need a fetch."""
+    ids = []
+    for album in albums:
+        rid = album.get("id")
+        if rid and str(rid).isdigit() and image_cache.lookup_release_images(int(rid)) is None:
+            ids.append(int(rid))
+    return prefetcher.enqueue_many(ids, LOW)
+
+
+def resolve_release_images(release_id: int, kind: str = "cover") -> Tuple[str, Optional[str], bool]:
+    """
+    (cover_url, back_url, pending) for a /cover or /back request.
+
+    Without prefetching this is ensure_release_images() (blocking). With it,
+    a miss is promoted and waited on for at most WAIT_SEC; `pending` is True
+    when the requested image is still being fetched and the caller should
+    answer with what is cached (or the fallback) and forbid caching.
+    """
+    if kind == "back":
+        # Evicted by the disk budget: asking for it makes it a normal miss again
+        image_cache.image_index.unevict("back", release_id)
+    if not ENABLED:
+        cover_url, back_url = image_cache.ensure_release_images(release_id)
+        return cover_url, back_url, False
+
+    known = image_cache.lookup_release_images(release_id)
+    if known is None and image_cache.cached_image_url(kind, release_id):
+        # The requested image is here; fetch the other one in the background
+        prefetcher.enqueue(release_id, LOW)
+        urls = (image_cache.cached_image_url("cover", release_id) or image_cache.FALLBACK_IMAGE,
+                image_cache.cached_image_url("back", release_id))
+        image_cache.record_lookup(urls, "hit")
+        return urls[0], urls[1], False
+    result = "hit" if known is not None and known[0] != image_cache.FALLBACK_IMAGE else "negative"
+    if known is None:
+        result = "miss"
+        if prefetcher.fetch_soon(release_id, WAIT_SEC):
+            known = image_cache.lookup_release_images(release_id)
+    if known is None:
+        urls = (image_cache.cached_image_url("cover", release_id) or image_cache.FALLBACK_IMAGE,
+                image_cache.cached_image_url("back", release_id))
+        image_cache.record_lookup(urls, result)
+        return urls[0], urls[1], True
+    image_cache.record_lookup(known, result)
+    return known[0], known[1], False
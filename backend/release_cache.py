@@ -0,0 +1,95 @@
+# backend/release_cache.py
+"""
+On-disk cache of raw Discogs release payloads (/releases/{id}).
+
+Image caching, the tracklist fetcher and any later metadata enrichment read
+releases through get_release(), so each release is fetched from Discogs once
+and every consumer gets the full payload, not just the field it needed.
+
+- Stored as backend/releases/<id>.json: {"payload", "etag", "last_modified", "fetched_at"}
+- Entries older than max_age are revalidated with If-None-Match /
+  If-Modified-Since; a 304 just refreshes fetched_at
+- offline=True never touches the network (enrichment passes can run offline)
+- If a refresh fails, the stale payload is returned rather than nothing
+"""
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Optional
+
+from discogs_client import discogs_get, get_client
+
+HERE = os.path.dirname(__file__)
+RELEASES_DIR = os.environ.get("RELEASE_CACHE_DIR", os.path.join(HERE, "releases"))
+
+# Release payloads rarely change; revalidate (cheaply, via 304) after this long
+DEFAULT_MAX_AGE_SEC = float(os.environ.get("RELEASE_CACHE_MAX_AGE_SEC", str(30 * 24 * 3600)))
+
+
+def _path_for(release_id: int) -> str:
+    return os.path.join(RELEASES_DIR, f"{int(release_id)}.json")
+
+
+def read_entry(release_id: int) -> Optional[Dict]:
+    try:
+        with open(_path_for(release_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_entry(release_id: int, entry: Dict) -> None:
+    os.makedirs(RELEASES_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=RELEASES_DIR, prefix=".tmp-", suffix=".part")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, _path_for(release_id))
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def get_release(release_id: int, max_age: float = DEFAULT_MAX_AGE_SEC, offline: bool = False) -> Optional[Dict]:
+    """
+    Return the release payload, from disk when fresh enough.
+    Returns None only when offline and nothing is cached; otherwise raises
+    (like the underlying client) if Discogs fails and nothing is cached.
+    """
+    entry = read_entry(release_id)
+    if entry is not None and (offline or time.time() - entry.get("fetched_at", 0) < max_age):
+        return entry["payload"]
+    if offline:
+        return None
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        resp = discogs_get(get_client().release_url(release_id), headers=headers)
+    except Exception:
+        if entry is not None:
+            return entry["payload"]  # stale beats nothing
+        raise
+
+    if resp.status_code == 304 and entry is not None:
+        entry["fetched_at"] = time.time()
+    else:
+        entry = {
+            "payload": resp.json(),
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+    _write_entry(release_id, entry)
+    return entry["payload"]
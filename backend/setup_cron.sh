@@ -5,7 +5,10 @@ cd /home/glyphic/record-collection/backend || exit 1
 # Ensure the script is executable
 chmod +x collection_importer.py
 
-# Write cron job to run every day at 3am
-(crontab -l 2>/dev/null; echo "0 3 * * * /usr/bin/python3 /home/glyphic/record-collection/backend/collection_importer.py >> /home/glyphic/record-collection/import_log.txt 2>&1") | crontab -
+# Write cron job to run every day at 3am.
+# --sync only pages the Discogs collection until the first album we already
+# have (usually a single API call), then fetches images for the new ones.
+# DISCOGS_USER / DISCOGS_TOKEN / DISCOGS_UA must be set in the crontab environment.
+(crontab -l 2>/dev/null; echo "0 3 * * * /usr/bin/python3 /home/glyphic/record-collection/backend/collection_importer.py --sync >> /home/glyphic/record-collection/import_log.txt 2>&1") | crontab -
 
-echo "Cron job installed to run collection_importer.py daily at 3am."
+echo "Cron job installed to run collection_importer.py --sync daily at 3am."
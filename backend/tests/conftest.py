@@ -0,0 +1,29 @@
+# backend/tests/conftest.py
+import os
+import sys
+
+import pytest
+
+# Backend modules use flat imports (e.g. `from image_cache import ...`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def _no_background_prefetch(monkeypatch):
+    # /api/collection would otherwise queue real Discogs fetches on worker threads
+    import prefetch
+    monkeypatch.setattr(prefetch, "ENABLED", False)
+
+
+@pytest.fixture(autouse=True)
+def _isolated_change_log(tmp_path, monkeypatch):
+    # Writers record into the change log next to collection.json otherwise
+    import collection_changes
+    monkeypatch.setattr(collection_changes, "CHANGES_PATH", str(tmp_path / "collection_changes.json"))
+    monkeypatch.setattr(collection_changes, "HASHES_PATH", str(tmp_path / "collection_hashes.json"))
+
+
+@pytest.fixture(autouse=True)
+def _isolated_shared_snapshot(tmp_path, monkeypatch):
+    import collection_snapshot
+    monkeypatch.setattr(collection_snapshot, "SHARED_PATH", str(tmp_path / "collection.snapshot"))
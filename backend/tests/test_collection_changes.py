@@ -0,0 +1,68 @@
+# backend/tests/test_collection_changes.py
+import json
+
+import pytest
+
+import collection_changes
+import collection_snapshot
+import main
+
+
+def albums(*pairs):
+    return [{"id": rid, "title": title} for rid, title in pairs]
+
+
+def test_log_records_net_changes_and_compacts(monkeypatch):
+    assert collection_changes.record(albums((1, "a"), (2, "b"))) is None  # baseline, version 1
+    assert collection_changes.record(albums((1, "a"), (2, "b"))) is None  # nothing changed
+
+    e2 = collection_changes.record(albums((1, "a"), (2, "B"), (3, "c")))
+    assert (e2["version"], e2["added"], e2["modified"], e2["removed"]) == (2, ["3"], ["2"], [])
+    collection_changes.record(albums((1, "a"), (2, "B"), (4, "d")))  # v3: 3 removed, 4 added
+
+    changes = collection_changes.changes_since(1)
+    assert changes["version"] == 3
+    # 3 was added and removed again within the window: not reported at all
+    assert (changes["added"], changes["modified"], changes["removed"]) == (["4"], ["2"], [])
+    assert collection_changes.changes_since(2)["removed"] == ["3"]
+    assert collection_changes.changes_since(3)["added"] == []
+    assert collection_changes.changes_since(9)["reset"] is True
+
+    monkeypatch.setattr(collection_changes, "MAX_ENTRIES", 1)
+    collection_changes.record(albums((1, "A"), (2, "B"), (4, "d")))
+    assert collection_changes.load_log()["oldest"] == 3
+    assert collection_changes.changes_since(2)["reset"] is True
+    assert collection_changes.changes_since(3)["modified"] == ["1"]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    path = tmp_path / "collection.json"
+    monkeypatch.setattr(collection_snapshot, "COLLECTION_PATH", str(path))
+    monkeypatch.setattr(collection_snapshot, "_current", None)
+    main.app.config["TESTING"] = True
+    return main.app.test_client(), path
+
+
+def test_changes_endpoint_returns_records_since_version(client):
+    client, path = client
+    path.write_text(json.dumps(albums((1, "a"), (2, "b"))), encoding="utf-8")
+    collection_changes.record_store(str(path))
+
+    resp = client.get("/api/collection")
+    since = int(resp.headers["X-Collection-Version"])
+    assert since == 1
+
+    path.write_text(json.dumps(albums((2, "b2"), (5, "e"))), encoding="utf-8")
+    collection_changes.record_store(str(path))
+
+    body = client.get(f"/api/collection/changes?since={since}").get_json()
+    assert body["version"] == 2
+    assert [a["title"] for a in body["added"]] == ["e"]
+    assert [a["title"] for a in body["modified"]] == ["b2"]
+    assert body["modified"][0]["cover_image"]  # normalized like /api/collection
+    assert body["removed"] == ["1"]
+
+    assert client.get("/api/collection/changes?since=2").get_json()["added"] == []
+    assert client.get("/api/collection/changes?since=0").get_json()["reset"] is True
+    assert client.get("/api/collection/changes?since=x").status_code == 400
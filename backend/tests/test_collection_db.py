@@ -0,0 +1,81 @@
+# backend/tests/test_collection_db.py
+import pytest
+
+import collection_db
+import collection_snapshot
+
+DOC = {
+    "owner": "me",
+    "records": [
+        {"id": 1, "artist": "A", "title": "One", "genre": ["Jazz"], "year": 1970,
+         "cover_image": "/images/blobs/aa.jpg", "tracklist": ["x", "y"]},
+        {"id": 2, "artist": "B", "title": "Two", "genre": ["Rock"], "year": 1980},
+        {"artist": "No id", "title": "Three"},
+    ],
+}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(collection_db, "DB_PATH", str(tmp_path / "collection.db"))
+    conn = collection_db.connect()
+    collection_db.replace_document(conn, DOC)
+    return conn
+
+
+def test_migrate_and_export_roundtrip(db):
+    assert collection_db.load_document(db) == DOC
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_albums_without_release_id_keep_images_and_tracklist(tmp_path):
+    conn = collection_db.connect(str(tmp_path / "noid.db"))
+    albums = [
+        {"artist": "x", "title": "y", "cover_image": "images/a.jpg", "tracklist": ["t"]},
+        {"id": "abc", "cover_image": "/images/b.jpg"},
+    ]
+    collection_db.replace_document(conn, albums)
+    assert collection_db.load_document(conn) == albums
+
+
+def test_row_level_updates_bump_version(db):
+    before = collection_db.current_version(db)
+    collection_db.update_album_fields(db, 2, {"cover_image": "/images/blobs/bb.jpg", "tracklist": ["z"]})
+    collection_db.update_album_fields(db, 1, {"year": 1971})
+
+    albums = collection_db.load_document(db)["records"]
+    assert albums[1]["cover_image"] == "/images/blobs/bb.jpg"
+    assert albums[1]["tracklist"] == ["z"]
+    assert albums[0]["year"] == 1971
+    assert db.execute("SELECT year FROM albums WHERE id = 1").fetchone()[0] == 1971
+    assert collection_db.current_version(db)[1] == before[1] + 2
+
+
+def test_batch_bumps_version_once_per_flush(db):
+    version = lambda: collection_db.current_version(db)[1]
+    before = version()
+    with collection_db.batch(db) as b:
+        for year in (1970, 1971, 1972):
+            collection_db.update_album_fields(db, 1, {"year": year})
+        # Rows are committed, but readers still see the old version
+        assert db.execute("SELECT year FROM albums WHERE id = 1").fetchone()[0] == 1972
+        assert version() == before
+        b.flush()
+        assert version() == before + 1
+        b.flush()  # nothing new
+        collection_db.insert_albums(db, [{"id": 9}])
+    assert version() == before + 2
+
+
+def test_snapshot_follows_database_version(db, monkeypatch):
+    monkeypatch.setattr(collection_db, "USE_SQLITE", True)
+    monkeypatch.setattr(collection_snapshot, "_current", None)
+
+    first = collection_snapshot.get_snapshot()
+    assert collection_snapshot.get_snapshot() is first
+    assert [a.get("id") for a in first.albums] == [1, 2, None]
+
+    collection_db.update_album_fields(db, 1, {"title": "Uno"})
+    second = collection_snapshot.get_snapshot()
+    assert second is not first
+    assert second.albums[0]["title"] == "Uno"
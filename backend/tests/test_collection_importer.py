@@ -0,0 +1,203 @@
+# backend/tests/test_collection_importer.py
+import hashlib
+import json
+import sys
+
+import pytest
+
+import collection_importer
+import image_cache
+import release_cache
+from image_index import ImageIndex
+from negative_cache import NegativeCache
+
+
+BLOB_URL = f"/images/blobs/{hashlib.sha256(b'img').hexdigest()}.jpg"
+
+
+class FakeResponse:
+    def __init__(self, payload=None, content=b""):
+        self._payload = payload
+        self.content = content
+        self.headers = {"Content-Type": "image/jpeg"}
+        self.status_code = 200
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    images = tmp_path / "images"
+    images.mkdir()
+    monkeypatch.setattr(image_cache, "CACHE_DIR", str(images))
+    monkeypatch.setattr(image_cache, "image_index", ImageIndex(str(images)))
+    monkeypatch.setattr(release_cache, "RELEASES_DIR", str(tmp_path / "releases"))
+    monkeypatch.setattr(image_cache, "negative_cache", NegativeCache(str(images / "negative_cache.json")))
+    collection = tmp_path / "collection.json"
+    collection.write_text(json.dumps([{"id": i, "title": f"T{i}"} for i in (1, 2, 3)]), encoding="utf-8")
+    monkeypatch.setattr(collection_importer, "COLLECTION_PATH", str(collection))
+    monkeypatch.setattr(collection_importer, "IMPORT_METRICS_PATH", str(tmp_path / "import_metrics.ndjson"))
+
+    calls = []
+
+    def fake_get(url, **kwargs):
+        calls.append(url)
+        if "/releases/" in url:
+            rid = url.rsplit("/", 1)[1]
+            return FakeResponse({"images": [{"type": "primary", "uri": f"https://img/{rid}.jpg"}]})
+        return FakeResponse(content=b"img")
+
+    monkeypatch.setattr(image_cache, "_discogs_get", fake_get)
+    monkeypatch.setattr(release_cache, "discogs_get", fake_get)
+    return collection, calls
+
+
+def _run(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["collection_importer.py", *argv])
+    collection_importer.main()
+
+
+def test_resume_merges_journal_and_skips_completed(env, monkeypatch):
+    collection, calls = env
+    # An interrupted run finished release 1 before dying
+    with open(collection_importer.journal_path(), "w", encoding="utf-8") as f:
+        f.write(json.dumps({"id": 1, "status": "downloaded", "changed": True,
+                            "fields": {"cover_image": "/images/cover_1.jpg"}}) + "\n")
+        f.write('{"id": 2, "sta')  # torn line
+
+    _run(monkeypatch, "--resume", "--workers", "2")
+
+    fetched = sorted(u for u in calls if "/releases/" in u)
+    assert [u.rsplit("/", 1)[1] for u in fetched] == ["2", "3"]
+    albums = json.loads(collection.read_text(encoding="utf-8"))
+    assert [a["cover_image"] for a in albums] == ["/images/cover_1.jpg", BLOB_URL, BLOB_URL]
+    # Checkpoint is cleared once the results are in collection.json
+    assert not (collection.parent / "collection.json.journal.ndjson").exists()
+
+
+def test_ids_filter_keeps_other_albums(env, monkeypatch):
+    collection, _ = env
+    _run(monkeypatch, "--ids", "2")
+    albums = json.loads(collection.read_text(encoding="utf-8"))
+    assert [a["id"] for a in albums] == [1, 2, 3]
+    assert albums[1]["cover_image"] == BLOB_URL
+    assert "cover_image" not in albums[0]
+
+
+def test_stream_mode_rewrites_incrementally(env, monkeypatch):
+    collection, _ = env
+    monkeypatch.setattr(collection_importer, "STREAM_BATCH_PER_WORKER", 1)
+    _run(monkeypatch, "--stream", "--ids", "1", "3")
+    albums = json.loads(collection.read_text(encoding="utf-8"))
+    assert [a["id"] for a in albums] == [1, 2, 3]
+    assert [a.get("cover_image") for a in albums] == [BLOB_URL, None, BLOB_URL]
+
+
+def test_run_appends_metrics_summary(env, monkeypatch):
+    collection, _ = env
+    _run(monkeypatch, "--ids", "1")
+    lines = (collection.parent / "import_metrics.ndjson").read_text(encoding="utf-8").splitlines()
+    entry = json.loads(lines[-1])
+    assert entry["counts"]["processed"] == 1 and entry["counts"]["downloaded"] == 1
+    assert entry["metrics"]["image_cache_lookups_total"]["result=miss"] >= 1
+
+
+def test_metadata_stage_annotates_covers_once(env, monkeypatch, tmp_path):
+    import io
+
+    Image = pytest.importorskip("PIL.Image")
+    collection, _ = env
+    buf = io.BytesIO()
+    Image.new("RGB", (40, 20), (10, 200, 10)).save(buf, "JPEG")
+    fetch_release = image_cache._discogs_get
+    monkeypatch.setattr(image_cache, "_discogs_get", lambda url, **kw: (
+        fetch_release(url) if "/releases/" in url else FakeResponse(content=buf.getvalue())))
+
+    _run(monkeypatch, "--metadata-workers", "2")
+    metas = [a["cover_meta"] for a in json.loads(collection.read_text(encoding="utf-8"))]
+    assert [(m["width"], m["height"]) for m in metas] == [(40, 20)] * 3
+    assert all(m["placeholder"].startswith("data:image/") for m in metas)
+
+    _run(monkeypatch)  # files unchanged: nothing decoded or rewritten
+    lines = (tmp_path / "import_metrics.ndjson").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["counts"]["annotated"] for line in lines] == [3, 0]
+
+
+@pytest.mark.parametrize("mode", [[], ["--stream"]])
+def test_annotation_only_run_reports_the_write(env, monkeypatch, capsys, mode):
+    pytest.importorskip("PIL.Image")
+    collection, _ = env
+    # Real JPEG bytes for the metadata stage; the first run only caches them
+    import io
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buf, "JPEG")
+    fetch_release = image_cache._discogs_get
+    monkeypatch.setattr(image_cache, "_discogs_get", lambda url, **kw: (
+        fetch_release(url) if "/releases/" in url else FakeResponse(content=buf.getvalue())))
+    _run(monkeypatch, "--no-metadata")
+    capsys.readouterr()
+
+    _run(monkeypatch, *mode)
+    out = capsys.readouterr().out
+    assert "[OK] Wrote updated collection.json" in out
+    assert "No changes to write" not in out
+    assert all("cover_meta" in a for a in json.loads(collection.read_text(encoding="utf-8")))
+
+
+def test_parallel_workers_match_sequential_run(env, monkeypatch, tmp_path, capsys):
+    import time
+
+    collection, _ = env
+    source = [{"id": i, "title": f"T{i}"} for i in range(1, 25)]
+    fetch = image_cache._discogs_get
+
+    def slow_get(url, **kwargs):
+        # Later releases answer sooner, so parallel results complete out of order
+        if "/releases/" in url:
+            time.sleep((25 - int(url.rsplit("/", 1)[1])) * 0.002)
+        return fetch(url, **kwargs)
+
+    monkeypatch.setattr(image_cache, "_discogs_get", slow_get)
+    monkeypatch.setattr(release_cache, "discogs_get", slow_get)
+
+    results = {}
+    for workers in ("1", "8"):
+        # Fresh caches per run, so both do the same downloads
+        images = tmp_path / f"images-{workers}"
+        images.mkdir()
+        monkeypatch.setattr(image_cache, "CACHE_DIR", str(images))
+        monkeypatch.setattr(image_cache, "image_index", ImageIndex(str(images)))
+        monkeypatch.setattr(image_cache, "negative_cache", NegativeCache(str(images / "negative_cache.json")))
+        monkeypatch.setattr(release_cache, "RELEASES_DIR", str(tmp_path / f"releases-{workers}"))
+        collection.write_text(json.dumps(source), encoding="utf-8")
+        capsys.readouterr()
+
+        _run(monkeypatch, "--workers", workers, "--no-metadata")
+        done = [int(line.split("id=")[1].split()[0]) for line in capsys.readouterr().out.splitlines() if " id=" in line]
+        results[workers] = (json.loads(collection.read_text(encoding="utf-8")), done)
+
+    (sequential, seq_done), (parallel, par_done) = results["1"], results["8"]
+    assert seq_done == list(range(1, 25))
+    assert par_done != seq_done and sorted(par_done) == seq_done
+    # Written back in input order, with the same updates
+    assert [a["id"] for a in parallel] == list(range(1, 25))
+    assert parallel == sequential
+    assert all(a["cover_image"] == BLOB_URL for a in parallel)
+
+
+def test_sqlite_run_publishes_one_version(env, monkeypatch, tmp_path):
+    import collection_db
+
+    collection, _ = env
+    monkeypatch.setattr(collection_db, "USE_SQLITE", True)
+    monkeypatch.setattr(collection_db, "DB_PATH", str(tmp_path / "collection.db"))
+    conn = collection_db.thread_connection()
+    collection_db.replace_document(conn, json.loads(collection.read_text(encoding="utf-8")))
+    before = collection_db.current_version(conn)[1]
+
+    _run(monkeypatch, "--no-metadata")
+    assert [a["cover_image"] for a in collection_db.load_document(conn)] == [BLOB_URL] * 3
+    assert collection_db.current_version(conn)[1] == before + 1
@@ -0,0 +1,46 @@
+# backend/tests/test_collection_index.py
+from collection_index import CollectionIndex
+
+ALBUMS = [
+    {"id": 1, "artist": "Nina Simone", "title": "Pastel Blues", "genre": "Jazz", "label": "Philips",
+     "year": 1965, "date_added": "2023-01-01"},
+    {"id": 2, "artist": "Miles Davis", "title": "Kind of Blue", "genre": ["Jazz"], "label": "Columbia",
+     "year": 1959, "date_added": "2024-05-01"},
+    {"id": 3, "artist": "The Clash", "title": "London Calling", "genre": "Rock", "label": "CBS",
+     "year": 1979, "date_added": "2022-03-01"},
+]
+
+
+def _ids(result):
+    return [a["id"] for a in result[1]]
+
+
+def test_substring_query_matches_title_and_artist():
+    idx = CollectionIndex(ALBUMS)
+    assert _ids(idx.search(q="blue")) == [2, 1]
+    assert _ids(idx.search(q="lash")) == [3]
+    assert _ids(idx.search(q="da")) == [2]
+    assert idx.search(q="zzz") == (0, [])
+
+
+def test_filters_sort_and_paging():
+    idx = CollectionIndex(ALBUMS)
+    assert _ids(idx.search(genre="jazz", sort="alpha")) == [2, 1]
+    assert _ids(idx.search(label="CBS")) == [3]
+    assert _ids(idx.search(year=1959)) == [2]
+    total, page = idx.search(sort="year", offset=1, limit=1)
+    assert total == 3 and [a["id"] for a in page] == [1]
+
+
+def test_stats_histograms_and_filters():
+    from collection_stats import compute_stats
+
+    idx = CollectionIndex(ALBUMS)
+    stats = compute_stats(idx.select())
+    assert stats["total"] == 3
+    assert stats["genre"] == {"Jazz": 2, "Rock": 1}
+    assert stats["decade"] == {"1950s": 1, "1960s": 1, "1970s": 1}
+    assert stats["genre_decade"]["Jazz"] == {"1950s": 1, "1960s": 1}
+
+    jazz = compute_stats(idx.select(genre="Jazz", label="columbia"))
+    assert jazz["total"] == 1 and jazz["year"] == {"1959": 1}
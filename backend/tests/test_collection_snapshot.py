@@ -0,0 +1,115 @@
+# backend/tests/test_collection_snapshot.py
+import json
+import os
+
+import pytest
+
+import collection_snapshot
+
+
+@pytest.fixture
+def collection_file(tmp_path, monkeypatch):
+    path = tmp_path / "collection.json"
+    monkeypatch.setattr(collection_snapshot, "COLLECTION_PATH", str(path))
+    monkeypatch.setattr(collection_snapshot, "_current", None)
+    return path
+
+
+def _write(path, data, mtime_ns):
+    path.write_text(json.dumps(data), encoding="utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_snapshot_is_reused_until_file_changes(collection_file):
+    _write(collection_file, [{"id": 1, "title": "A"}], 1_000_000_000)
+    first = collection_snapshot.get_snapshot()
+    assert collection_snapshot.get_snapshot() is first
+    assert first.albums[0]["cover_image"] == "/cover/1"
+    assert json.loads(first.body) == first.payload
+
+    _write(collection_file, [{"id": 1, "title": "A"}, {"id": 2}], 2_000_000_000)
+    second = collection_snapshot.get_snapshot()
+    assert second is not first
+    assert [a["id"] for a in second.albums] == [1, 2]
+
+
+def test_snapshot_preserves_dict_shape_and_raw(collection_file):
+    _write(collection_file, {"owner": "me", "records": [{"id": 7}]}, 1_000_000_000)
+    snap = collection_snapshot.get_snapshot()
+    payload = json.loads(snap.body)
+    assert payload["owner"] == "me"
+    assert payload["records"][0]["back_image"] == "/back/7"
+    # The raw document is not mutated by normalization
+    assert "cover_image" not in snap.raw["records"][0]
+
+
+def test_collection_api_conditional_and_gzip(collection_file):
+    import gzip
+    import main
+
+    _write(collection_file, [{"id": 1, "title": "A"}], 1_000_000_000)
+    client = main.app.test_client()
+
+    resp = client.get("/api/collection", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(resp.data))[0]["id"] == 1
+    etag = resp.headers["ETag"]
+    last_modified = resp.headers["Last-Modified"]
+
+    resp = client.get("/api/collection", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.data == b""
+
+    resp = client.get("/api/collection", headers={"If-Modified-Since": last_modified})
+    assert resp.status_code == 304
+
+    _write(collection_file, [{"id": 2}], 2_000_000_000)
+    resp = client.get("/api/collection", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert json.loads(resp.data)[0]["id"] == 2
+
+
+def test_other_processes_map_the_published_snapshot(collection_file, monkeypatch):
+    import gzip
+
+    _write(collection_file, {"owner": "me", "records": [{"id": 1}, {"id": 2}]}, 1_000_000_000)
+    built = collection_snapshot.get_snapshot()
+    assert not built.shared
+
+    # A second worker: nothing in memory yet, so it maps the published file
+    monkeypatch.setattr(collection_snapshot, "_current", None)
+    monkeypatch.setattr(collection_snapshot, "build_snapshot", lambda path=None: pytest.fail("re-parsed"))
+    mapped = collection_snapshot.get_snapshot()
+    assert mapped.shared
+    assert (mapped.version, mapped.etag, mapped.album_count) == (built.version, built.etag, 2)
+    assert mapped.body == built.body
+    assert isinstance(mapped.encoded_body("identity"), memoryview)  # served without a copy
+    assert gzip.decompress(mapped.encoded_body("gzip")) == built.body
+    assert mapped.albums == built.albums
+
+    import main
+
+    resp = main.app.test_client().get("/api/collection", headers={"Accept-Encoding": "gzip"})
+    assert resp.content_length == len(mapped.encoded_body("gzip"))
+    assert gzip.decompress(resp.data) == built.body
+
+
+def test_request_path_publishes_only_cheap_encodings(collection_file, monkeypatch):
+    # br would raise here (brotli is optional); it must not be compressed under the lock
+    monkeypatch.setattr(collection_snapshot, "available_encodings", lambda: ["br", "gzip"])
+    _write(collection_file, [{"id": 1}], 1_000_000_000)
+    collection_snapshot.get_snapshot()
+
+    monkeypatch.setattr(collection_snapshot, "_current", None)
+    mapped = collection_snapshot.get_snapshot()
+    assert mapped.shared and set(mapped._sections) == {"identity", "gzip"}
+
+
+def test_stale_shared_snapshot_is_rebuilt(collection_file, monkeypatch):
+    _write(collection_file, [{"id": 1}], 1_000_000_000)
+    collection_snapshot.get_snapshot()
+    _write(collection_file, [{"id": 1}, {"id": 2}], 2_000_000_000)
+    monkeypatch.setattr(collection_snapshot, "_current", None)
+    snap = collection_snapshot.get_snapshot()
+    assert not snap.shared and snap.album_count == 2
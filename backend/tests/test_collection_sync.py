@@ -0,0 +1,111 @@
+# backend/tests/test_collection_sync.py
+import json
+import sys
+
+import pytest
+
+import collection_importer
+import collection_sync
+import image_cache
+import release_cache
+from image_index import ImageIndex
+from negative_cache import NegativeCache
+
+
+class FakeResponse:
+    def __init__(self, payload=None, content=b""):
+        self._payload = payload
+        self.content = content
+        self.headers = {"Content-Type": "image/jpeg"}
+        self.status_code = 200
+
+    def json(self):
+        return self._payload
+
+
+def item(rid, instance_id, date):
+    return {"id": rid, "instance_id": instance_id, "date_added": date, "basic_information": {
+        "id": rid, "title": f"T{rid}", "year": 1999,
+        "artists": [{"name": "Alpha (2)", "join": "&"}, {"name": "Beta", "join": ""}],
+        "labels": [{"name": "Label (3)"}], "formats": [{"name": "Vinyl"}], "genres": ["Jazz"],
+    }}
+
+
+# Discogs collection, newest first, 2 per page
+COLLECTION = [item(30, 303, "2024-03-01"), item(20, 202, "2024-02-01"),
+              item(10, 101, "2024-01-01"), item(5, 55, "2023-01-01")]
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    images = tmp_path / "images"
+    images.mkdir()
+    monkeypatch.setattr(image_cache, "CACHE_DIR", str(images))
+    monkeypatch.setattr(image_cache, "image_index", ImageIndex(str(images)))
+    monkeypatch.setattr(image_cache, "negative_cache", NegativeCache(str(images / "negative_cache.json")))
+    monkeypatch.setattr(release_cache, "RELEASES_DIR", str(tmp_path / "releases"))
+    monkeypatch.setattr(collection_importer, "IMPORT_METRICS_PATH", str(tmp_path / "metrics.ndjson"))
+    monkeypatch.setattr(collection_sync, "DISCOGS_USER", "me")
+    collection = tmp_path / "collection.json"
+    monkeypatch.setattr(collection_importer, "COLLECTION_PATH", str(collection))
+
+    calls = []
+
+    def fake_get(url, params=None, **kwargs):
+        calls.append((url, params))
+        if "/collection/folders/0/releases" in url:
+            page = params["page"]
+            per = params["per_page"]
+            return FakeResponse({"pagination": {"pages": 2},
+                                 "releases": COLLECTION[(page - 1) * per:page * per]})
+        if "/releases/" in url:
+            rid = url.rsplit("/", 1)[1]
+            return FakeResponse({"images": [{"type": "primary", "uri": f"https://img/{rid}.jpg"}],
+                                 "tracklist": [{"title": "One"}, {"title": "Two"}]})
+        return FakeResponse(content=b"img")
+
+    monkeypatch.setattr(collection_sync, "discogs_get", fake_get)
+    monkeypatch.setattr(image_cache, "_discogs_get", fake_get)
+    monkeypatch.setattr(release_cache, "discogs_get", fake_get)
+    return collection, calls
+
+
+def _pages(calls):
+    return [p["page"] for url, p in calls if "/collection/" in url]
+
+
+def test_sync_stops_at_first_known_instance(env):
+    collection, calls = env
+    collection.write_text(json.dumps([{"id": 10, "instance_id": 101, "title": "old"}]), encoding="utf-8")
+    new_ids = collection_sync.sync_collection(per_page=2)
+
+    assert new_ids == [30, 20]
+    assert _pages(calls) == [1, 2]  # page 2 holds the known instance; never page 3
+    albums = json.loads(collection.read_text(encoding="utf-8"))
+    assert [a["id"] for a in albums] == [30, 20, 10]
+    assert albums[0]["artist"] == "Alpha & Beta" and albums[0]["label"] == "Label"
+    assert albums[0]["tracklist"] == ["One", "Two"]
+
+
+def test_quiet_day_costs_one_call_and_backfills_legacy(env, monkeypatch):
+    collection, calls = env
+    collection.write_text(json.dumps([{"id": 30, "title": "legacy"}]), encoding="utf-8")
+    monkeypatch.setattr(sys, "argv", ["collection_importer.py", "--sync"])
+    collection_importer.main()
+
+    assert len(calls) == 1
+    assert json.loads(collection.read_text(encoding="utf-8")) == [{"id": 30, "title": "legacy", "instance_id": 303}]
+
+
+def test_importer_sync_refreshes_only_new_albums(env, monkeypatch):
+    collection, calls = env
+    collection.write_text(json.dumps([{"id": 20, "instance_id": 202}, {"id": 10, "instance_id": 101}]), encoding="utf-8")
+    monkeypatch.setattr(sys, "argv", ["collection_importer.py", "--sync"])
+    collection_importer.main()
+
+    albums = json.loads(collection.read_text(encoding="utf-8"))
+    assert [a["id"] for a in albums] == [30, 20, 10]
+    assert albums[0]["cover_image"].startswith("/images/blobs/")
+    assert "cover_image" not in albums[1]
+    # The release payload fetched for the tracklist is reused for the images
+    assert sum(1 for url, _ in calls if url.endswith("/releases/30")) == 1
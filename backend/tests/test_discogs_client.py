@@ -0,0 +1,53 @@
+# backend/tests/test_discogs_client.py
+import discogs_client
+from discogs_client import DiscogsClient, RateLimiter
+
+
+class FakeResponse:
+    def __init__(self, status, headers=None):
+        self.status_code = status
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+
+def test_limiter_follows_discogs_headers():
+    limiter = RateLimiter(60)
+    limiter.update_from_headers({"X-Discogs-Ratelimit": "25", "X-Discogs-Ratelimit-Remaining": "3"})
+    assert limiter.capacity == 25
+    assert 3 <= limiter.tokens < 3.1
+
+
+def test_429_is_retried_after_retry_after(monkeypatch):
+    clock = [1000.0]
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(discogs_client.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(discogs_client.time, "sleep", fake_sleep)
+    client = DiscogsClient(token="t", api_base="https://api.example", per_minute=60)
+    responses = [FakeResponse(429, {"Retry-After": "2"}), FakeResponse(200, {"X-Discogs-Ratelimit-Remaining": "59"})]
+    seen_headers = []
+
+    def fake_get(url, headers=None, **kwargs):
+        seen_headers.append(headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(client.session, "get", fake_get)
+    resp = client.get("/releases/1")
+    assert resp.status_code == 200
+    assert seen_headers[0]["Authorization"] == "Discogs token=t"
+    # The 429 paused the bucket; the retry waited ~Retry-After before going out
+    assert sleeps and 1.9 <= sum(sleeps) <= 2.1
+
+
+def test_cdn_downloads_skip_the_rate_limiter(monkeypatch):
+    client = DiscogsClient(token="t", api_base="https://api.example", per_minute=1)
+    client.limiter.tokens = 0
+    monkeypatch.setattr(client.session, "get", lambda url, headers=None, **kw: FakeResponse(200))
+    assert client.get("https://i.example/cover.jpg").status_code == 200
@@ -0,0 +1,30 @@
+# backend/tests/test_fetch_tracklists.py
+import json
+import sys
+
+import collection_importer
+import fetch_tracklists
+
+
+def test_backfills_dict_shape_with_periodic_flushes(tmp_path, monkeypatch):
+    collection = tmp_path / "collection.json"
+    collection.write_text(json.dumps({"records": [
+        {"id": 1, "title": "Has", "tracklist": ["x"]},
+        {"id": 2, "title": "Old", "date_added": "2020-01-01"},
+        {"id": 3, "title": "New", "date_added": "2024-02-01"},
+        {"id": 4, "title": "Newer", "date_added": "2024-03-01"},
+    ]}), encoding="utf-8")
+    monkeypatch.setattr(collection_importer, "COLLECTION_PATH", str(collection))
+    fetched = []
+
+    def fake_release(release_id, max_age=None):
+        fetched.append(release_id)
+        return {"tracklist": [{"title": f"{release_id}-A"}, {"title": f"{release_id}-B"}]}
+
+    monkeypatch.setattr(fetch_tracklists, "get_release", fake_release)
+    monkeypatch.setattr(sys, "argv", ["fetch_tracklists.py", "--since", "2024-01-01", "--flush-every", "1"])
+    fetch_tracklists.main()
+
+    assert sorted(fetched) == [3, 4]
+    records = json.loads(collection.read_text(encoding="utf-8"))["records"]
+    assert [r.get("tracklist") for r in records] == [["x"], None, ["3-A", "3-B"], ["4-A", "4-B"]]
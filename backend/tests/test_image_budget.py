@@ -0,0 +1,75 @@
+# backend/tests/test_image_budget.py
+import os
+import time
+
+import pytest
+
+import image_cache
+import main
+from image_budget import DiskBudget
+from image_index import ImageIndex
+from negative_cache import NegativeCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    index = ImageIndex(str(tmp_path))
+    budget = DiskBudget(str(tmp_path), index, max_bytes=250)
+    monkeypatch.setattr(image_cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(image_cache, "image_index", index)
+    monkeypatch.setattr(image_cache, "disk_budget", budget)
+    monkeypatch.setattr(image_cache, "negative_cache", NegativeCache(str(tmp_path / "negative_cache.json")))
+    monkeypatch.setattr(main, "IMAGES_DIR", str(tmp_path))
+
+    old = time.time() - 3600
+    files = {}
+
+    def put(name, served_ago, kind=None, rid=None):
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (old + 3000 - served_ago, old))
+        if kind:
+            index.assign(kind, rid, name)
+        files[name] = path
+
+    put("blobs/pinned.jpg", 5000, "cover", 1)      # oldest, but pinned
+    put("blobs/back1.jpg", 10, "back", 1)
+    put("blobs/gone.jpg", 20, "cover", 2)          # release 2 left the collection
+    put("derived/pinned_w256.jpg", 30)
+    put("blobs/orphan.jpg", 1)                     # most recently served, still first out
+    return budget, index, files
+
+
+def test_evicts_orphans_derived_then_backs_keeping_pinned_covers(cache):
+    budget, index, files = cache
+    assert budget.enforce(pinned=[1]) == (3, 300)
+
+    remaining = {name for name, path in files.items() if path.exists()}
+    assert remaining == {"blobs/pinned.jpg", "blobs/gone.jpg"}
+    assert index.lookup("back", 1) is None
+    assert index.is_evicted("back", 1)
+    # Cover requests do not pull an evicted back straight back in
+    assert image_cache.lookup_release_images(1) == ("/images/blobs/pinned.jpg", None)
+
+
+def test_evicted_url_redirects_and_back_route_refetches(cache, monkeypatch):
+    budget, index, files = cache
+    budget.enforce(pinned=[1])
+    client = main.app.test_client()
+
+    resp = client.get("/images/blobs/back1.jpg")
+    assert resp.status_code == 302
+    assert resp.headers["Location"].endswith("/back/1")
+
+    fetched = []
+
+    def fake_fetch(release_id):
+        fetched.append(release_id)
+        index.assign("back", release_id, "blobs/pinned.jpg")
+        return image_cache.cached_image_url("cover", release_id), image_cache.cached_image_url("back", release_id)
+
+    monkeypatch.setattr(image_cache, "_fetch_release_images", fake_fetch)
+    assert client.get("/back/1").status_code == 200
+    assert fetched == [1]
+    assert not index.is_evicted("back", 1)
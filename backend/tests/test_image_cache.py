@@ -0,0 +1,236 @@
+# backend/tests/test_image_cache.py
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+
+import image_cache
+import release_cache
+from image_index import ImageIndex
+from negative_cache import NegativeCache
+
+
+def blob_url(content):
+    return f"/images/blobs/{hashlib.sha256(content).hexdigest()}.jpg"
+
+
+class FakeResponse:
+    def __init__(self, payload=None, content=b"", ctype="image/jpeg"):
+        self._payload = payload
+        self.content = content
+        self.headers = {"Content-Type": ctype}
+        self.status_code = 200
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(image_cache, "image_index", ImageIndex(str(tmp_path)))
+    monkeypatch.setattr(release_cache, "RELEASES_DIR", str(tmp_path / "releases"))
+    monkeypatch.setattr(image_cache, "negative_cache", NegativeCache(str(tmp_path / "negative_cache.json")))
+    return tmp_path
+
+
+@pytest.fixture
+def fake_discogs(monkeypatch):
+    calls = []
+
+    def fake_get(url, **kwargs):
+        calls.append(url)
+        if "/releases/" in url:
+            time.sleep(0.05)  # keep the first flight open while others arrive
+            return FakeResponse({"images": [
+                {"type": "primary", "uri": "https://img/front.jpg"},
+                {"type": "secondary", "uri": "https://img/back.jpg"},
+            ]})
+        return FakeResponse(content=b"IMG:" + url.encode())
+
+    monkeypatch.setattr(image_cache, "_discogs_get", fake_get)
+    monkeypatch.setattr(release_cache, "discogs_get", fake_get)
+    return calls
+
+
+def test_concurrent_misses_share_one_fetch(cache_dir, fake_discogs):
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(image_cache.ensure_release_images(42)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len([u for u in fake_discogs if "/releases/" in u]) == 1
+    front, back = b"IMG:https://img/front.jpg", b"IMG:https://img/back.jpg"
+    assert set(results) == {(blob_url(front), blob_url(back))}
+    assert (cache_dir / blob_url(front)[len("/images/"):]).read_bytes() == front
+    # No temp files left behind by the atomic writes
+    assert not [p.name for p in cache_dir.rglob(".tmp-*")]
+
+
+def test_cached_release_makes_no_upstream_calls(cache_dir, fake_discogs):
+    (cache_dir / "cover_7.png").write_bytes(b"x")
+    (cache_dir / "back_7.jpg").write_bytes(b"y")
+    assert image_cache.ensure_release_images(7) == ("/images/cover_7.png", "/images/back_7.jpg")
+    assert fake_discogs == []
+
+
+def test_backless_release_is_negatively_cached(cache_dir, monkeypatch):
+    calls = []
+
+    def fake_get(url, **kwargs):
+        calls.append(url)
+        if "/releases/" in url:
+            return FakeResponse({"images": [{"type": "primary", "uri": "https://img/front.jpg"}]})
+        return FakeResponse(content=b"front")
+
+    monkeypatch.setattr(image_cache, "_discogs_get", fake_get)
+    monkeypatch.setattr(release_cache, "discogs_get", fake_get)
+    assert image_cache.ensure_release_images(9) == (blob_url(b"front"), None)
+    assert len(calls) == 2
+    # Later /back/9 requests are answered without asking Discogs again
+    assert image_cache.ensure_release_images(9) == (blob_url(b"front"), None)
+    assert len(calls) == 2
+
+
+def test_upstream_failure_backs_off(cache_dir, monkeypatch):
+    calls = []
+
+    def failing_get(url, **kwargs):
+        calls.append(url)
+        raise RuntimeError("502 from Discogs")
+
+    monkeypatch.setattr(image_cache, "_discogs_get", failing_get)
+    monkeypatch.setattr(release_cache, "discogs_get", failing_get)
+    assert image_cache.ensure_release_images(5) == (image_cache.FALLBACK_IMAGE, None)
+    assert image_cache.ensure_release_images(5) == (image_cache.FALLBACK_IMAGE, None)
+    assert len(calls) == 1
+    assert image_cache.negative_cache.is_suppressed(5, "error")
+
+
+def test_negative_cache_batches_writes_and_merges_other_processes(tmp_path, monkeypatch):
+    import json
+    import negative_cache
+
+    monkeypatch.setattr(negative_cache, "RELOAD_INTERVAL_SEC", 0)
+    path = tmp_path / "negative_cache.json"
+    ours, theirs = NegativeCache(str(path)), NegativeCache(str(path))
+    for rid in range(1, 4):
+        ours.record_missing(rid, "no_back")
+    theirs.record_failure(9)
+    assert not path.exists()  # nothing written until a flush
+
+    theirs.flush()
+    ours.clear(1)
+    ours.flush()
+    assert sorted(json.loads(path.read_text())) == ["2", "3", "9"]
+    assert theirs.is_suppressed(2, "no_back") and not theirs.is_suppressed(1, "no_back")
+    assert ours.is_suppressed(9, "error")
+    assert path.stat().st_mode & 0o777 == 0o644
+
+    def broken_dump(*args, **kwargs):
+        raise ValueError("not serializable")
+
+    monkeypatch.setattr(negative_cache.json, "dump", broken_dump)
+    ours.record_missing(4, "no_back")
+    with pytest.raises(ValueError):
+        ours.flush()
+    assert not list(tmp_path.glob(".tmp-*"))
+
+
+def test_image_index_prefers_jpg_and_sees_external_writes(tmp_path, monkeypatch):
+    import image_index
+
+    monkeypatch.setattr(image_index, "REFRESH_INTERVAL_SEC", 0)
+    (tmp_path / "cover_1.webp").write_bytes(b"w")
+    (tmp_path / "cover_1.jpg").write_bytes(b"j")
+    (tmp_path / "cover_1_w128.jpg").write_bytes(b"not an original")
+    idx = ImageIndex(str(tmp_path))
+    assert idx.lookup("cover", 1) == "cover_1.jpg"
+    assert idx.lookup("back", 1) is None
+
+    # Written by another process: picked up through the directory mtime
+    (tmp_path / "back_1.png").write_bytes(b"b")
+    st = tmp_path.stat()
+    os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert idx.lookup("back", 1) == "back_1.png"
+
+
+def test_manifest_journal_is_shared_and_compacted(tmp_path, monkeypatch):
+    import image_index
+
+    monkeypatch.setattr(image_index, "REFRESH_INTERVAL_SEC", 0)
+    monkeypatch.setattr(image_index, "COMPACT_MIN_LINES", 3)
+    a, b = ImageIndex(str(tmp_path)), ImageIndex(str(tmp_path))
+    a.assign("cover", 1, "blobs/x.jpg", "http://img/1")
+    b.assign("cover", 2, "blobs/y.jpg")  # b catches up on a's line before appending
+    assert a.lookup("cover", 2) == "blobs/y.jpg"
+    assert b.blob_for_source("http://img/1") == "blobs/x.jpg"
+    assert not (tmp_path / "manifest.json").exists()
+
+    for rid in range(3, 6):
+        a.assign("cover", rid, "blobs/z.jpg")
+    assert b.unassign_blob("blobs/z.jpg") == ["cover:3", "cover:4", "cover:5"]
+
+    # Compacted into manifest.json; every index, old or new, agrees
+    assert (tmp_path / "manifest.json").stat().st_mode & 0o777 == 0o644
+    assert (tmp_path / "manifest.log").stat().st_mode & 0o777 == 0o644
+    for idx in (a, b, ImageIndex(str(tmp_path))):
+        assert idx.images() == {"cover:1": "blobs/x.jpg", "cover:2": "blobs/y.jpg"}
+        assert idx.is_evicted("cover", 4)
+
+
+def test_shared_artwork_is_stored_once(cache_dir, monkeypatch):
+    downloads = []
+
+    def fake_get(url, **kwargs):
+        if "/releases/" in url:
+            # Two pressings, different image URLs, identical bytes
+            rid = url.rsplit("/", 1)[1]
+            return FakeResponse({"images": [{"type": "primary", "uri": f"https://img/{rid}.jpg"}]})
+        downloads.append(url)
+        return FakeResponse(content=b"same artwork")
+
+    monkeypatch.setattr(image_cache, "_discogs_get", fake_get)
+    monkeypatch.setattr(release_cache, "discogs_get", fake_get)
+    first, _ = image_cache.ensure_release_images(100)
+    second, _ = image_cache.ensure_release_images(101)
+    assert first == second == blob_url(b"same artwork")
+    assert len(list((cache_dir / "blobs").iterdir())) == 1
+    # The manifest survives a fresh index (e.g. another process)
+    assert ImageIndex(str(cache_dir)).lookup("cover", 101) == first[len("/images/"):]
+
+
+def test_release_fetch_lock_excludes_other_processes(cache_dir):
+    import fcntl
+    import multiprocessing
+
+    ctx = multiprocessing.get_context("fork")
+    locked, release = ctx.Event(), ctx.Event()
+
+    def hold():
+        with image_cache.release_fetch_lock(42):
+            locked.set()
+            release.wait(5)
+
+    child = ctx.Process(target=hold)
+    child.start()
+    try:
+        assert locked.wait(5)
+        fd = image_cache._lock_fd()
+        with pytest.raises(OSError):
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, 42)
+        # Other releases are not blocked
+        fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, 43)
+        fcntl.lockf(fd, fcntl.LOCK_UN, 1, 43)
+    finally:
+        release.set()
+        child.join(5)
+    with image_cache.release_fetch_lock(42):
+        pass
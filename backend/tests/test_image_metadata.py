@@ -0,0 +1,59 @@
+# backend/tests/test_image_metadata.py
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import image_cache
+import image_metadata
+
+PIL = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_cache, "CACHE_DIR", str(tmp_path))
+    (tmp_path / "blobs").mkdir()
+    return tmp_path
+
+
+def _image(path, size, color):
+    PIL.new("RGB", size, color).save(path, "JPEG")
+
+
+def test_annotate_records_metadata_and_skips_unchanged_files(cache_dir):
+    _image(cache_dir / "blobs" / "front.jpg", (300, 200), (200, 30, 30))
+    _image(cache_dir / "blobs" / "back.jpg", (100, 100), (0, 0, 250))
+    album = {"id": 1, "cover_image": "/images/blobs/front.jpg", "back_image": "/images/blobs/back.jpg"}
+
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        assert image_metadata.annotate([album], pool) == [album]
+        cover = album["cover_meta"]
+        assert (cover["width"], cover["height"], cover["src"]) == (300, 200, "blobs/front.jpg")
+        r, g, b = (int(cover["color"][i:i + 2], 16) for i in (1, 3, 5))
+        assert r > 180 and g < 60 and b < 60
+        assert cover["placeholder"].startswith("data:image/")
+        assert len(cover["placeholder"]) < 1000
+        assert "placeholder" not in album["back_meta"]
+
+        # Same files: nothing is decoded again
+        assert image_metadata.annotate([album], pool) == []
+
+        # The cover fell back (e.g. evicted and refetch failed): its metadata goes
+        album["cover_image"] = image_cache.FALLBACK_IMAGE
+        assert image_metadata.annotate([album], pool) == [album]
+        assert "cover_meta" not in album and "back_meta" in album
+
+
+def test_oversized_image_is_skipped_with_a_warning(cache_dir, monkeypatch, capsys):
+    from concurrent.futures import ThreadPoolExecutor
+
+    _image(cache_dir / "blobs" / "huge.jpg", (100, 100), (0, 0, 0))
+    _image(cache_dir / "blobs" / "small.jpg", (10, 10), (0, 0, 0))
+    monkeypatch.setattr(PIL, "MAX_IMAGE_PIXELS", 400)  # huge.jpg is a decompression bomb now
+    albums = [{"id": 1, "cover_image": "/images/blobs/huge.jpg"},
+              {"id": 2, "cover_image": "/images/blobs/small.jpg"}]
+
+    with ThreadPoolExecutor(max_workers=2) as pool:  # threads: the patched limit applies
+        assert image_metadata.annotate(albums, pool) == [albums[1]]
+    assert "cover_meta" not in albums[0]
+    assert "id=1: could not read blobs/huge.jpg" in capsys.readouterr().err
@@ -0,0 +1,52 @@
+# backend/tests/test_image_routes.py
+import pytest
+
+import image_cache
+import main
+from image_index import ImageIndex
+from negative_cache import NegativeCache
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "IMAGES_DIR", str(tmp_path))
+    monkeypatch.setattr(image_cache, "image_index", ImageIndex(str(tmp_path)))
+    monkeypatch.setattr(image_cache, "negative_cache", NegativeCache(str(tmp_path / "negative_cache.json")))
+    (tmp_path / "cover_3.jpg").write_bytes(b"\xff\xd8cover")
+    (tmp_path / "back_3.jpg").write_bytes(b"\xff\xd8back")
+    return main.app.test_client()
+
+
+def test_images_are_cacheable_and_revalidate(client):
+    resp = client.get("/cover/3")
+    assert resp.status_code == 200
+    assert resp.cache_control.public and resp.cache_control.max_age == main.RELEASE_IMAGE_MAX_AGE
+    resp = client.get("/cover/3", headers={"If-None-Match": resp.headers["ETag"]})
+    assert resp.status_code == 304
+
+
+def test_versioned_urls_are_immutable(client):
+    resp = client.get("/images/back_3.jpg?v=abc")
+    assert resp.cache_control.immutable
+    assert resp.cache_control.max_age == main.IMMUTABLE_MAX_AGE
+
+
+def test_release_routes_to_blobs_are_not_immutable(client, tmp_path):
+    (tmp_path / "blobs").mkdir()
+    (tmp_path / "blobs" / "abc.jpg").write_bytes(b"\xff\xd8blob")
+    image_cache.image_index.assign("cover", 3, "blobs/abc.jpg")
+
+    resp = client.get("/cover/3")
+    assert resp.data == b"\xff\xd8blob"
+    assert not resp.cache_control.immutable
+    assert resp.cache_control.max_age == main.RELEASE_IMAGE_MAX_AGE
+    assert client.get("/images/blobs/abc.jpg").cache_control.immutable
+
+
+def test_nginx_sendfile_mode_only_resolves_the_path(client, monkeypatch):
+    monkeypatch.setattr(main, "IMAGE_SENDFILE", "nginx")
+    resp = client.get("/back/3")
+    assert resp.headers["X-Accel-Redirect"] == "/_images/back_3.jpg"
+    assert resp.data == b""
+    assert client.get("/images/missing.jpg").status_code == 404
@@ -0,0 +1,51 @@
+# backend/tests/test_image_variants.py
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+import image_cache
+import image_variants
+import main
+from image_index import ImageIndex
+from negative_cache import NegativeCache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "IMAGES_DIR", str(tmp_path))
+    monkeypatch.setattr(image_cache, "image_index", ImageIndex(str(tmp_path)))
+    monkeypatch.setattr(image_cache, "negative_cache", NegativeCache(str(tmp_path / "negative_cache.json")))
+    Image.new("RGB", (1200, 1000), (200, 30, 30)).save(tmp_path / "cover_1.png")
+    Image.new("RGB", (600, 600), (0, 0, 200)).save(tmp_path / "back_1.jpg")
+    return tmp_path
+
+
+def test_variant_is_generated_once_and_snapped(cache_dir):
+    rel = image_variants.ensure_variant("cover_1.png", 100)
+    assert rel == "derived/cover_1_w128.jpg"
+    with Image.open(cache_dir / rel) as img:
+        assert img.size == (128, 107)
+    mtime = (cache_dir / rel).stat().st_mtime_ns
+    assert image_variants.ensure_variant("cover_1.png", 128) == rel
+    assert (cache_dir / rel).stat().st_mtime_ns == mtime
+
+
+def test_thumb_routes_serve_variants(cache_dir):
+    client = main.app.test_client()
+    resp = client.get("/thumb_1.jpg")
+    assert resp.status_code == 200 and resp.mimetype == "image/jpeg"
+    assert (cache_dir / "derived" / "cover_1_w256.jpg").exists()
+
+    resp = client.get("/back/1?w=64&fmt=webp")
+    assert resp.status_code == 200 and resp.mimetype == "image/webp"
+    assert client.get("/cover/1?w=64&fmt=gif").status_code == 400
+
+
+def test_oversized_original_falls_back_instead_of_failing(cache_dir, monkeypatch):
+    # Over twice MAX_IMAGE_PIXELS: Pillow raises DecompressionBombError
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    assert image_variants.ensure_variant("back_1.jpg", 64) is None
+    resp = main.app.test_client().get("/back/1/thumb")
+    assert resp.status_code == 200
+    assert resp.data == (cache_dir / "back_1.jpg").read_bytes()
@@ -0,0 +1,28 @@
+# backend/tests/test_metrics.py
+import main
+import metrics
+
+
+def test_render_prometheus_text():
+    reg = metrics.Registry()
+    c = reg.register(metrics.Counter("jobs_total", "Jobs", ["kind"]))
+    h = reg.register(metrics.Histogram("job_seconds", "Job time", buckets=(0.1, 1.0)))
+    c.labels(kind='a"b').inc(2)
+    h.observe(0.05)
+    h.observe(5)
+
+    text = reg.render()
+    assert '# TYPE jobs_total counter' in text
+    assert 'jobs_total{kind="a\\"b"} 2' in text
+    assert 'job_seconds_bucket{le="0.1"} 1' in text
+    assert 'job_seconds_bucket{le="+Inf"} 2' in text
+    assert 'job_seconds_count 2' in text
+    assert reg.as_dict()["job_seconds"]["count"] == 2
+
+
+def test_metrics_endpoint_reports_routes_by_rule():
+    client = main.app.test_client()
+    client.get("/api/collection/search?limit=oops")
+    body = client.get("/metrics").get_data(as_text=True)
+    assert 'http_requests_total{route="/api/collection/search",method="GET",status="400"}' in body
+    assert "discogs_requests_total" in body and "image_cache_lookups_total" in body
@@ -0,0 +1,72 @@
+# backend/tests/test_prefetch.py
+import threading
+import time
+
+import pytest
+
+import image_cache
+import prefetch
+from image_index import ImageIndex
+from negative_cache import NegativeCache
+
+
+def test_promoted_ids_jump_the_queue_and_full_queue_drops_low():
+    order = []
+    gate = threading.Event()
+
+    def fetch(rid):
+        gate.wait(2)
+        order.append(rid)
+
+    q = prefetch.PrefetchQueue(fetch, maxsize=3, workers=1)
+    first = q.enqueue(1)          # taken by the worker, blocks on the gate
+    while len(q):
+        time.sleep(0.001)
+    q.enqueue_many([2, 3, 4])
+    assert q.enqueue(5) is None   # LOW dropped when full
+    done = q.enqueue(4, prefetch.HIGH)
+    assert q.enqueue(6, prefetch.HIGH) is not None  # HIGH always accepted
+    gate.set()
+
+    assert first.wait(2) and done.wait(2)
+    assert order[:3] == [1, 4, 6]
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(image_cache, "image_index", ImageIndex(str(tmp_path)))
+    monkeypatch.setattr(image_cache, "negative_cache", NegativeCache(str(tmp_path / "negative_cache.json")))
+    monkeypatch.setattr(prefetch, "ENABLED", True)
+    return tmp_path
+
+
+def test_slow_miss_returns_fallback_as_pending(cache_dir, monkeypatch):
+    release = threading.Event()
+
+    def slow_fetch(rid):
+        release.wait(2)
+        (cache_dir / f"cover_{rid}.jpg").write_bytes(b"img")
+        (cache_dir / f"back_{rid}.jpg").write_bytes(b"img")
+        image_cache.image_index.record(f"cover_{rid}.jpg")
+        image_cache.image_index.record(f"back_{rid}.jpg")
+
+    monkeypatch.setattr(prefetch, "prefetcher", prefetch.PrefetchQueue(slow_fetch, workers=1))
+    monkeypatch.setattr(prefetch, "WAIT_SEC", 0.05)
+
+    cover, back, pending = prefetch.resolve_release_images(9)
+    assert (cover, back, pending) == (image_cache.FALLBACK_IMAGE, None, True)
+
+    release.set()
+    prefetch.prefetcher.enqueue(9, prefetch.HIGH).wait(2)
+    assert prefetch.resolve_release_images(9) == ("/images/cover_9.jpg", "/images/back_9.jpg", False)
+
+
+def test_collection_enqueues_only_uncached_releases(cache_dir, monkeypatch):
+    queued = []
+    monkeypatch.setattr(prefetch.prefetcher, "enqueue_many", lambda ids, priority: queued.extend(ids) or len(ids))
+    (cache_dir / "cover_1.jpg").write_bytes(b"img")
+    (cache_dir / "back_1.jpg").write_bytes(b"img")
+
+    prefetch.enqueue_uncached([{"id": 1}, {"id": 2}, {"title": "no id"}])
+    assert queued == [2]
@@ -0,0 +1,47 @@
+# backend/tests/test_release_cache.py
+import pytest
+
+import release_cache
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = headers or {}
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture
+def releases_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(release_cache, "RELEASES_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_release_is_fetched_once_and_revalidated_conditionally(releases_dir, monkeypatch):
+    sent = []
+    responses = [
+        FakeResponse(200, {"id": 1, "tracklist": [{"title": "A"}]}, {"ETag": '"v1"'}),
+        FakeResponse(304),
+    ]
+
+    def fake_get(url, headers=None, **kwargs):
+        sent.append(headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(release_cache, "discogs_get", fake_get)
+
+    assert release_cache.get_release(1)["tracklist"][0]["title"] == "A"
+    assert release_cache.get_release(1)["id"] == 1  # fresh: served from disk
+    assert len(sent) == 1
+
+    # Stale entry: revalidated with the stored ETag, 304 keeps the payload
+    assert release_cache.get_release(1, max_age=0)["id"] == 1
+    assert sent[1] == {"If-None-Match": '"v1"'}
+
+
+def test_offline_never_calls_discogs(releases_dir, monkeypatch):
+    monkeypatch.setattr(release_cache, "discogs_get", lambda *a, **k: pytest.fail("network used"))
+    assert release_cache.get_release(5, offline=True) is None
@@ -0,0 +1,32 @@
+# backend/wsgi.py
+"""
+Production WSGI entry point.
+
+`flask run` is a single-process development server: one slow /cover/<id>
+miss holds up everything else. Serve with gunicorn instead (settings in
+gunicorn.conf.py, see deploy/record-collection.service):
+
+  gunicorn -c gunicorn.conf.py wsgi:app
+
+Each worker process imports the app on its own (no preload), so threads
+(prefetch workers, the image budget) and SQLite connections start after
+the fork. Workers share:
+- the serialized collection through the memory-mapped collection.snapshot
+  (collection_snapshot.py), built once per version
+- image-miss fetches through a per-release file lock (image_cache.py), so
+  two workers never download the same release
+- negative cache, release cache, image manifest and change log on disk
+
+/metrics is per worker: each scrape sees whichever worker answered.
+"""
+from flask import Flask
+
+
+def create_app() -> Flask:
+    """The Flask app from main.py (routes and hooks are registered on import)."""
+    from main import app as flask_app
+
+    return flask_app
+
+
+app = create_app()
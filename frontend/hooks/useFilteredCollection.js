@@ -1,38 +1,71 @@
-import { useEffect, useState, useMemo } from 'react';
+import { useCallback, useEffect, useRef, useState } from 'react';
+
+// Server-side search (/api/collection/search): the browser only ever holds the
+// pages it shows, however large the collection is.
+const PAGE_SIZE = 200;
+const DEBOUNCE_MS = 250;
+
+function searchUrl({ term, genre, label, year, sort }, offset) {
+  const params = new URLSearchParams({ sort: sort || 'recent', offset: String(offset), limit: String(PAGE_SIZE) });
+  if (term) params.set('q', term);
+  if (genre) params.set('genre', genre);
+  if (label) params.set('label', label);
+  if (year) params.set('year', year);
+  return `/api/collection/search?${params}`;
+}
+
+async function fetchPage(filters, offset, signal) {
+  const res = await fetch(searchUrl(filters, offset), { signal });
+  if (!res.ok) throw new Error(`HTTP ${res.status} ${res.statusText}`);
+  return res.json();
+}
 
 export default function useFilteredCollection(filters) {
   const [albums, setAlbums] = useState([]);
+  const [total, setTotal] = useState(0);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [term, setTerm] = useState(filters.term || '');
+  const pending = useRef(null);
 
+  // Typing only searches once the user pauses
   useEffect(() => {
-    let cancelled = false;
-    async function fetchCollection() {
-      try {
-        const res = await fetch('/api/collection');
-        const data = await res.json();
-        if (!cancelled) setAlbums(data);
-      } catch (err) {
-        if (!cancelled) setError(err);
-      } finally {
-        if (!cancelled) setIsLoading(false);
-      }
-    }
-    fetchCollection();
-    return () => { cancelled = true; };
-  }, []);
-
-  const filtered = useMemo(() => {
-    const { term, genre, year } = filters;
-    return albums.filter(album => {
-      const title = album.title?.toLowerCase() || '';
-      const artist = album.artist?.toLowerCase() || '';
-      const matchesTerm = !term || title.includes(term.toLowerCase()) || artist.includes(term.toLowerCase());
-      const matchesGenre = !genre || (album.genre || '').toLowerCase().includes(genre.toLowerCase());
-      const matchesYear = !year || album.year === Number(year);
-      return matchesTerm && matchesGenre && matchesYear;
-    });
-  }, [albums, filters]);
-
-  return { albums: filtered, isLoading, error };
+    const timer = setTimeout(() => setTerm(filters.term || ''), DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [filters.term]);
+
+  const { genre, label, year, sort } = filters;
+  const query = { term, genre, label, year, sort };
+
+  useEffect(() => {
+    const controller = new AbortController();
+    pending.current = controller;
+    fetchPage(query, 0, controller.signal)
+      .then(data => {
+        setAlbums(data.items);
+        setTotal(data.total);
+        setError(null);
+      })
+      .catch(err => {
+        if (err.name !== 'AbortError') setError(err);
+      })
+      .finally(() => {
+        if (!controller.signal.aborted) setIsLoading(false);
+      });
+    return () => controller.abort();
+  }, [term, genre, label, year, sort]);
+
+  const loadMore = useCallback(() => {
+    const controller = pending.current;
+    fetchPage(query, albums.length, controller?.signal)
+      .then(data => {
+        setAlbums(prev => (prev.length === data.offset ? prev.concat(data.items) : prev));
+        setTotal(data.total);
+      })
+      .catch(err => {
+        if (err.name !== 'AbortError') setError(err);
+      });
+  }, [albums.length, term, genre, label, year, sort]);
+
+  return { albums, total, hasMore: albums.length < total, loadMore, isLoading, error };
 }
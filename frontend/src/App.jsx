@@ -1,5 +1,5 @@
 // frontend/src/App.jsx
-import React, { useMemo, useState } from "react";
+import React, { useState } from "react";
 import { Routes, Route, Link, useLocation, BrowserRouter } from "react-router-dom";
 import GalleryView from "./views/GalleryView.jsx";
 import ListView from "./views/ListView.jsx";
@@ -17,26 +17,11 @@ export default function Root() {
   const [genre, setGenre] = useState("");
   const [label, setLabel] = useState("");
   const [year, setYear] = useState("");
-  const [sort, setSort] = useState("recent"); // 'recent' | 'alpha'
+  const [sort, setSort] = useState("recent"); // 'recent' | 'alpha' | 'year'
 
-  // Fetch & filter base on term/genre/year (from your existing hook)
-  const { albums, isLoading, error } = useFilteredCollection({ term, genre, year });
-
-  // Apply label filter and sort
-  const filtered = useMemo(() => {
-    let arr = albums;
-    if (label) {
-      const needle = label.toLowerCase();
-      arr = arr.filter(a => (a.label || "").toLowerCase().includes(needle));
-    }
-    if (sort === "alpha") {
-      return [...arr].sort((a, b) =>
-        (a.artist || "").localeCompare(b.artist || "") || (a.title || "").localeCompare(b.title || "")
-      );
-    }
-    // recent (date_added desc)
-    return [...arr].sort((a, b) => (b.date_added || "").localeCompare(a.date_added || ""));
-  }, [albums, label, sort]);
+  // Searched, filtered, sorted and paged by the backend (/api/collection/search)
+  const { albums, total, hasMore, loadMore, isLoading, error } =
+    useFilteredCollection({ term, genre, label, year, sort });
 
   // Pull default filters from querystring (e.g. /list?genre=Punk)
   const q = useQuery();
@@ -46,9 +31,21 @@ export default function Root() {
     const y = q.get("year");  if (y) setYear(y);
   }, [q]);
 
-  // Build filter options from data
-  const genres = useMemo(() => [...new Set(albums.map(a => a.genre).filter(Boolean))].sort(), [albums]);
-  const labels = useMemo(() => [...new Set(albums.map(a => a.label).filter(Boolean))].sort(), [albums]);
+  // Filter options from the precomputed histograms, not from the loaded pages
+  const [options, setOptions] = useState({ genres: [], labels: [] });
+  React.useEffect(() => {
+    let ignore = false;
+    fetch("/api/stats")
+      .then(res => (res.ok ? res.json() : null))
+      .then(data => {
+        if (ignore || !data) return;
+        const known = (counts) => Object.keys(counts || {}).filter((k) => k !== "Unknown").sort();
+        setOptions({ genres: known(data.genre), labels: known(data.label) });
+      })
+      .catch(err => console.error("Error fetching filter options:", err));
+    return () => { ignore = true; };
+  }, []);
+  const { genres, labels } = options;
 
   return (
     <BrowserRouter>
@@ -59,7 +56,7 @@ export default function Root() {
           <Link to="/report">Report</Link>
         </nav>
         <span style={{ opacity: 0.7, marginLeft: 8 }}>
-          {isLoading ? "Loading…" : `Total: ${albums.length}`}
+          {isLoading ? "Loading…" : `Total: ${total}`}
         </span>
         {error && <span style={{ color: "crimson", marginLeft: 8 }}>Failed to load collection</span>}
 
@@ -81,16 +78,22 @@ export default function Root() {
         <select value={sort} onChange={(e) => setSort(e.target.value)} style={{ padding: 6 }}>
           <option value="recent">Recent</option>
           <option value="alpha">Alphabetical</option>
+          <option value="year">Year</option>
         </select>
       </header>
 
       {!isLoading && (
         <Routes>
-          <Route path="/" element={<GalleryView items={filtered} />} />
-          <Route path="/list" element={<ListView items={filtered} />} />
+          <Route path="/" element={<GalleryView items={albums} />} />
+          <Route path="/list" element={<ListView items={albums} />} />
           <Route path="/report" element={<ReportView />} />
         </Routes>
       )}
+      {!isLoading && hasMore && (
+        <div style={{ padding: 12, textAlign: "center" }}>
+          <button type="button" onClick={loadMore}>Load more ({albums.length} of {total})</button>
+        </div>
+      )}
     </BrowserRouter>
   );
 }
@@ -3,11 +3,13 @@ import React, { useEffect, useMemo, useState, useCallback } from "react";
 import Slider from "react-slick";
 import "slick-carousel/slick/slick.css";
 import "slick-carousel/slick/slick-theme.css";
+import { clearPlaceholder, coverAspectRatio, coverPlaceholderStyle } from "./coverPlaceholder.js";
 
 function resolveImg(album) {
   if (!album) return "/static/fallback.jpg";
+  // Card-sized variant from the self-healing endpoint, not the full-res original
+  if (album.id) return `/cover/${album.id}?w=512`;
   if (album.cover_image) return album.cover_image;
-  if (album.id) return `/cover/${album.id}`; // self-healing endpoint
   return "/static/fallback.jpg";
 }
 
@@ -39,8 +41,18 @@ function RecordCard({ album, onOpen, dragging }) {
         <img
           src={src}
           alt={`${title} cover`}
+          width={album?.cover_meta?.width}
+          height={album?.cover_meta?.height}
+          onLoad={clearPlaceholder}
           onError={(e) => { e.currentTarget.src = "/static/fallback.jpg"; }}
-          style={{ width: "100%", aspectRatio: "1/1", objectFit: "cover", borderRadius: 8 }}
+          style={{
+            width: "100%",
+            height: "auto",
+            aspectRatio: coverAspectRatio(album),
+            objectFit: "cover",
+            borderRadius: 8,
+            ...coverPlaceholderStyle(album),
+          }}
           loading="lazy"
         />
         <figcaption style={{ marginTop: 8 }}>
@@ -1,10 +1,12 @@
 // frontend/src/views/ListView.js
 import React, { useCallback, useMemo, useState } from "react";
+import { clearPlaceholder, coverPlaceholderStyle } from "./coverPlaceholder.js";
 
 function resolveImg(album) {
   if (!album) return "/static/fallback.jpg";
+  // 64px tiles: ask for the server-side thumbnail (also auto-downloads on first view)
+  if (album.id) return `/cover/${album.id}/thumb`;
   if (album.cover_image) return album.cover_image;
-  if (album.id) return `/cover/${album.id}`; // trigger auto-download on first view
   return "/static/fallback.jpg";
 }
 
@@ -59,8 +61,10 @@ function ListRow({ album, onOpen }) {
           height: 64,
           objectFit: "cover",
           borderRadius: 6,
-          background: "#f0f0f0",
+          backgroundColor: "#f0f0f0",
+          ...coverPlaceholderStyle(album),
         }}
+        onLoad={clearPlaceholder}
         loading="lazy"
       />
 
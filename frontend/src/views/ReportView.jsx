@@ -6,80 +6,50 @@ import {
 } from "recharts";
 
 export default function ReportView() {
-  const [albums, setAlbums] = useState([]);
+  const [stats, setStats] = useState(null);
+  const [options, setOptions] = useState({ genres: [], labels: [] });
   const [isDark, setIsDark] = useState(true);
   const [genreFilter, setGenreFilter] = useState("");
   const [labelFilter, setLabelFilter] = useState("");
 
+  // Histograms are precomputed server-side (/api/stats), so the payload stays
+  // small whatever the collection size; filters are applied by the backend.
   useEffect(() => {
     let ignore = false;
-    fetch("/api/collection")
+    const params = new URLSearchParams();
+    if (genreFilter) params.set("genre", genreFilter);
+    if (labelFilter) params.set("label", labelFilter);
+    fetch(`/api/stats?${params}`)
       .then(res => {
-        if (!res.ok) { 
+        if (!res.ok) {
           // If HTTP error, throw to trigger catch
-          throw new Error(`HTTP ${res.status} ${res.statusText}`);  /* ⚠️ */
+          throw new Error(`HTTP ${res.status} ${res.statusText}`);
         }
         return res.json();
       })
       .then(data => {
         if (ignore) return;
-        // Normalize data to an array
-        let records = [];
-        if (Array.isArray(data)) {
-          records = data;
-        } else if (data && typeof data === "object") {
-          if (Array.isArray(data.records)) records = data.records;
-          else if (Array.isArray(data.collection)) records = data.collection;
-          else if (Array.isArray(data.items)) records = data.items;
+        setStats(data);
+        // Unfiltered stats double as the filter option lists
+        if (!genreFilter && !labelFilter) {
+          const known = (counts) => Object.keys(counts || {}).filter((k) => k !== "Unknown").sort();
+          setOptions({ genres: known(data.genre), labels: known(data.label) });
         }
-        if (!Array.isArray(records)) {
-          console.warn("Unexpected API payload in ReportView:", data);  /* ⚠️ */
-          records = [];
-        }
-        setAlbums(records);
       })
       .catch(err => {
-        console.error("Error fetching collection in ReportView:", err);  /* ⚠️ */
-        setAlbums([]);  // Set empty array on error to avoid crash        /* ⚠️ */
+        console.error("Error fetching stats in ReportView:", err);
+        setStats(null);
       });
     return () => { ignore = true; };
-  }, []);
-
-  // Apply genre and label filters to the album list
-  const filteredAlbums = albums.filter((album) => {
-    const genreMatch = genreFilter === "" || album.genre === genreFilter;
-    const labelMatch = labelFilter === "" || album.label === labelFilter;
-    return genreMatch && labelMatch;
-  });
+  }, [genreFilter, labelFilter]);
 
-  // Compute counts grouped by genre and decade
-  const genreCounts = filteredAlbums.reduce((acc, album) => {
-    acc[album.genre] = (acc[album.genre] || 0) + 1;
-    return acc;
-  }, {});
-  const decadeCounts = filteredAlbums.reduce((acc, album) => {
-    const decade = album.year ? `${Math.floor(album.year / 10) * 10}s` : "Unknown";
-    acc[decade] = (acc[decade] || 0) + 1;
-    return acc;
-  }, {});
+  const genreCounts = stats?.genre || {};
+  const decadeCounts = stats?.decade || {};
 
-  // Build a time series of album additions for the growth chart
-  const growthData = filteredAlbums.reduce((acc, album) => {
-    const date = album.date_added?.slice(0, 10);
-    if (date) {
-      const existing = acc.find((d) => d.date === date);
-      if (!existing) {
-        acc.push({ date, count: 1 });
-      } else {
-        existing.count++;
-      }
-    }
-    // Sort chronologically so the line chart is ordered correctly
-    return acc.sort((a, b) => new Date(a.date) - new Date(b.date));
-  }, []);
+  // Time series of album additions for the growth chart (already sorted by date)
+  const growthData = Object.entries(stats?.date_added || {}).map(([date, count]) => ({ date, count }));
 
-  const genres = [...new Set(albums.map((a) => a.genre).filter(Boolean))];
-  const labels = [...new Set(albums.map((a) => a.label).filter(Boolean))];
+  const { genres, labels } = options;
 
   return (
     <div className={`min-h-screen p-4 ${isDark ? "bg-gray-900 text-white" : "bg-gray-100 text-black"}`}>
@@ -0,0 +1,24 @@
+// Paint-before-load styles from the importer's cover_meta (see
+// backend/image_metadata.py): the box gets the cover's aspect ratio and its
+// dominant color / tiny blurred preview until the real image arrives.
+export function coverAspectRatio(album, fallback = "1 / 1") {
+  const meta = album?.cover_meta;
+  return meta?.width && meta?.height ? `${meta.width} / ${meta.height}` : fallback;
+}
+
+export function coverPlaceholderStyle(album) {
+  const meta = album?.cover_meta;
+  if (!meta) return {};
+  return {
+    backgroundColor: meta.color,
+    backgroundImage: meta.placeholder ? `url("${meta.placeholder}")` : undefined,
+    backgroundSize: "cover",
+    backgroundPosition: "center",
+  };
+}
+
+// onLoad handler: drop the placeholder so it never shows through transparent pixels
+export function clearPlaceholder(e) {
+  e.currentTarget.style.backgroundImage = "none";
+  e.currentTarget.style.backgroundColor = "transparent";
+}